@@ -1,25 +1,29 @@
+import asyncio
 import hashlib
 import json
 import time
-from collections import defaultdict
+from contextlib import nullcontext
 from copy import deepcopy
 from decimal import Decimal
-from typing import Any, Optional
+from typing import Any, Callable, ContextManager, Optional
 from unittest.mock import MagicMock
 from urllib.parse import parse_qs, urlsplit, urljoin
 from uuid import uuid4
 
 import arrow
+import httpx
 import requests
 import sentry_sdk
 from blinker import signal
 from requests import HTTPError, Response
 from requests.exceptions import ConnectionError, RetryError
 from soteria.configuration import Configuration
-from user_auth_token import UserTokenStore
 
 import settings
 from app.agents.schemas import Balance, Transaction
+from app.async_http import AsyncRetryError, get_async_client, request_with_retries
+from app.circuit_breaker import get_circuit_breaker
+from app.config_cache import config_cache
 from app.encryption import hash_ids
 from app.exceptions import (
     AccountAlreadyExistsError,
@@ -37,6 +41,8 @@ from app.exceptions import (
     UnknownError,
 )
 from app.mocks.users import USER_STORE
+from app.oauth_token_cache import StoredToken, oauth_token_cache
+from app.redis_pool import get_user_token_store
 from app.reporting import get_logger
 from app.requests_retry import requests_retry_session
 from app.scheme_account import TWO_PLACES, JourneyTypes
@@ -44,6 +50,8 @@ from app.tasks.resend_consents import send_consent_status
 
 log = get_logger("agent-base")
 
+TokenRequest = tuple[str, Any, dict[str, str]]  # (url, payload, headers) of an OAuth token request
+
 
 JOURNEY_TYPE_TO_HANDLER_TYPE_MAPPING = {
     JourneyTypes.JOIN: Configuration.JOIN_HANDLER,
@@ -61,6 +69,8 @@ class BaseAgent(object):
     identifier: Optional[dict[str, str]] = None
     expecting_callback = False
     is_async = False
+    # agents that implement the *_async methods without blocking the event loop, see get_balances_and_publish
+    supports_async = False
     create_journey: Optional[str] = None
 
     def __init__(
@@ -71,14 +81,7 @@ class BaseAgent(object):
         scheme_slug: str,
         config: Configuration | None = None,
     ):
-        self.config = config or Configuration(
-            scheme_slug,
-            config_handler_type,
-            settings.VAULT_URL,
-            settings.VAULT_TOKEN,
-            settings.CONFIG_SERVICE_URL,
-            settings.AZURE_AAD_TENANT_ID,
-        )
+        self.config = config or config_cache.get(scheme_slug, config_handler_type, Configuration)
         self.audit_handler_type = JOURNEY_TYPE_TO_HANDLER_TYPE_MAPPING[user_info["journey_type"]]
         self.retry_count = retry_count
         self.user_info = user_info
@@ -91,15 +94,19 @@ class BaseAgent(object):
         self.record_uid = hash_ids.encode(self.scheme_id)
         self.message_uid = str(uuid4())
         self.max_retries = 3
-        self.token_store = UserTokenStore(settings.REDIS_URL)
+        self.token_store = get_user_token_store()
         self.oauth_token_timeout: int = 0
 
-        self.session = requests_retry_session(retries=self.max_retries)
+        self.session = requests_retry_session(retries=self.max_retries, pool_key=self.scheme_slug)
         self.headers: dict[str, str] = {}
         self.errors: dict[type[BaseError], list[int]] = {}
         self.integration_service = ""
         self.outbound_auth_service: int = Configuration.OAUTH_SECURITY
         self.audit_config: dict[str, Any] = {}
+        # the start of the window of transactions that may not have been published for the account, set before
+        # transactions() is called on a balance refresh. Agents whose API can filter transactions by date may fetch
+        # only those on or after it, see app.transaction_watermarks.
+        self.transactions_since: Optional[arrow.Arrow] = None
 
         if settings.SENTRY_DSN:
             sentry_sdk.set_tag("scheme_slug", self.scheme_slug)
@@ -164,31 +171,75 @@ class BaseAgent(object):
     def get_auth_url_and_payload(self):
         raise NotImplementedError()
 
+    def get_auth_headers(self) -> dict[str, str]:
+        """Headers for the token request, which leave out the Authorization header holding the old token."""
+        return {key: value for key, value in self.headers.items() if key != "Authorization"}
+
     def _oauth_authentication(self):
-        have_valid_token = False
+        """
+        OAuth tokens are fetched with the merchant's credentials rather than the user's, so one token is shared by
+        every account, thread and process for the merchant, see app.oauth_token_cache.
+        """
+        token = oauth_token_cache.get(
+            self.scheme_slug,
+            timeout=self.oauth_token_timeout,
+            load=self._load_stored_token,
+            refresh=self._token_refresher(),
+        )
+        self.headers["Authorization"] = f"Bearer {token}"
+
+    def _token_refresher(self) -> Callable[[], StoredToken]:
+        """
+        The cache may refresh the token on a background thread while this agent carries on, so the token request is
+        built now and sent with its own session rather than reading or changing the agent's headers and session.
+        """
+        url, payload = self.get_auth_url_and_payload()
+        token_request = (url, payload, self.get_auth_headers())
+
+        def refresh() -> StoredToken:
+            session = requests_retry_session(retries=self.max_retries, pool_key=self.scheme_slug)
+            return self._refresh_and_store_token(token_request, session)
+
+        return refresh
+
+    def _load_stored_token(self) -> Optional[StoredToken]:
         current_timestamp = arrow.utcnow().int_timestamp
-        token = ""
         try:
-            cached_token = json.loads(self.token_store.get(self.scheme_id))
+            cached_token = json.loads(self.token_store.get(self.scheme_slug))
             try:
                 if self._token_is_valid(cached_token, current_timestamp):
-                    have_valid_token = True
-                    token = cached_token[f"{self.scheme_slug.replace('-', '_')}_access_token"]
+                    timestamp = cached_token["timestamp"]
+                    return StoredToken(
+                        token=cached_token[f"{self.scheme_slug.replace('-', '_')}_access_token"],
+                        timestamp=timestamp[0] if isinstance(timestamp, list) else timestamp,
+                    )
             except (KeyError, TypeError) as e:
                 log.exception(e)
         except (KeyError, self.token_store.NoSuchToken):
             pass
+        return None
 
-        if not have_valid_token:
-            token = self._refresh_token()
-            self._store_token(token, current_timestamp)
-
-        self.headers["Authorization"] = f"Bearer {token}"
+    def _refresh_and_store_token(
+        self, token_request: Optional[TokenRequest] = None, session: Optional[requests.Session] = None
+    ) -> StoredToken:
+        current_timestamp = arrow.utcnow().int_timestamp
+        token = self._refresh_token(token_request, session)
+        self._store_token(token, current_timestamp)
+        return StoredToken(token=token, timestamp=current_timestamp)
 
-    def _refresh_token(self) -> str:
-        url, payload = self.get_auth_url_and_payload()
+    def _refresh_token(
+        self, token_request: Optional[TokenRequest] = None, session: Optional[requests.Session] = None
+    ) -> str:
+        """
+        :param token_request: the url, payload and headers of the token request, built from the agent if not given
+        :param session: sends the token request, the agent's session if not given
+        """
+        if token_request is None:
+            url, payload = self.get_auth_url_and_payload()
+            token_request = (url, payload, self.get_auth_headers())
+        url, payload, headers = token_request
         try:
-            response = self.session.post(url, data=payload, headers=self.headers)
+            response = (session or self.session).post(url, data=payload, headers=headers)
         except requests.RequestException as e:
             sentry_sdk.capture_message(f"Failed request to get oauth token from {url}. exception: {e}")
             raise ServiceConnectionError(exception=e) from e
@@ -202,7 +253,7 @@ class BaseAgent(object):
             f"{self.scheme_slug.replace('-', '_')}_access_token": token,
             "timestamp": current_timestamp,
         }
-        self.token_store.set(scheme_account_id=self.scheme_id, token=json.dumps(token_dict))
+        self.token_store.set(scheme_account_id=self.scheme_slug, token=json.dumps(token_dict))
 
     def _token_is_valid(self, token: dict, current_timestamp: int) -> bool:
         if isinstance(token["timestamp"], list):
@@ -234,39 +285,99 @@ class BaseAgent(object):
         if self.journey_type is JourneyTypes.UPDATE:
             audit = False
 
-        try:
-            if audit:
-                audit_payload = self.get_audit_payload(kwargs, url)
-                self.send_audit_request(audit_payload, url)
+        with self._circuit_breaker_guard():
+            try:
+                if audit:
+                    audit_payload = self.get_audit_payload(kwargs, url)
+                    self.send_audit_request(audit_payload, url)
+
+                resp = self.session.request(method, url=url, **args)
+
+                if audit:
+                    self.send_audit_response(resp)
+
+            except RetryError as e:
+                signal("request-fail").send(
+                    self, slug=self.scheme_slug, channel=self.channel, error=RetryLimitReachedError
+                )
+                raise RetryLimitReachedError(exception=e) from e
+
+            except ConnectionError as e:
+                signal("request-fail").send(self, slug=self.scheme_slug, channel=self.channel, error=EndSiteDownError)
+                raise EndSiteDownError(exception=e) from e
+
+            self._record_http_request(resp, path, unique_data, latency=resp.elapsed.total_seconds())
+            resp = self.check_response_for_errors(resp)
+        return resp
+
+    async def make_request_async(self, url, unique_data=None, method="get", timeout=5, audit=False, **kwargs):
+        """The asyncio counterpart of make_request, sent over the scheme's pooled httpx client."""
+        path = urlsplit(url).path
+        args = {
+            "headers": self.headers,
+            "timeout": timeout,
+        }
+        args.update(kwargs)
 
-            resp = self.session.request(method, url=url, **args)
+        # Prevent audit logging when agent login method is called for update
+        if self.journey_type is JourneyTypes.UPDATE:
+            audit = False
 
-            if audit:
-                self.send_audit_response(resp)
+        with self._circuit_breaker_guard():
+            try:
+                if audit:
+                    audit_payload = self.get_audit_payload(kwargs, url)
+                    await self._send_audit_async(self.send_audit_request, audit_payload, url)
 
-        except RetryError as e:
-            signal("request-fail").send(self, slug=self.scheme_slug, channel=self.channel, error=RetryLimitReachedError)
-            raise RetryLimitReachedError(exception=e) from e
+                client = get_async_client(self.scheme_slug)
+                started_at = time.perf_counter()
+                resp = await request_with_retries(client, method, url, retries=self.max_retries, **args)
+                latency = time.perf_counter() - started_at
 
-        except ConnectionError as e:
-            signal("request-fail").send(self, slug=self.scheme_slug, channel=self.channel, error=EndSiteDownError)
-            raise EndSiteDownError(exception=e) from e
+                if audit:
+                    await self._send_audit_async(self.send_audit_response, resp)
+
+            except AsyncRetryError as e:
+                signal("request-fail").send(
+                    self, slug=self.scheme_slug, channel=self.channel, error=RetryLimitReachedError
+                )
+                raise RetryLimitReachedError(exception=e) from e
+
+            except httpx.TransportError as e:
+                signal("request-fail").send(self, slug=self.scheme_slug, channel=self.channel, error=EndSiteDownError)
+                raise EndSiteDownError(exception=e) from e
+
+            self._record_http_request(resp, path, unique_data, latency=latency)
+            resp = self.check_response_for_errors(resp)
+        return resp
 
+    @staticmethod
+    async def _send_audit_async(send: Callable[..., None], *args) -> None:
+        """Without AUDIT_EXPORT_ASYNC the audit log is posted to Atlas as it is sent, so send it from a thread."""
+        if settings.AUDIT_EXPORT_ASYNC:
+            send(*args)
+        else:
+            await asyncio.to_thread(send, *args)
+
+    def _circuit_breaker_guard(self) -> ContextManager[None]:
+        """Fails fast with NotSentError while the merchant is unhealthy, see app.circuit_breaker."""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return nullcontext()
+        return get_circuit_breaker(self.scheme_slug).guard(channel=self.channel)
+
+    def _record_http_request(self, resp, path, unique_data, latency: float) -> None:
         signal("record-http-request").send(
             self,
             slug=self.scheme_slug,
             endpoint=self._remove_unique_data_in_path(path, unique_data) if unique_data else path,
-            latency=resp.elapsed.total_seconds(),
+            latency=latency,
             response_code=resp.status_code,
         )
 
-        resp = self.check_response_for_errors(resp)
-        return resp
-
     def check_response_for_errors(self, resp):
         try:
             resp.raise_for_status()
-        except HTTPError as e:
+        except (HTTPError, httpx.HTTPStatusError) as e:
             if e.response.status_code == 401:
                 signal("request-fail").send(
                     self,
@@ -296,6 +407,9 @@ class BaseAgent(object):
         for agent_error, agent_error_codes in self.errors.items():
             if error_code in agent_error_codes:
                 raise agent_error
+        if error_code == NotSentError.code:
+            # the request never reached the merchant, e.g. its circuit is open, so keep the error retryable
+            raise NotSentError
         raise unhandled_exception
 
     def update_hermes_credentials(self) -> None:
@@ -335,27 +449,26 @@ class BaseAgent(object):
         raise NotImplementedError()
 
     def hash_transactions(self, transactions: list[Transaction]) -> list[Transaction]:
-        count: defaultdict[str, int] = defaultdict(int)
+        # Hades deduplicates transactions by these hashes, so the key must stay exactly as it is built here
+        count: dict[str, int] = {}
+        scheme_id = self.scheme_id
+        md5 = hashlib.md5
 
         hashed_transactions: list[Transaction] = []
+        append = hashed_transactions.append
 
         for transaction in transactions:
-            s = "{0}{1}{2}{3}{4}".format(
-                transaction.date,
-                transaction.description,
-                transaction.points,
-                self.scheme_id,
-                transaction.location if transaction.location is not None else "",
+            location = transaction.location
+            key = (
+                f"{transaction.date}{transaction.description}{transaction.points}{scheme_id}"
+                f"{location if location is not None else ''}"
             )
 
             # identical hashes get sequentially indexed to make them unique.
-            index = count[s]
-            count[s] += 1
-            s = "{0}{1}".format(s, index)
+            index = count.get(key, 0)
+            count[key] = index + 1
 
-            data = transaction._asdict()
-            data["hash"] = hashlib.md5(s.encode("utf-8")).hexdigest()
-            hashed_transactions.append(Transaction(**data))
+            append(transaction._replace(hash=md5(f"{key}{index}".encode("utf-8")).hexdigest()))
 
         return hashed_transactions
 
@@ -392,6 +505,25 @@ class BaseAgent(object):
         except KeyError as e:
             raise Exception(f"missing the credential '{e.args[0]}'")
 
+    async def attempt_login_async(self):
+        if self.retry_limit and self.retry_count >= self.retry_limit:
+            raise RetryLimitReachedError()
+
+        try:
+            await self.login_async()
+        except KeyError as e:
+            raise Exception(f"missing the credential '{e.args[0]}'")
+
+    async def login_async(self) -> None:
+        """Agents migrated to the async engine override this, for the rest login runs on a worker thread."""
+        await asyncio.to_thread(self.login)
+
+    async def balance_async(self) -> Optional[Balance]:
+        return await asyncio.to_thread(self.balance)
+
+    async def transactions_async(self) -> list[Transaction]:
+        return await asyncio.to_thread(self.transactions)
+
     def attempt_join(self):
         try:
             self.join()
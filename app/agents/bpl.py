@@ -10,6 +10,7 @@ import settings
 from app import db, publish
 from app.agents.base import BaseAgent
 from app.agents.schemas import Balance, Transaction, Voucher
+from app.async_http import get_async_client
 from app.encryption import hash_ids
 from app.exceptions import (
     AccountAlreadyExistsError,
@@ -28,6 +29,8 @@ log = get_logger("bpl-agent")
 
 
 class Bpl(BaseAgent):
+    supports_async = True
+
     def __init__(self, retry_count, user_info, scheme_slug=None):
         super().__init__(retry_count, user_info, Configuration.JOIN_HANDLER, scheme_slug=scheme_slug)
         self.source_id = "bpl"
@@ -75,10 +78,38 @@ class Bpl(BaseAgent):
             session.commit()
 
     def login(self):
+        if not (login_request := self._prepare_login()):
+            return
+        url, payload = login_request
+
+        try:
+            resp = self.make_request(url, method="post", audit=True, json=payload)
+        except BaseError as ex:
+            error_code = ex.exception.response.json()["code"] if ex.exception.response is not None else ex.code
+            self.handle_error_codes(error_code, unhandled_exception=GeneralError)
+
+        self._update_merchant_identifier(resp.json())
+
+    async def login_async(self):
+        if not (login_request := self._prepare_login()):
+            return
+        url, payload = login_request
+
+        try:
+            resp = await self.make_request_async(url, method="post", audit=True, json=payload)
+        except BaseError as ex:
+            # httpx transport errors have no response: BPL was never reached, so keep e.g. EndSiteDownError
+            if getattr(ex.exception, "response", None) is None:
+                raise
+            self.handle_error_codes(ex.exception.response.json()["code"], unhandled_exception=GeneralError)
+
+        self._update_merchant_identifier(resp.json())
+
+    def _prepare_login(self) -> Optional[tuple[str, dict]]:
         self.integration_service = "SYNC"
         # If merchant_identifier already exists do not get by credentials
         if "merchant_identifier" in self.credentials.keys():
-            return
+            return None
         # Channel not available for ADD journey.
         self.headers["bpl-user-channel"] = "com.bink.wallet"
         url = f"{self.base_url}getbycredentials"
@@ -86,14 +117,9 @@ class Bpl(BaseAgent):
             "email": self.credentials["email"],
             "account_number": self.credentials["card_number"],
         }
+        return url, payload
 
-        try:
-            resp = self.make_request(url, method="post", audit=True, json=payload)
-        except BaseError as ex:
-            error_code = ex.exception.response.json()["code"] if ex.exception.response is not None else ex.code
-            self.handle_error_codes(error_code, unhandled_exception=GeneralError)
-
-        membership_data = resp.json()
+    def _update_merchant_identifier(self, membership_data: dict) -> None:
         self.credentials["merchant_identifier"] = membership_data["UUID"]
         self.identifier = {"merchant_identifier": membership_data["UUID"]}
         self.credentials.update(self.identifier)
@@ -128,14 +154,33 @@ class Bpl(BaseAgent):
         ]
 
     def balance(self) -> Optional[Balance]:
-        merchant_id = self.credentials["merchant_identifier"]
-        self.headers["bpl-user-channel"] = "com.bink.wallet"
-        url = f"{self.base_url}{merchant_id}"
-        params = {"tx_qty": self.transaction_history_quantity}
+        url, merchant_id, params = self._prepare_balance_request()
         resp = self.make_request(url, unique_data=merchant_id, method="get", params=params)
         bpl_data = resp.json()
         scheme_account_id = self.user_info["scheme_account_id"]
         self.update_hermes_credentials(bpl_data, scheme_account_id)
+        return self._parse_balance(bpl_data)
+
+    async def balance_async(self) -> Optional[Balance]:
+        url, merchant_id, params = self._prepare_balance_request()
+        resp = await self.make_request_async(url, unique_data=merchant_id, method="get", params=params)
+        bpl_data = resp.json()
+        scheme_account_id = self.user_info["scheme_account_id"]
+        await self.update_hermes_credentials_async(bpl_data, scheme_account_id)
+        return self._parse_balance(bpl_data)
+
+    async def transactions_async(self) -> list[Transaction]:
+        # transactions come with the balance, so there is nothing to wait for
+        return self.transactions()
+
+    def _prepare_balance_request(self) -> tuple[str, str, dict]:
+        merchant_id = self.credentials["merchant_identifier"]
+        self.headers["bpl-user-channel"] = "com.bink.wallet"
+        url = f"{self.base_url}{merchant_id}"
+        params = {"tx_qty": self.transaction_history_quantity}
+        return url, merchant_id, params
+
+    def _parse_balance(self, bpl_data: dict) -> Optional[Balance]:
         vouchers = bpl_data["rewards"]
         pending_vouchers = bpl_data["pending_rewards"]
         if len(bpl_data["current_balances"]) == 0:
@@ -188,6 +233,14 @@ class Bpl(BaseAgent):
         publish.status(scheme_account_id, status, uuid4(), self.user_info, journey="join")
 
     def update_hermes_credentials(self, customer_details, scheme_account_id):
+        api_url, args = self._hermes_credentials_request(customer_details, scheme_account_id)
+        self.session.request(method="put", url=api_url, **args)
+
+    async def update_hermes_credentials_async(self, customer_details, scheme_account_id):
+        api_url, args = self._hermes_credentials_request(customer_details, scheme_account_id)
+        await get_async_client("hermes").request(method="put", url=api_url, **args)
+
+    def _hermes_credentials_request(self, customer_details, scheme_account_id) -> tuple[str, dict]:
         self.identifier = {
             "card_number": customer_details["account_number"],
             "merchant_identifier": customer_details["UUID"],
@@ -209,4 +262,4 @@ class Bpl(BaseAgent):
             "timeout": 10,
             "json": self.identifier,
         }
-        self.session.request(method="put", url=api_url, **args)
+        return api_url, args
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from decimal import Decimal
 from typing import Optional
@@ -35,6 +36,8 @@ log = get_logger("iceland")
 
 
 class Iceland(BaseAgent):
+    supports_async = True
+
     def __init__(self, retry_count, user_info, scheme_slug=None, config=None):
         super().__init__(
             retry_count,
@@ -208,7 +211,28 @@ class Iceland(BaseAgent):
             signal("log-in-fail").send(self, slug=self.scheme_slug)
             raise
 
+    async def _login_async(self, payload: dict):
+        try:
+            response = await self.make_request_async(
+                url=self.config.merchant_url, method="post", audit=True, json=payload
+            )
+            return response.json()
+        except BaseError:
+            signal("log-in-fail").send(self, slug=self.scheme_slug)
+            raise
+
     def login(self) -> None:
+        payload = self._prepare_login()
+        response_json = self._login(payload)
+        self._process_login_response(response_json)
+
+    async def login_async(self) -> None:
+        # the oauth token is usually cached, fetching or refreshing it stays on the sync path
+        payload = await asyncio.to_thread(self._prepare_login)
+        response_json = await self._login_async(payload)
+        self._process_login_response(response_json)
+
+    def _prepare_login(self) -> dict:
         self.integration_service = "SYNC"
 
         check_correct_authentication(
@@ -217,7 +241,7 @@ class Iceland(BaseAgent):
         )
         self.authenticate()
 
-        payload = {
+        return {
             "card_number": self.credentials["card_number"],
             "last_name": self.credentials["last_name"],
             "postcode": self.credentials["postcode"],
@@ -228,8 +252,7 @@ class Iceland(BaseAgent):
             "merchant_scheme_id2": self.credentials.get("merchant_identifier"),
         }
 
-        response_json = self._login(payload)
-
+    def _process_login_response(self, response_json: dict) -> None:
         error = response_json.get("error_codes")
         if error:
             signal("log-in-fail").send(self, slug=self.scheme_slug)
@@ -256,6 +279,10 @@ class Iceland(BaseAgent):
             value_label="£{}".format(amount),
         )
 
+    async def balance_async(self) -> Optional[Balance]:
+        # the balance comes with the login response
+        return self.balance()
+
     def transactions(self) -> list[Transaction]:
         if self._transactions is None:
             return []
@@ -264,6 +291,9 @@ class Iceland(BaseAgent):
         except Exception:
             return []
 
+    async def transactions_async(self) -> list[Transaction]:
+        return self.transactions()
+
     def transaction_history(self) -> list[Transaction]:
         return [self.parse_transaction(tx) for tx in self._transactions]
 
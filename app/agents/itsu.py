@@ -11,6 +11,7 @@ import settings
 from app import db
 from app.agents.acteol import Acteol
 from app.agents.schemas import Balance, Transaction
+from app.config_cache import config_cache
 from app.exceptions import AccountAlreadyExistsError, BaseError, CardNumberError, JoinError
 from app.journeys.view import JourneyTypes
 from app.models import RetryTaskStatuses
@@ -282,14 +283,7 @@ class Itsu(Acteol):
 
         :return: url of pepper service
         """
-        config = Configuration(
-            "itsu-pepper",
-            Configuration.JOIN_HANDLER,
-            settings.VAULT_URL,
-            settings.VAULT_TOKEN,
-            settings.CONFIG_SERVICE_URL,
-            settings.AZURE_AAD_TENANT_ID,
-        )
+        config = config_cache.get("itsu-pepper", Configuration.JOIN_HANDLER, Configuration)
         # The join task instantiates the class with Acteol config; in case we need them, will not overwrite with pepper
         pepper_base_url = config.merchant_url
         pepper_outbound_security_credentials = config.security_credentials["outbound"]["credentials"][0]["value"]
@@ -31,7 +31,6 @@ class Stonegate(Acteol):
 
     def get_auth_url_and_payload(self):
         url = urljoin(self.base_url, "token")
-        self.headers = {"Content-Type": "application/x-www-form-urlencoded"}
         payload = {
             "grant_type": "password",
             "username": self.outbound_security_credentials["username"],
@@ -40,6 +39,9 @@ class Stonegate(Acteol):
         payload = urlencode(payload)
         return url, payload
 
+    def get_auth_headers(self):
+        return {"Content-Type": "application/x-www-form-urlencoded"}
+
     def authenticate(self):
         if self.outbound_auth_service == Configuration.OPEN_AUTH_SECURITY:
             return
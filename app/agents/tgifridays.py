@@ -2,16 +2,15 @@ import hashlib
 import hmac
 import json
 from decimal import Decimal
-from functools import cache
 from typing import Optional
 from urllib.parse import urljoin
 
 from blinker import signal
 from soteria.configuration import Configuration
 
-import settings
 from app.agents.base import BaseAgent
 from app.agents.schemas import Balance, Transaction
+from app.config_cache import config_cache
 from app.encryption import hash_ids
 from app.exceptions import AccountAlreadyExistsError, BaseError, NoSuchRecordError, StatusLoginFailedError, UnknownError
 from app.reporting import get_logger
@@ -71,17 +70,9 @@ class TGIFridays(BaseAgent):
             }
         )
 
-    @cache
     def dashboard_url(self):
         # The dashboard url is used for balance requests
-        config = Configuration(
-            "tgi-fridays-dashboard",
-            Configuration.JOIN_HANDLER,
-            settings.VAULT_URL,
-            settings.VAULT_TOKEN,
-            settings.CONFIG_SERVICE_URL,
-            settings.AZURE_AAD_TENANT_ID,
-        )
+        config = config_cache.get("tgi-fridays-dashboard", Configuration.JOIN_HANDLER, Configuration)
         # The join task instantiates the class with Acteol config; in case we need them, will not overwrite with pepper
         return config.merchant_url
 
@@ -9,9 +9,9 @@ from blinker import signal
 from requests import Response
 from soteria.configuration import Configuration
 
-import settings
 from app.agents.base import BaseAgent
 from app.agents.schemas import Balance, Transaction
+from app.config_cache import config_cache
 from app.exceptions import (
     AccountAlreadyExistsError,
     BaseError,
@@ -85,15 +85,7 @@ class TheWorks(BaseAgent):
         return resp
 
     def _get_failover_config(self):
-        failover_config = Configuration(
-            "the-works-failover",
-            Configuration.JOIN_HANDLER,
-            settings.VAULT_URL,
-            settings.VAULT_TOKEN,
-            settings.CONFIG_SERVICE_URL,
-            settings.AZURE_AAD_TENANT_ID,
-        )
-        return failover_config
+        return config_cache.get("the-works-failover", Configuration.JOIN_HANDLER, Configuration)
 
     def _parse_join_response(self, resp: Response):
         result, account_status = self.give_x_response(resp)
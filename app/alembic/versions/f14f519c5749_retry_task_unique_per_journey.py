@@ -0,0 +1,27 @@
+"""retry_task_unique_per_journey
+
+Revision ID: f14f519c5749
+Revises: ded63e9bc485
+Create Date: 2026-10-18 10:12:41.318204+00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f14f519c5749"
+down_revision = "ded63e9bc485"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a scheme account can have a join and a login retry task at the same time, and tasks are looked up by both
+    op.create_unique_constraint(
+        "retry_task_scheme_account_journey_key", "retry_task", ["scheme_account_id", "journey_type"]
+    )
+    op.drop_constraint("retry_task_scheme_account_id_key", "retry_task", type_="unique")
+
+
+def downgrade():
+    op.create_unique_constraint("retry_task_scheme_account_id_key", "retry_task", ["scheme_account_id"])
+    op.drop_constraint("retry_task_scheme_account_journey_key", "retry_task", type_="unique")
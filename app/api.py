@@ -6,6 +6,7 @@ from app.audit import AuditLogger
 from app.exceptions import BaseError
 from app.prometheus import PrometheusManager
 from app.reporting import get_logger
+from app.shutdown import shutdown_background_senders  # noqa: F401 registers the atexit shutdown
 
 celery = Celery(broker=settings.broker_url, config_source=settings)
 prometheus_manager = PrometheusManager()
@@ -0,0 +1,88 @@
+"""
+Pooled httpx clients for the asyncio agent engine, the async counterpart of app.requests_retry
+"""
+import asyncio
+import typing as t
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import httpx
+
+import settings
+
+_clients: ContextVar[dict[str, httpx.AsyncClient] | None] = ContextVar("async_http_clients", default=None)
+_transport: ContextVar[httpx.AsyncBaseTransport | None] = ContextVar("async_http_transport", default=None)
+
+
+class AsyncRetryError(Exception):
+    def __init__(self, response: httpx.Response) -> None:
+        super().__init__(f"Max retries exceeded with url: {response.request.url} ({response.status_code})")
+        self.response = response
+
+
+@asynccontextmanager
+async def client_scope(transport: httpx.AsyncBaseTransport | None = None) -> t.AsyncIterator[None]:
+    """
+    Everything awaited inside the scope shares one pooled AsyncClient per pool key, e.g. one per scheme slug.
+    httpx clients are bound to the event loop that first uses them, so they are closed when the scope exits.
+    A transport can be given to mock the network in tests.
+    """
+    clients_token = _clients.set({})
+    transport_token = _transport.set(transport)
+    try:
+        yield
+    finally:
+        clients = _clients.get() or {}
+        _clients.reset(clients_token)
+        _transport.reset(transport_token)
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+
+def get_async_client(pool_key: str) -> httpx.AsyncClient:
+    clients = _clients.get()
+    if clients is None:
+        raise RuntimeError("Async HTTP clients can only be used inside client_scope()")
+
+    if pool_key not in clients:
+        limits = httpx.Limits(
+            max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_POOL_MAXSIZE,
+            keepalive_expiry=settings.HTTP_KEEP_ALIVE_IDLE,
+        )
+        clients[pool_key] = httpx.AsyncClient(
+            limits=limits, transport=_transport.get() or httpx.AsyncHTTPTransport(limits=limits)
+        )
+    return clients[pool_key]
+
+
+async def request_with_retries(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    retries: int = 3,
+    backoff_factor: float = 0.3,
+    status_forcelist: t.Tuple = (500, 502, 504),
+    **kwargs,
+) -> httpx.Response:
+    """
+    Sends a request, retrying connection errors and the statuses in `status_forcelist` with exponential backoff
+    like urllib3's Retry does for the sync sessions. Raises AsyncRetryError once a retried status is exhausted.
+    """
+    if isinstance(kwargs.get("data"), (str, bytes)):
+        kwargs["content"] = kwargs.pop("data")
+
+    attempt = 0
+    while True:
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+        else:
+            if response.status_code not in status_forcelist:
+                return response
+            if attempt >= retries:
+                raise AsyncRetryError(response)
+
+        await asyncio.sleep(backoff_factor * (2**attempt))
+        attempt += 1
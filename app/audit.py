@@ -1,4 +1,8 @@
 import json
+import os
+import queue
+import threading
+import time
 from enum import Enum
 from typing import Iterable, NamedTuple, Union
 from uuid import uuid4
@@ -66,6 +70,141 @@ def serialize(audit_log: AuditLog, audit_config: dict) -> dict:
 log = get_logger("audit")
 
 
+def post_audit_logs(session: requests.Session, audit_logs: list[dict]) -> bool:
+    """Sends serialized audit logs to Atlas in a single request, returns True if Atlas accepted them."""
+    headers = get_headers(tid=str(uuid4()))
+    payload = {"audit_logs": audit_logs}
+    log.info(f"Sending payload to atlas: {payload}")
+
+    try:
+        resp = session.post(f"{ATLAS_URL}/audit/membership/", headers=headers, json=payload)
+        if resp.ok:
+            log.info("Successfully sent audit logs to Atlas.")
+            return True
+        else:
+            resp_content = resp.content.decode("utf-8")
+            log.error(f"Error response from Atlas when sending audit logs. Response: {resp_content}")
+    except requests.exceptions.RequestException as e:
+        log.exception(f"Error sending audit logs to Atlas. Error: {repr(e)}")
+
+    return False
+
+
+class AuditExporter:
+    """
+    Buffers serialized audit logs in a bounded in-memory queue and sends them to Atlas in batches from a
+    background thread, so agents don't wait on Atlas for every merchant request and response.
+
+    A batch is sent once it reaches `batch_size` logs or `flush_interval` seconds after its first log was queued.
+    When the queue is full callers block for up to `enqueue_timeout` seconds before the log is dropped.
+    Outcomes are reported through the "audit-export" signal. Once shut down, logs are sent from the calling thread.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = settings.AUDIT_EXPORT_QUEUE_SIZE,
+        batch_size: int = settings.AUDIT_EXPORT_BATCH_SIZE,
+        flush_interval: float = settings.AUDIT_EXPORT_FLUSH_INTERVAL,
+        enqueue_timeout: float = settings.AUDIT_EXPORT_ENQUEUE_TIMEOUT,
+    ) -> None:
+        self.session = requests_retry_session(retries=3, status_forcelist=(500, 502, 503, 504), pool_key="atlas")
+        self.queue: queue.Queue[dict] = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._thread: threading.Thread | None = None
+        self._thread_pid: int | None = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._shut_down = False
+
+    def export(self, audit_log: dict) -> None:
+        if self._shut_down:
+            self._send([audit_log])
+            return
+
+        self._ensure_started()
+        try:
+            self.queue.put(audit_log, timeout=self.enqueue_timeout)
+        except queue.Full:
+            log.warning("Atlas audit export queue is full, dropping audit log.")
+            signal("audit-export").send(self, outcome="dropped", count=1)
+            return
+
+        if self._shut_down and not self._is_running():
+            # shutdown finished between the check above and queueing the log, so nothing else will send it
+            self.flush()
+
+    def flush(self) -> None:
+        """Sends everything currently queued from the calling thread."""
+        while batch := self._get_batch(block=False):
+            self._send(batch)
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """
+        Waits up to `timeout` seconds for the background thread to send everything still queued.
+        Logs exported after shutdown are sent synchronously.
+        """
+        with self._thread_lock:
+            self._shut_down = True
+            self._stopping.set()
+            if self._is_running():
+                self._thread.join(timeout=timeout)
+            if self._is_running():
+                # the thread keeps draining the queue, flushing here as well could send logs out of order
+                log.warning(f"Atlas audit exporter did not finish within {timeout}s, {self.queue.qsize()} logs queued.")
+                return
+        self.flush()
+
+    def _is_running(self) -> bool:
+        return bool(self._thread and self._thread_pid == os.getpid() and self._thread.is_alive())
+
+    def _ensure_started(self) -> None:
+        # a forked worker inherits the thread object but not the running thread, so check the owning process
+        if self._thread_pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._thread_pid == os.getpid() or self._shut_down:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="atlas-audit-exporter", daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            # once stopping, drain whatever is left without waiting for new logs
+            stopping = self._stopping.is_set()
+            if batch := self._get_batch(block=not stopping):
+                self._send(batch)
+            elif stopping:
+                break
+
+    def _get_batch(self, block: bool) -> list[dict]:
+        batch: list[dict] = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                if not block:
+                    batch.append(self.queue.get_nowait())
+                elif deadline is None:
+                    # wait for the first log of the batch, waking up periodically to check for shutdown
+                    batch.append(self.queue.get(timeout=self.flush_interval))
+                    deadline = time.monotonic() + self.flush_interval
+                else:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch: list[dict]) -> None:
+        outcome = "sent" if post_audit_logs(self.session, batch) else "failed"
+        signal("audit-export").send(self, outcome=outcome, count=len(batch))
+
+
+audit_exporter = AuditExporter()
+
+
 class AuditLogger:
     """
     Handler for sending request/response audit logs to Atlas.
@@ -177,16 +316,9 @@ class AuditLogger:
         if not audit_log:
             log.debug("No request or response data to send to Atlas.")
             return
-        headers = get_headers(tid=str(uuid4()))
-        payload = {"audit_logs": [serialize(audit_log, audit_config)]}
-        log.info(f"Sending payload to atlas: {payload}")
 
-        try:
-            resp = self.session.post(f"{ATLAS_URL}/audit/membership/", headers=headers, json=payload)
-            if resp.ok:
-                log.info("Successfully sent audit logs to Atlas.")
-            else:
-                resp_content = resp.content.decode("utf-8")
-                log.error(f"Error response from Atlas when sending audit logs. Response: {resp_content}")
-        except requests.exceptions.RequestException as e:
-            log.exception(f"Error sending audit logs to Atlas. Error: {repr(e)}")
+        serialized_audit_log = serialize(audit_log, audit_config)
+        if settings.AUDIT_EXPORT_ASYNC:
+            audit_exporter.export(serialized_audit_log)
+        else:
+            post_audit_logs(self.session, [serialized_audit_log])
@@ -0,0 +1,96 @@
+"""
+Detects balance refreshes that found nothing new to publish
+"""
+import hashlib
+import json
+import typing as t
+
+import redis.exceptions as redis_exceptions
+
+import settings
+from app.encoding import JsonEncoder
+from app.redis_pool import get_redis
+from app.reporting import get_logger
+
+log = get_logger("balance-changes")
+
+# Records a hash as published only if the hash stored for the account is still the one the refresh compared against,
+# so a publish confirmed late can't overwrite the hash of a newer publish, or restore one forgotten since.
+RECORD_IF_UNCHANGED = """
+local current = redis.call('GET', KEYS[1])
+if (current or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class BalanceChangeDetector:
+    """
+    Keeps a hash of the balance, vouchers, user set, status and journey last published for each scheme account,
+    so a refresh that finds the same balance can skip publishing it to Hades, and with `skip_status` the status to
+    Hermes as well.
+
+    A hash is only recorded once Hades has accepted the balance, and is kept in Redis for `republish_interval`
+    seconds, so an unchanged balance is still published once per interval. If Redis can't be reached every balance
+    is treated as changed.
+    """
+
+    def __init__(
+        self,
+        mode: str = settings.BALANCE_CHANGE_DETECTION,
+        republish_interval: int = settings.BALANCE_REPUBLISH_INTERVAL,
+    ) -> None:
+        self.mode = mode
+        self.republish_interval = republish_interval
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("heartbeat", "skip")
+
+    @property
+    def skip_status(self) -> bool:
+        return self.mode == "skip"
+
+    @staticmethod
+    def content_hash(balance_item: dict, user_set: str, status: int, journey: t.Optional[str]) -> str:
+        content = {"balance": balance_item, "user_set": user_set, "status": status, "journey": journey}
+        return hashlib.sha256(json.dumps(content, cls=JsonEncoder, sort_keys=True).encode()).hexdigest()
+
+    def last_published(self, scheme_account_id: int) -> t.Optional[str]:
+        """Returns the hash of the balance last published for the account, if it is known."""
+        try:
+            value = get_redis().get(self._key(scheme_account_id))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to get the balance hash for scheme account {scheme_account_id}: {repr(e)}")
+            return None
+        return value.decode() if value else None
+
+    def record_published(self, scheme_account_id: int, content_hash: str, last_published: t.Optional[str]) -> None:
+        """
+        Records `content_hash` as published, unless the hash stored for the account has changed from
+        `last_published` since the refresh compared against it.
+        """
+        key = self._key(scheme_account_id)
+        try:
+            redis = get_redis()
+            redis.register_script(RECORD_IF_UNCHANGED)(
+                keys=[key], args=[last_published or "", content_hash, self.republish_interval], client=redis
+            )
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to set the balance hash for scheme account {scheme_account_id}: {repr(e)}")
+
+    def forget(self, scheme_account_id: int) -> None:
+        """Makes the next refresh publish, e.g. once a refresh has failed and a different status was published."""
+        try:
+            get_redis().delete(self._key(scheme_account_id))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to delete the balance hash for scheme account {scheme_account_id}: {repr(e)}")
+
+    @staticmethod
+    def _key(scheme_account_id: int) -> str:
+        return f"balance-hash-{scheme_account_id}"
+
+
+balance_changes = BalanceChangeDetector()
@@ -0,0 +1,246 @@
+"""
+Per-merchant circuit breakers and adaptive concurrency limits for outbound agent requests
+"""
+import threading
+import time
+import typing as t
+from contextlib import contextmanager
+from enum import Enum
+
+import redis.exceptions as redis_exceptions
+import requests
+from blinker import signal
+
+import settings
+from app.exceptions import EndSiteDownError, NotSentError, RetryLimitReachedError
+from app.redis_pool import get_redis
+from app.reporting import get_logger
+
+log = get_logger("circuit-breaker")
+
+# errors raised by make_request and check_response_for_errors that mean the merchant is unhealthy, anything else
+# (e.g. a 401 or 404) means the merchant answered
+MERCHANT_UNHEALTHY_ERRORS = (EndSiteDownError, NotSentError, RetryLimitReachedError)
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    The exception of the NotSentError raised for a rejected request. Agents read error codes from
+    `ex.exception.response`, which is None as the merchant was never asked.
+    """
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class AIMDLimiter:
+    """
+    Additive increase, multiplicative decrease limit on the number of requests in flight.
+    Every healthy response raises the limit by `increase / limit` (so roughly by `increase` per round of requests)
+    up to `max_limit`, every failed or slow one multiplies it by `decrease_factor` down to `min_limit`.
+    Not thread-safe on its own, CircuitBreaker calls it under its lock.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, increase: float = 1.0, decrease_factor: float = 0.5) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_limit)
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, healthy: t.Optional[bool]) -> None:
+        self.in_flight -= 1
+        if healthy is True:
+            self.limit = min(self.limit + self.increase / self.limit, float(self.max_limit))
+        elif healthy is False:
+            self.limit = max(self.limit * self.decrease_factor, float(self.min_limit))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one scheme slug, shared by every agent instance in the process.
+
+    CLOSED: requests are sent. After `failure_threshold` consecutive unhealthy outcomes (a MERCHANT_UNHEALTHY_ERRORS
+    error or a response slower than `slow_call_seconds`) the circuit opens.
+    OPEN: requests fail fast with NotSentError. After `reset_timeout` seconds the circuit goes half-open.
+    HALF_OPEN: a single probe request is sent, closing the circuit if it is healthy and reopening it if it isn't.
+
+    Requests are also rejected with NotSentError while the slug's AIMDLimiter is full.
+    With `shared` set the open state is written to Redis so that other processes fail fast too.
+    """
+
+    def __init__(
+        self,
+        slug: str,
+        failure_threshold: int = settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+        slow_call_seconds: float = settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+        min_concurrency: int = settings.CIRCUIT_BREAKER_MIN_CONCURRENCY,
+        max_concurrency: int = settings.CIRCUIT_BREAKER_MAX_CONCURRENCY,
+        shared: bool = settings.CIRCUIT_BREAKER_SHARED,
+    ) -> None:
+        self.slug = slug
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.shared = shared
+        self.limiter = AIMDLimiter(min_concurrency, max_concurrency)
+        self.state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._shared_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def redis_key(self) -> str:
+        return f"circuit-breaker-open-{self.slug}"
+
+    @contextmanager
+    def guard(self, channel: str = "") -> t.Iterator[None]:
+        """
+        Wraps sending a request and checking its response. Raises NotSentError without running the block if the
+        circuit is open or too many requests are in flight, otherwise records how the block went.
+        """
+        is_probe = self._before_request(channel)
+        started_at = time.monotonic()
+        healthy: t.Optional[bool] = None
+        try:
+            yield
+            healthy = time.monotonic() - started_at < self.slow_call_seconds
+        except MERCHANT_UNHEALTHY_ERRORS:
+            healthy = False
+            raise
+        except Exception:
+            # the merchant answered, e.g. with a 401, so this says nothing about its latency
+            healthy = True
+            raise
+        finally:
+            self._after_request(healthy, is_probe)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._set_state(CircuitState.CLOSED)
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def _before_request(self, channel: str) -> bool:
+        shared_open = self._is_open_in_redis()
+        with self._lock:
+            now = time.monotonic()
+            if shared_open and self.state is CircuitState.CLOSED:
+                self._opened_at = now
+                self._set_state(CircuitState.OPEN)
+
+            if self.state is CircuitState.OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    self._reject(channel, f"circuit open for {self.slug}")
+                self._set_state(CircuitState.HALF_OPEN)
+
+            is_probe = self.state is CircuitState.HALF_OPEN
+            if is_probe:
+                if self._probe_in_flight:
+                    self._reject(channel, f"circuit half-open for {self.slug}, waiting on a probe request")
+                self._probe_in_flight = True
+
+            if not self.limiter.try_acquire():
+                if is_probe:
+                    self._probe_in_flight = False
+                self._reject(channel, f"{self.limiter.in_flight} requests already in flight for {self.slug}")
+
+            return is_probe
+
+    def _after_request(self, healthy: t.Optional[bool], is_probe: bool) -> None:
+        opened = closed = False
+        with self._lock:
+            self.limiter.release(healthy)
+            if is_probe:
+                self._probe_in_flight = False
+
+            if healthy is False:
+                self._consecutive_failures += 1
+                if is_probe or self._consecutive_failures >= self.failure_threshold:
+                    opened = self.state is not CircuitState.OPEN
+                    self._opened_at = time.monotonic()
+                    self._set_state(CircuitState.OPEN)
+            elif healthy is True:
+                self._consecutive_failures = 0
+                if is_probe:
+                    closed = True
+                    self._set_state(CircuitState.CLOSED)
+            elif is_probe:
+                # the probe didn't finish, e.g. the worker was interrupted, so let another one through
+                self._set_state(CircuitState.HALF_OPEN)
+
+        if opened:
+            self._open_in_redis()
+        elif closed:
+            self._close_in_redis()
+
+    def _set_state(self, state: CircuitState) -> None:
+        if state is not self.state:
+            log.warning(f"Circuit breaker for {self.slug} is {state.value}")
+            self.state = state
+            signal("circuit-breaker-state").send(self, slug=self.slug, state=state.value)
+
+    def _reject(self, channel: str, reason: str) -> t.NoReturn:
+        signal("request-fail").send(self, slug=self.slug, channel=channel, error=NotSentError)
+        message = f"Request not sent: {reason}"
+        raise NotSentError(exception=CircuitOpenError(message), message=message)
+
+    def _is_open_in_redis(self) -> bool:
+        # only asked once a second, so requests to a healthy merchant don't pay for a round trip each
+        now = time.monotonic()
+        if not self.shared or now - self._shared_checked_at < 1:
+            return False
+        self._shared_checked_at = now
+        try:
+            return bool(get_redis().exists(self.redis_key))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to read the shared circuit breaker state for {self.slug}: {repr(e)}")
+            return False
+
+    def _open_in_redis(self) -> None:
+        if not self.shared:
+            return
+        try:
+            get_redis().set(self.redis_key, "open", px=int(self.reset_timeout * 1000))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to share the circuit breaker state for {self.slug}: {repr(e)}")
+
+    def _close_in_redis(self) -> None:
+        if not self.shared:
+            return
+        try:
+            get_redis().delete(self.redis_key)
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to share the circuit breaker state for {self.slug}: {repr(e)}")
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(slug: str) -> CircuitBreaker:
+    """Returns the process-wide circuit breaker for the given scheme slug, creating it on first use."""
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(slug)
+        if breaker is None:
+            breaker = _circuit_breakers[slug] = CircuitBreaker(slug)
+        return breaker
+
+
+def reset_circuit_breakers() -> None:
+    """Forgets every circuit breaker, closing their circuits."""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
@@ -0,0 +1,193 @@
+"""
+An rq worker that runs several jobs at once in one process
+"""
+import threading
+import typing as t
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from rq import SimpleWorker
+from rq.exceptions import DeserializationError
+from rq.job import Job
+from rq.queue import Queue
+from rq.timeouts import TimerDeathPenalty
+from rq.worker import WorkerStatus
+
+import settings
+from app.reporting import get_logger
+
+log = get_logger("concurrent-worker")
+
+# the position of the scheme slug in the arguments of each retry job, see app.retry_util
+SLUG_ARG_POSITIONS = {
+    "app.journeys.join.attempt_join": 2,
+    "app.journeys.join.login_and_publish_status": 1,
+}
+
+
+def get_job_slug(job: Job) -> t.Optional[str]:
+    try:
+        position = SLUG_ARG_POSITIONS.get(job.func_name)
+        args = job.args
+    except DeserializationError:
+        # rq fails the job when it performs it
+        return None
+    if position is None or len(args) <= position:
+        return None
+    return args[position]
+
+
+class JobWorker(SimpleWorker):
+    """
+    Performs a ConcurrentWorker's jobs on one of its threads. rq keeps the current job, its heartbeats and the job
+    counts on the worker, so each thread has a worker of its own rather than the jobs clobbering each other's.
+    """
+
+    death_penalty_class = TimerDeathPenalty  # signal based job timeouts only work on the main thread
+
+
+class ConcurrentWorker(SimpleWorker):
+    """
+    Runs up to `concurrency` jobs at once on a thread pool rather than forking a work horse for each job, so joins
+    waiting on a merchant don't hold up the rest of the queue, and jobs share the process' Postgres, Redis and HTTP
+    connection pools and configuration cache.
+
+    At most `slug_concurrency` jobs run for one merchant at a time. A job for a merchant at its limit is deferred
+    until one of the merchant's jobs finishes, so a slow merchant can't take every thread, and at most `max_deferred`
+    jobs are held before the worker waits for them to start. Jobs are performed by a JobWorker per thread exactly as
+    rq performs them, so failed jobs still go through the exception handlers, e.g. handle_retry_task_request_error.
+    """
+
+    death_penalty_class = TimerDeathPenalty
+    slot_wait = 1.0  # seconds to wait for a free thread, or for deferred jobs to start, before checking in with rq
+
+    def __init__(
+        self,
+        *args: t.Any,
+        concurrency: int = settings.RETRY_WORKER_CONCURRENCY,
+        slug_concurrency: int = settings.RETRY_WORKER_SLUG_CONCURRENCY,
+        max_deferred: t.Optional[int] = None,
+        **kwargs: t.Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency
+        self.slug_concurrency = slug_concurrency
+        self.max_deferred = max_deferred or concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rq-job")
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._running = 0
+        self._running_by_slug: dict[t.Optional[str], int] = defaultdict(int)
+        self._deferred: dict[str, deque[tuple[Job, Queue]]] = defaultdict(deque)
+        self._deferred_count = 0
+        self._lock = threading.Lock()
+        self._job_finished = threading.Condition(self._lock)
+        self._job_workers = threading.local()
+
+    def dequeue_job_and_maintain_ttl(self, timeout: t.Optional[int], max_idle_time: t.Optional[int] = None):
+        # only take a job off the queue once a thread is free to run it
+        while not self._slots.acquire(timeout=self.slot_wait):
+            self.heartbeat()
+            if self._stop_requested:
+                return None
+        result = super().dequeue_job_and_maintain_ttl(timeout, max_idle_time)
+        if result is None:
+            self._slots.release()
+        return result
+
+    def execute_job(self, job: Job, queue: Queue) -> None:
+        slug = get_job_slug(job)
+        with self._lock:
+            deferred = not self._claim_slug(slug)
+            if deferred:
+                log.debug(f"{slug} is running {self.slug_concurrency} jobs, deferring job {job.id} until one finishes")
+                self._deferred[t.cast(str, slug)].append((job, queue))
+                self._deferred_count += 1
+            else:
+                self._running += 1
+                self.set_state(WorkerStatus.BUSY)
+
+        if deferred:
+            # the thread is free for another merchant's job
+            self._slots.release()
+            self._wait_for_deferred_jobs()
+        else:
+            self._submit(job, queue, slug)
+
+    def teardown(self) -> None:
+        # let running and deferred jobs finish before the worker deregisters, deferred jobs start as the merchant's
+        # running jobs finish
+        with self._lock:
+            while self._running:
+                self._job_finished.wait()
+        self._executor.shutdown(wait=True)
+        super().teardown()
+
+    def get_job_worker(self) -> JobWorker:
+        """Returns the worker that performs jobs on the current thread."""
+        worker = getattr(self._job_workers, "worker", None)
+        if worker is None:
+            worker = JobWorker(
+                queues=self.queues,
+                name=f"{self.name}-{threading.current_thread().name}",
+                connection=self.connection,
+                exception_handlers=list(self._exc_handlers),
+                default_result_ttl=self.default_result_ttl,
+                job_class=self.job_class,
+                queue_class=self.queue_class,
+                log_job_description=self.log_job_description,
+                disable_default_exception_handler=self.disable_default_exception_handler,
+                prepare_for_work=False,
+                serializer=self.serializer,
+            )
+            self._job_workers.worker = worker
+        return worker
+
+    def _perform_job(self, job: Job, queue: Queue) -> bool:
+        return self.get_job_worker().perform_job(job, queue)
+
+    def _submit(self, job: Job, queue: Queue, slug: t.Optional[str]) -> None:
+        future = self._executor.submit(self._perform_job, job, queue)
+        future.add_done_callback(lambda f: self._job_done(f, slug))
+
+    def _claim_slug(self, slug: t.Optional[str]) -> bool:
+        # called holding self._lock
+        if slug is None or not self.slug_concurrency:
+            return True
+        if self._running_by_slug[slug] < self.slug_concurrency:
+            self._running_by_slug[slug] += 1
+            return True
+        return False
+
+    def _wait_for_deferred_jobs(self) -> None:
+        # deferred jobs have been taken off the queue, so stop taking more until some of them have started
+        while True:
+            with self._lock:
+                if self._deferred_count < self.max_deferred:
+                    return
+                self._job_finished.wait(timeout=self.slot_wait)
+                if self._deferred_count < self.max_deferred:
+                    return
+            self.heartbeat()
+
+    def _job_done(self, future: Future, slug: t.Optional[str]) -> None:
+        if future.exception() is not None:
+            # perform_job handles job errors itself, so this is a failure in rq
+            log.error(f"Job failed outside of rq's error handling: {repr(future.exception())}")
+        next_job = None
+        with self._lock:
+            if slug is not None and self._deferred.get(slug):
+                # hand the thread and the merchant's claim straight to its next job
+                next_job = self._deferred[slug].popleft()
+                self._deferred_count -= 1
+            else:
+                self._running -= 1
+                if slug is not None and self.slug_concurrency:
+                    self._running_by_slug[slug] -= 1
+                if not self._running:
+                    self.set_state(WorkerStatus.IDLE)
+            self._job_finished.notify_all()
+
+        if next_job is not None:
+            self._submit(*next_job, slug)
+        else:
+            self._slots.release()
@@ -0,0 +1,147 @@
+"""
+Process-wide cache of Europa/Vault configurations
+"""
+import threading
+import time
+import typing as t
+
+import settings
+from app.reporting import get_logger
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from soteria.configuration import Configuration
+
+log = get_logger("config-cache")
+
+CacheKey = t.Tuple[str, int]
+
+
+class CachedConfiguration(t.NamedTuple):
+    config: "Configuration"
+    refresh_at: float
+    expires_at: float
+
+
+class ConfigurationCache:
+    """
+    Thread-safe cache of soteria Configuration objects keyed by (scheme slug, handler type).
+
+    Entries live for `ttl` seconds. Once an entry is within `refresh_ahead` seconds of expiry the cached value is
+    still returned but a single background thread reloads it, so requests don't block on Europa/Vault.
+    Loading is single-flight: a burst of requests for an uncached key results in one fetch.
+    A `ttl` of 0 or less disables caching and every call loads a fresh configuration.
+    """
+
+    def __init__(self, ttl: int = settings.CONFIG_CACHE_TTL, refresh_ahead: int = settings.CONFIG_CACHE_REFRESH_AHEAD):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._entries: dict[CacheKey, CachedConfiguration] = {}
+        self._key_locks: dict[CacheKey, threading.Lock] = {}
+        # bumped by invalidate so that loads already in flight don't re-insert a stale configuration
+        self._generations: dict[CacheKey, int] = {}
+        self._invalidation_listeners: list[t.Callable[[t.Optional[str], t.Optional[int]], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self, scheme_slug: str, handler_type: int, config_class: t.Type["Configuration"]) -> "Configuration":
+        """
+        :param scheme_slug: e.g. 'iceland-bonus-card'
+        :param handler_type: a handler type from Configuration e.g. Configuration.JOIN_HANDLER
+        :param config_class: the Configuration class used to load the configuration on a cache miss
+        """
+        if self.ttl <= 0:
+            return self._load(scheme_slug, handler_type, config_class)
+
+        key = (scheme_slug, handler_type)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and now < entry.expires_at:
+            if now >= entry.refresh_at:
+                self._refresh_in_background(key, config_class)
+            return entry.config
+
+        with self._get_key_lock(key):
+            # another thread may have loaded the configuration while we were waiting on the lock
+            entry = self._entries.get(key)
+            if entry and time.monotonic() < entry.expires_at:
+                return entry.config
+            return self._fetch(key, config_class)
+
+    def invalidate(self, scheme_slug: t.Optional[str] = None, handler_type: t.Optional[int] = None) -> None:
+        """
+        Drops cached configurations. With no arguments the whole cache is cleared, with only a scheme slug
+        every handler type for that slug is dropped.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if scheme_slug is not None and key[0] != scheme_slug:
+                    continue
+                if handler_type is not None and key[1] != handler_type:
+                    continue
+                del self._entries[key]
+            for key in list(self._key_locks):
+                if scheme_slug is not None and key[0] != scheme_slug:
+                    continue
+                if handler_type is not None and key[1] != handler_type:
+                    continue
+                self._generations[key] = self._generations.get(key, 0) + 1
+        for listener in self._invalidation_listeners:
+            listener(scheme_slug, handler_type)
+
+    def add_invalidation_listener(self, listener: t.Callable[[t.Optional[str], t.Optional[int]], None]) -> None:
+        """
+        Registers a cache of values derived from configurations, which is called with the same arguments as
+        invalidate so that it is cleared along with the configurations.
+        """
+        self._invalidation_listeners.append(listener)
+
+    def _get_key_lock(self, key: CacheKey) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fetch(self, key: CacheKey, config_class: t.Type["Configuration"]) -> "Configuration":
+        with self._lock:
+            generation = self._generations.get(key, 0)
+        config = self._load(*key, config_class)
+        loaded_at = time.monotonic()
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                log.debug(f"Configuration for {key} was invalidated while loading, not caching it")
+                return config
+            self._entries[key] = CachedConfiguration(
+                config=config,
+                refresh_at=loaded_at + max(self.ttl - self.refresh_ahead, 0),
+                expires_at=loaded_at + self.ttl,
+            )
+        return config
+
+    def _refresh_in_background(self, key: CacheKey, config_class: t.Type["Configuration"]) -> None:
+        key_lock = self._get_key_lock(key)
+        if not key_lock.acquire(blocking=False):
+            # a load or refresh is already in flight for this key
+            return
+
+        def refresh() -> None:
+            try:
+                self._fetch(key, config_class)
+            except Exception as e:
+                # keep serving the cached configuration until it expires
+                log.warning(f"Failed to refresh configuration for {key}: {repr(e)}")
+            finally:
+                key_lock.release()
+
+        threading.Thread(target=refresh, name=f"config-refresh-{key[0]}", daemon=True).start()
+
+    @staticmethod
+    def _load(scheme_slug: str, handler_type: int, config_class: t.Type["Configuration"]) -> "Configuration":
+        log.debug(f"Loading configuration for {scheme_slug} handler type {handler_type}")
+        return config_class(
+            scheme_slug,
+            handler_type,
+            settings.VAULT_URL,
+            settings.VAULT_TOKEN,
+            settings.CONFIG_SERVICE_URL,
+            settings.AZURE_AAD_TENANT_ID,
+        )
+
+
+config_cache = ConfigurationCache()
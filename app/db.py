@@ -1,32 +1,72 @@
 import json
+import os
+import time
 import typing as t
 from contextlib import contextmanager
 from uuid import uuid4
 
 import sqlalchemy as s
-from redis import Redis
+from blinker import signal
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound  # noqa
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, PoolProxiedConnection, QueuePool
 
 import settings
+from app.redis_pool import get_redis
 from app.reporting import get_logger
 
-redis_raw = Redis.from_url(
-    settings.REDIS_URL,
-    socket_connect_timeout=3,
-    socket_keepalive=True,
-    retry_on_timeout=False,
-)
-
-engine = s.create_engine(
-    settings.POSTGRES_DSN,
-    connect_args=settings.POSTGRES_CONNECT_ARGS,
-    poolclass=NullPool,
-    json_serializer=json.dumps,
-    json_deserializer=json.loads,
-)
+redis_raw = get_redis()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    A QueuePool that reports how long each checkout took, through Pool.connect as SQLAlchemy has no event before a
+    checkout. That is mostly the wait for a free connection, plus opening or pinging the connection.
+    """
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            signal("db-pool-wait").send(self, wait_time=time.perf_counter() - start)
+
+
+def create_engine() -> Engine:
+    """
+    Creates the engine for POSTGRES_DSN. Connections are pooled per process unless POSTGRES_POOL is "null", and are
+    checked with a ping before they are used, so connections dropped by Postgres or a load balancer are replaced.
+    """
+    pool_options: dict[str, t.Any]
+    if settings.POSTGRES_POOL == "null":
+        pool_options = {"poolclass": NullPool}
+    else:
+        pool_options = {
+            "poolclass": TimedQueuePool,
+            "pool_size": settings.POSTGRES_POOL_SIZE,
+            "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+            "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+            "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    return s.create_engine(
+        settings.POSTGRES_DSN,
+        connect_args=settings.POSTGRES_CONNECT_ARGS,
+        json_serializer=json.dumps,
+        json_deserializer=json.loads,
+        **pool_options,
+    )
+
+
+def _dispose_in_child() -> None:
+    # rq forks a work horse for every job, which must not use the connections in its parent's pool
+    engine.dispose(close=False)
+
+
+engine = create_engine()
+os.register_at_fork(after_in_child=_dispose_in_child)
 
 SessionMaker = sessionmaker(bind=engine)
 db_session = SessionMaker()
@@ -1,7 +1,9 @@
 import base64
 import hashlib
 import json
-from functools import lru_cache
+import threading
+import time
+import typing as t
 
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
@@ -11,6 +13,9 @@ from hashids import Hashids
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 import settings
+from app.reporting import get_logger
+
+log = get_logger("encryption")
 
 ALPHABET = "abcdefghijklmnopqrstuvwxyz1234567890"
 hash_ids = Hashids(min_length=32, salt="GJgCh--VgsonCWacO5-MxAuMS9hcPeGGxj5tGsT40FM", alphabet=ALPHABET)
@@ -41,22 +46,151 @@ class AESCipher(object):
         length = self.bs - (len(s) % self.bs)
         return s + bytes([length]) * length
 
+    def decrypt_strict(self, enc):
+        """
+        Like decrypt, but raises ValueError unless the padding and text are valid, which is almost never the case
+        for text encrypted with another key.
+        """
+        enc = base64.b64decode(enc)
+        if not enc or len(enc) % AES.block_size:
+            raise ValueError("Invalid cipher text length")
+        iv = enc[: AES.block_size]
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
+        raw = cipher.decrypt(enc[AES.block_size :])
+        length = raw[-1] if raw else 0
+        if not 0 < length <= self.bs or raw[-length:] != bytes([length]) * length:
+            raise ValueError("Invalid padding")
+        return raw[:-length].decode("utf-8")
+
     @staticmethod
     def _unpad(s):
         return s[: -ord(s[len(s) - 1 :])]
 
 
+class MultiKeyCipher:
+    """
+    Decrypts with any of a set of keys, for while credentials encrypted with a previous key are still in use.
+    Encryption always uses the first (current) key.
+    """
+
+    def __init__(self, keys: t.Sequence[bytes]):
+        if not keys:
+            raise ValueError("At least one AES key is required")
+        self.ciphers = [AESCipher(key) for key in keys]
+        self._last_used = self.ciphers[0]
+
+    def encrypt(self, raw):
+        return self.ciphers[0].encrypt(raw)
+
+    def decrypt(self, enc):
+        if len(self.ciphers) == 1:
+            return self.ciphers[0].decrypt(enc)
+        if enc == "":
+            raise TypeError("Cannot decrypt nothing")
+
+        # the key that decrypted the last value is tried first, as a batch is usually encrypted with one key
+        last_used = self._last_used
+        for cipher in [last_used, *(c for c in self.ciphers if c is not last_used)]:
+            try:
+                raw = cipher.decrypt_strict(enc)
+            except ValueError:
+                continue
+            self._last_used = cipher
+            return raw
+        raise ValueError("Value could not be decrypted with any of the AES keys")
+
+
+class AESKeyring:
+    """
+    Process-wide cipher for the AES keys in a Key Vault secret, so keys aren't derived for every request.
+
+    Keys are reloaded every `ttl` seconds. Once the keys are within `refresh_ahead` seconds of expiry the current
+    cipher is still returned but a single background thread reloads them, so a rotated key is picked up without
+    requests blocking on Key Vault. If a reload fails the current cipher is used until a reload succeeds.
+    """
+
+    def __init__(
+        self,
+        secret_name: str,
+        ttl: int = settings.AES_KEY_TTL,
+        refresh_ahead: int = settings.AES_KEY_REFRESH_AHEAD,
+    ):
+        self.secret_name = secret_name
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._cipher: t.Optional[MultiKeyCipher] = None
+        self._refresh_at = 0.0
+        self._expires_at = 0.0
+        self._load_lock = threading.Lock()
+
+    def get_cipher(self) -> MultiKeyCipher:
+        """
+        Returns the cipher for the current keys. Decrypt a batch of values with one cipher rather than calling this
+        for each of them.
+        """
+        cipher = self._cipher
+        now = time.monotonic()
+        if cipher is not None and now < self._expires_at:
+            if now >= self._refresh_at:
+                self._refresh_in_background()
+            return cipher
+
+        with self._load_lock:
+            # another thread may have loaded the keys while we were waiting on the lock
+            if self._cipher is not None and time.monotonic() < self._expires_at:
+                return self._cipher
+            try:
+                return self._fetch()
+            except Exception:
+                if self._cipher is None:
+                    raise
+                log.exception(f"Failed to reload AES keys from {self.secret_name}, using the previous keys")
+                return self._cipher
+
+    def decrypt(self, enc) -> str:
+        return self.get_cipher().decrypt(enc)
+
+    def invalidate(self) -> None:
+        """Drops the cipher so the next call reloads the keys, e.g. once a key has been rotated."""
+        self._cipher = None
+        self._expires_at = self._refresh_at = 0.0
+
+    def _fetch(self) -> MultiKeyCipher:
+        cipher = MultiKeyCipher(get_aes_keys(self.secret_name))
+        loaded_at = time.monotonic()
+        self._cipher = cipher
+        self._refresh_at = loaded_at + max(self.ttl - self.refresh_ahead, 0)
+        self._expires_at = loaded_at + self.ttl
+        return cipher
+
+    def _refresh_in_background(self) -> None:
+        if not self._load_lock.acquire(blocking=False):
+            # a load or refresh is already in flight
+            return
+
+        def refresh() -> None:
+            try:
+                self._fetch()
+            except Exception as e:
+                log.warning(f"Failed to refresh AES keys from {self.secret_name}: {repr(e)}")
+            finally:
+                self._load_lock.release()
+
+        threading.Thread(target=refresh, name="aes-key-refresh", daemon=True).start()
+
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=3, max=12),
     reraise=True,
 )
-@lru_cache(128)
-def get_aes_key(secret_name):  # pragma: no cover
+def get_aes_keys(secret_name) -> list[bytes]:  # pragma: no cover
+    """
+    Returns the current key, followed by any previous keys listed under PREVIOUS_AES_KEYS during a rotation.
+    """
     client = connect_to_vault()
-    vault_aes_keys = client.get_secret(secret_name).value
-    aes_key = json.loads(vault_aes_keys)["AES_KEY"]
-    return aes_key.encode()
+    vault_aes_keys = json.loads(client.get_secret(secret_name).value)
+    return [key.encode() for key in [vault_aes_keys["AES_KEY"], *vault_aes_keys.get("PREVIOUS_AES_KEYS", [])]]
 
 
 def connect_to_vault():  # pragma: no cover
@@ -86,3 +220,6 @@ class HashSHA1:
         encoded_str = h.hexdigest()
 
         return encoded_str
+
+
+aes_keyring = AESKeyring("aes-keys")
@@ -92,7 +92,7 @@ def handle_failed_login(self, session: Session):
                 scheme_identifier="slim-chickens",
                 scheme_account_id=self.user_info["scheme_account_id"],
             )
-            enqueue_retry_login_task_delay(
+            task.next_attempt_time = enqueue_retry_login_task_delay(
                 connection=redis_raw,
                 retry_task=task,
                 delay_seconds=pow(RETRY_BACKOFF_BASE, float(1)) * 60,
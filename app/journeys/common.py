@@ -1,12 +1,16 @@
+import asyncio
 import importlib
+from functools import partial
 
 from flask_restful import abort
 
+import settings
 from app import publish, redis_retry
 from app.active import AGENTS
 from app.agents.schemas import transaction_tuple_to_dict
 from app.exceptions import BaseError, RetryLimitReachedError, UnknownError
 from app.scheme_account import JourneyTypes
+from app.transaction_watermarks import transaction_watermarks
 
 
 def resolve_agent(name):
@@ -30,7 +34,8 @@ def get_agent_class(scheme_slug):
 
 def agent_login(agent_class, user_info, scheme_slug=None, from_join=False):
     """
-    Instantiates an agent class and attempts to login.
+    Instantiates an agent class and attempts to login. Changes to the retry count are sent to Redis in one pipelined
+    round trip once the login has finished.
     :param agent_class: Class object inheriting BaseAgent class.
     :param user_info: Dictionary of user information.
     {
@@ -51,29 +56,90 @@ def agent_login(agent_class, user_info, scheme_slug=None, from_join=False):
         user_info["from_join"] = True
 
     agent_instance = agent_class(retry_count, user_info, scheme_slug=scheme_slug)
-    try:
-        agent_instance.attempt_login()
-    except RetryLimitReachedError as e:
-        redis_retry.max_out_count(key, agent_instance.retry_limit)
-        raise e
-    except BaseError as e:
+    with redis_retry.pipelined():
         try:
-            if e.system_action_required and from_join:
+            agent_instance.attempt_login()
+        except RetryLimitReachedError as e:
+            redis_retry.max_out_count(key, agent_instance.retry_limit)
+            raise e
+        except BaseError as e:
+            try:
+                if e.system_action_required and from_join:
+                    raise e
+            except AttributeError:
+                redis_retry.inc_count(key)
                 raise e
-        except AttributeError:
-            redis_retry.inc_count(key)
+        except Exception as e:
+            raise UnknownError(exception=e) from e
+
+    return agent_instance
+
+
+async def agent_login_async(agent_class, user_info, scheme_slug=None, from_join=False):
+    """
+    The asyncio counterpart of agent_login. Redis and the agent's configuration are still read, and the retry count
+    written, on a worker thread.
+    :return: Class instance of the agent.
+    """
+    key = redis_retry.get_key(agent_class.__name__, user_info["scheme_account_id"])
+    retry_count = await asyncio.to_thread(redis_retry.get_count, key)
+    if from_join:
+        user_info["journey_type"] = JourneyTypes.UPDATE.value
+        user_info["from_join"] = True
+
+    agent_instance = await asyncio.to_thread(agent_class, retry_count, user_info, scheme_slug=scheme_slug)
+    async with redis_retry.pipelined_async():
+        try:
+            await agent_instance.attempt_login_async()
+        except RetryLimitReachedError as e:
+            redis_retry.max_out_count(key, agent_instance.retry_limit)
             raise e
-    except Exception as e:
-        raise UnknownError(exception=e) from e
+        except BaseError as e:
+            try:
+                if e.system_action_required and from_join:
+                    raise e
+            except AttributeError:
+                redis_retry.inc_count(key)
+                raise e
+        except Exception as e:
+            raise UnknownError(exception=e) from e
 
     return agent_instance
 
 
 def publish_transactions(agent_instance, scheme_account_id, user_set, tid):
-    transactions = agent_instance.transactions()
+    if not settings.TRANSACTION_WATERMARKS_ENABLED:
+        transactions = agent_instance.transactions()
+        publish.transactions([transaction_tuple_to_dict(tx) for tx in transactions], scheme_account_id, user_set, tid)
+        return
+
+    watermark = transaction_watermarks.get(scheme_account_id)
+    agent_instance.transactions_since = transaction_watermarks.since(watermark)
+    new_transactions = transaction_watermarks.filter_new(agent_instance.transactions(), watermark)
     publish.transactions(
-        [transaction_tuple_to_dict(tx) for tx in transactions],
+        [transaction_tuple_to_dict(tx) for tx in new_transactions],
+        scheme_account_id,
+        user_set,
+        tid,
+        on_published=partial(transaction_watermarks.advance, scheme_account_id, new_transactions),
+    )
+
+
+async def publish_transactions_async(agent_instance, scheme_account_id, user_set, tid):
+    if not settings.TRANSACTION_WATERMARKS_ENABLED:
+        transactions = await agent_instance.transactions_async()
+        await publish.transactions_async(
+            [transaction_tuple_to_dict(tx) for tx in transactions], scheme_account_id, user_set, tid
+        )
+        return
+
+    watermark = await asyncio.to_thread(transaction_watermarks.get, scheme_account_id)
+    agent_instance.transactions_since = transaction_watermarks.since(watermark)
+    new_transactions = transaction_watermarks.filter_new(await agent_instance.transactions_async(), watermark)
+    await publish.transactions_async(
+        [transaction_tuple_to_dict(tx) for tx in new_transactions],
         scheme_account_id,
         user_set,
         tid,
+        on_published=partial(transaction_watermarks.advance, scheme_account_id, new_transactions),
     )
@@ -1,14 +1,20 @@
+import asyncio
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
 
 import requests
 
 import settings
 from app import publish
 from app.agents.schemas import balance_tuple_to_dict
+from app.async_http import client_scope
+from app.balance_changes import balance_changes
 from app.encoding import JsonEncoder
 from app.exceptions import BaseError, SchemeRequestedDeleteError, UnknownError
 from app.http_request import get_headers
-from app.journeys.common import agent_login, publish_transactions
+from app.journeys.common import agent_login, agent_login_async, publish_transactions, publish_transactions_async
 from app.publish import thread_pool_executor
 from app.reporting import get_logger
 from app.scheme_account import (
@@ -22,7 +28,11 @@ from app.scheme_account import (
 log = get_logger("view-journey")
 
 
-def get_balance_and_publish(agent_class, scheme_slug, user_info, tid):
+def get_balance_and_publish(agent_class, scheme_slug, user_info, tid, executor=None):
+    """
+    :param executor: publishes the transactions and status, the shared thread_pool_executor if not given
+    """
+    executor = executor or thread_pool_executor
     scheme_account_id = user_info["scheme_account_id"]
     threads = []
     create_journey = None
@@ -30,7 +40,7 @@ def get_balance_and_publish(agent_class, scheme_slug, user_info, tid):
     status = SchemeAccountStatus.UNKNOWN_ERROR
     try:
         balance, status, create_journey = request_balance(
-            agent_class, user_info, scheme_account_id, scheme_slug, tid, threads
+            agent_class, user_info, scheme_account_id, scheme_slug, tid, threads, executor
         )
         return balance
     except BaseError as e:
@@ -40,13 +50,16 @@ def get_balance_and_publish(agent_class, scheme_slug, user_info, tid):
         status = SchemeAccountStatus.UNKNOWN_ERROR
         raise UnknownError(exception=e) from e
     finally:
+        if balance_changes.enabled and status not in (None, SchemeAccountStatus.ACTIVE):
+            balance_changes.forget(scheme_account_id)
+
         if user_info.get("pending") and not status == SchemeAccountStatus.ACTIVE:
             pass
         elif status is None:
             pass
         else:
             threads.append(
-                thread_pool_executor.submit(
+                executor.submit(
                     publish.status,
                     scheme_account_id,
                     status,
@@ -71,7 +84,7 @@ def set_iceland_user_info_status_and_journey_type(user_info):
     return user_info
 
 
-def request_balance(agent_class, user_info, scheme_account_id, scheme_slug, tid, threads):
+def request_balance(agent_class, user_info, scheme_account_id, scheme_slug, tid, threads, executor=None):
     if scheme_slug == "iceland-bonus-card":
         user_info = set_iceland_user_info_status_and_journey_type(user_info)
 
@@ -85,16 +98,22 @@ def request_balance(agent_class, user_info, scheme_account_id, scheme_slug, tid,
     if not balance_result:
         return None, None, None
 
-    balance = publish.balance(
-        balance_tuple_to_dict(balance_result),
-        scheme_account_id,
-        user_info["user_set"],
-        tid,
-    )
+    balance_item = balance_tuple_to_dict(balance_result)
+    status = SchemeAccountStatus.ACTIVE
+    create_journey = agent_instance.create_journey
+    unchanged, on_published = check_balance_change(balance_item, user_info, scheme_account_id, status, create_journey)
+    if unchanged:
+        balance = publish.create_balance_object(balance_item, scheme_account_id, user_info["user_set"])
+        if balance_changes.skip_status:
+            status = None
+    else:
+        balance = publish.balance(
+            balance_item, scheme_account_id, user_info["user_set"], tid, on_published=on_published
+        )
 
     # Asynchronously get the transactions for the user
     threads.append(
-        thread_pool_executor.submit(
+        (executor or thread_pool_executor).submit(
             publish_transactions,
             agent_instance,
             scheme_account_id,
@@ -102,12 +121,166 @@ def request_balance(agent_class, user_info, scheme_account_id, scheme_slug, tid,
             tid,
         )
     )
+
+    return balance, status, create_journey
+
+
+def check_balance_change(
+    balance_item, user_info, scheme_account_id, status, create_journey
+) -> tuple[bool, Optional[publish.OnPublished]]:
+    """
+    Returns True if the balance, and the status and journey to publish with it, are the same as last published for
+    the account, in which case the balance isn't published again. Pending accounts are always published.
+    Otherwise returns False with a callback that records the balance as published once Hades has accepted it.
+    """
+    if not balance_changes.enabled or user_info.get("pending"):
+        return False, None
+    content_hash = balance_changes.content_hash(balance_item, user_info["user_set"], status, create_journey)
+    last_published = balance_changes.last_published(scheme_account_id)
+    if content_hash == last_published:
+        log.debug(f"Balance for scheme account {scheme_account_id} is unchanged, not publishing it")
+        return True, None
+    return False, partial(balance_changes.record_published, scheme_account_id, content_hash, last_published)
+
+
+async def get_balance_and_publish_async(agent_class, scheme_slug, user_info, tid):
+    """The asyncio counterpart of get_balance_and_publish, must be awaited inside async_http.client_scope."""
+    scheme_account_id = user_info["scheme_account_id"]
+    create_journey = None
+
+    status = SchemeAccountStatus.UNKNOWN_ERROR
+    try:
+        balance, status, create_journey = await request_balance_async(
+            agent_class, user_info, scheme_account_id, scheme_slug, tid
+        )
+        return balance
+    except BaseError as e:
+        status = e.code
+        raise e
+    except Exception as e:
+        status = SchemeAccountStatus.UNKNOWN_ERROR
+        raise UnknownError(exception=e) from e
+    finally:
+        if balance_changes.enabled and status not in (None, SchemeAccountStatus.ACTIVE):
+            await asyncio.to_thread(balance_changes.forget, scheme_account_id)
+
+        if user_info.get("pending") and not status == SchemeAccountStatus.ACTIVE:
+            pass
+        elif status is None:
+            pass
+        else:
+            await publish.status_async(scheme_account_id, status, tid, user_info, journey=create_journey)
+
+        if status == SchemeRequestedDeleteError().code:
+            log.debug(
+                f"Received deleted request from scheme: {scheme_slug}. Deleting scheme account: {scheme_account_id}"
+            )
+            await asyncio.to_thread(delete_scheme_account, tid, scheme_account_id, user_info.get("bink_user_id"))
+
+
+async def request_balance_async(agent_class, user_info, scheme_account_id, scheme_slug, tid):
+    if scheme_slug == "iceland-bonus-card":
+        user_info = set_iceland_user_info_status_and_journey_type(user_info)
+
+    agent_instance = await agent_login_async(agent_class, user_info, scheme_slug=scheme_slug)
+
+    # Send identifier (e.g membership id) to hermes if it's not already stored.
+    if agent_instance.identifier:
+        await asyncio.to_thread(update_pending_join_account, user_info, tid, identifier=agent_instance.identifier)
+
+    balance_result = await agent_instance.balance_async()
+    if not balance_result:
+        return None, None, None
+
+    balance_item = balance_tuple_to_dict(balance_result)
     status = SchemeAccountStatus.ACTIVE
     create_journey = agent_instance.create_journey
+    unchanged, on_published = await asyncio.to_thread(
+        check_balance_change, balance_item, user_info, scheme_account_id, status, create_journey
+    )
+    if unchanged:
+        balance = publish.create_balance_object(balance_item, scheme_account_id, user_info["user_set"])
+        if balance_changes.skip_status:
+            status = None
+    else:
+        balance = await publish.balance_async(
+            balance_item, scheme_account_id, user_info["user_set"], tid, on_published=on_published
+        )
+    await publish_transactions_async(agent_instance, scheme_account_id, user_info["user_set"], tid)
 
     return balance, status, create_journey
 
 
+def get_balances_and_publish(agent_class, scheme_slug, user_infos, tid, max_workers=None):
+    """
+    Refreshes the balances of many scheme accounts for one scheme, running at most `max_workers` at once.
+    The first account is refreshed on its own so that the scheme's configuration and any merchant-level
+    auth token are loaded once and shared by the rest, which then run concurrently.
+    Agents that support it are run on the asyncio engine when ASYNC_AGENT_ENGINE is enabled.
+    :return: One outcome per account, in the order given.
+    """
+    if not user_infos:
+        return []
+    if settings.ASYNC_AGENT_ENGINE and agent_class.supports_async:
+        return asyncio.run(get_balances_and_publish_async(agent_class, scheme_slug, user_infos, tid))
+
+    max_workers = max_workers or settings.BULK_BALANCE_MAX_WORKERS
+    # each account publishes its transactions and status while it waits, on a pool of its own rather than the
+    # shared thread_pool_executor, so a bulk refresh neither queues behind nor holds up other requests
+    with ThreadPoolExecutor(
+        max_workers=max_workers * 2, thread_name_prefix=f"bulk-balance-publish-{scheme_slug}"
+    ) as publish_executor:
+        first, *rest = user_infos
+        outcomes = [_get_balance_outcome(agent_class, scheme_slug, first, tid, publish_executor)]
+        if rest:
+            with ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f"bulk-balance-{scheme_slug}"
+            ) as executor:
+                outcomes += executor.map(
+                    lambda user_info: _get_balance_outcome(agent_class, scheme_slug, user_info, tid, publish_executor),
+                    rest,
+                )
+    return outcomes
+
+
+def _get_balance_outcome(agent_class, scheme_slug, user_info, tid, executor):
+    outcome = {"scheme_account_id": user_info["scheme_account_id"], "balance": None, "error": None}
+    try:
+        outcome["balance"] = get_balance_and_publish(agent_class, scheme_slug, user_info, tid, executor=executor)
+        outcome["status"] = SchemeAccountStatus.ACTIVE if outcome["balance"] else None
+    except Exception as e:
+        _set_error_outcome(outcome, e)
+    return outcome
+
+
+def _set_error_outcome(outcome, exception):
+    """Fails only the account's outcome, whatever was raised, e.g. while publishing its transactions."""
+    error = exception if isinstance(exception, BaseError) else UnknownError(exception=exception)
+    log.warning(f"Bulk balance failed for scheme account {outcome['scheme_account_id']}: {error}")
+    outcome.update(status=error.code, error={"name": error.name, "message": error.message})
+
+
+async def get_balances_and_publish_async(agent_class, scheme_slug, user_infos, tid, max_concurrency=None):
+    """The asyncio counterpart of get_balances_and_publish, with at most `max_concurrency` accounts in flight."""
+    semaphore = asyncio.Semaphore(max_concurrency or settings.ASYNC_BULK_BALANCE_MAX_CONCURRENCY)
+
+    async def get_balance_outcome(user_info):
+        async with semaphore:
+            outcome = {"scheme_account_id": user_info["scheme_account_id"], "balance": None, "error": None}
+            try:
+                outcome["balance"] = await get_balance_and_publish_async(agent_class, scheme_slug, user_info, tid)
+                outcome["status"] = SchemeAccountStatus.ACTIVE if outcome["balance"] else None
+            except Exception as e:
+                _set_error_outcome(outcome, e)
+            return outcome
+
+    async with client_scope():
+        first, *rest = user_infos
+        outcomes = [await get_balance_outcome(first)]
+        outcomes += await asyncio.gather(*(get_balance_outcome(user_info) for user_info in rest))
+    return outcomes
+
+
 def async_get_balance_and_publish(agent_class, scheme_slug, user_info, tid):
     scheme_account_id = user_info["scheme_account_id"]
     try:
@@ -1,4 +1,9 @@
-from typing import Any, Type, cast
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, SimpleQueue
+from typing import Any, Optional, Type, cast
 
 import kombu
 import sentry_sdk
@@ -18,11 +23,39 @@ log = get_logger("task-consumer")
 
 
 class TaskConsumer(ConsumerMixin):
+    """
+    Consumes loyalty requests, running their handlers on worker threads so the consumer keeps taking messages
+    while a merchant is called. Card removals get their own pool, so slow merchants don't hold up join intake.
+
+    Up to `prefetch_count` messages are delivered before any is acknowledged. A message is acked once its handler
+    has finished; if the handler raises, it is requeued once and then rejected. Messages are only ever acked or
+    rejected on the consumer's thread, as channels aren't thread-safe, which waits at most `drain_timeout` seconds
+    for a delivery before settling the messages whose handlers have finished.
+    """
+
+    # how many requeued messages are remembered, so a message that fails again is rejected rather than requeued
+    max_requeued = 10_000
+
     loyalty_request_queue = kombu.Queue(settings.LOYALTY_REQUEST_QUEUE)
 
-    def __init__(self, connection: kombu.Connection) -> None:
+    def __init__(
+        self,
+        connection: kombu.Connection,
+        prefetch_count: int = settings.CONSUMER_PREFETCH_COUNT,
+        max_workers: int = settings.CONSUMER_MAX_WORKERS,
+        removal_max_workers: int = settings.CONSUMER_REMOVAL_MAX_WORKERS,
+        drain_timeout: float = settings.CONSUMER_DRAIN_TIMEOUT,
+    ) -> None:
         self.connection = connection
         self.dispatcher = MessageDispatcher()
+        self.prefetch_count = prefetch_count
+        self.drain_timeout = drain_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task-consumer")
+        self._removal_executor = ThreadPoolExecutor(
+            max_workers=removal_max_workers, thread_name_prefix="task-consumer-removal"
+        )
+        self._finished: SimpleQueue[tuple[kombu.Message, Optional[BaseException]]] = SimpleQueue()
+        self._requeued: OrderedDict[str, None] = OrderedDict()
 
         # When dispatching a new message add below a mapping to an on message receive method:
         self.dispatcher.connect(JoinApplication, self.on_join_application)
@@ -30,13 +63,75 @@ class TaskConsumer(ConsumerMixin):
 
     def get_consumers(self, Consumer: Type[kombu.Consumer], channel: Any) -> list[kombu.Consumer]:  # pragma: no cover
         log.debug(f"{Consumer} has been retrieved")
-        return [Consumer(queues=[self.loyalty_request_queue], callbacks=[self.on_message])]
+        return [
+            Consumer(
+                queues=[self.loyalty_request_queue], callbacks=[self.on_message], prefetch_count=self.prefetch_count
+            )
+        ]
 
-    def on_message(self, body: dict, message: kombu.Message) -> None:  # pragma: no cover
+    def consume(self, limit=None, timeout=None, safety_interval=None, **kwargs):
+        # drain_events waits up to safety_interval for a delivery, and once prefetch_count messages are unacked none
+        # arrive until they are settled, so a long wait would hold back the acks for the finished messages
+        if safety_interval is None:
+            safety_interval = self.drain_timeout
+        return super().consume(limit=limit, timeout=timeout, safety_interval=safety_interval, **kwargs)
+
+    def on_message(self, body: dict, message: kombu.Message) -> None:
         try:
-            self.dispatcher.dispatch(build_message(message.headers, body))
-        finally:
-            message.ack()
+            request = build_message(message.headers, body)
+        except Exception as e:
+            log.exception(f"Rejecting a message that can't be read: {repr(e)}")
+            message.reject()
+            return
+
+        executor = self._removal_executor if isinstance(request, LoyaltyCardRemoved) else self._executor
+        future = executor.submit(self.dispatcher.dispatch, request)
+        future.add_done_callback(lambda f: self._finished.put((message, f.exception())))
+
+    def on_iteration(self) -> None:
+        self.settle_finished_messages()
+
+    def on_consume_end(self, connection: kombu.Connection, channel: Any) -> None:
+        if self.should_stop:
+            # let running handlers finish so their messages can be acked before the channel closes
+            self._executor.shutdown(wait=True)
+            self._removal_executor.shutdown(wait=True)
+        self.settle_finished_messages()
+
+    def settle_finished_messages(self) -> None:
+        """Acks messages whose handler has finished, and requeues or rejects those whose handler raised."""
+        while True:
+            try:
+                message, exception = self._finished.get_nowait()
+            except Empty:
+                return
+
+            # the broker also redelivers the messages left unacked by a consumer that crashed, so a message's own
+            # failures are counted here rather than read from its redelivered flag
+            key = self._message_key(message)
+            try:
+                if exception is None:
+                    message.ack()
+                    self._requeued.pop(key, None)
+                elif key in self._requeued:
+                    log.error(f"Rejecting a message that failed again: {repr(exception)}")
+                    message.reject()
+                    del self._requeued[key]
+                else:
+                    log.warning(f"Requeueing a message that failed: {repr(exception)}")
+                    message.requeue()
+                    self._requeued[key] = None
+                    if len(self._requeued) > self.max_requeued:
+                        self._requeued.popitem(last=False)
+            except Exception as e:
+                # the channel was lost, so the broker will deliver the message again
+                log.warning(f"Failed to settle a message: {repr(e)}")
+
+    @staticmethod
+    def _message_key(message: kombu.Message) -> str:
+        """Identifies a message across deliveries, as its delivery tag changes each time it is delivered."""
+        content = json.dumps([message.headers, message.body], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
 
     def on_join_application(self, message: Message) -> None:
         message = cast(JoinApplication, message)
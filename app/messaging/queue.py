@@ -1,3 +1,9 @@
+import os
+import threading
+import typing as t
+from collections import deque
+from concurrent.futures import Future
+
 import kombu
 from olympus_messaging import Message
 
@@ -11,10 +17,91 @@ def _on_error(exc, interval):
     log.warning(f"Failed to connect to RabbitMQ: {exc}. Will retry after {interval:.1f}s...")
 
 
-def enqueue_request(message: Message) -> None:
-    with kombu.Connection(settings.AMQP_DSN) as conn:
-        conn.ensure_connection(
-            errback=_on_error, max_retries=3, interval_start=0.2, interval_step=0.4, interval_max=1, timeout=3
+class RequestProducer:
+    """
+    Publishes loyalty requests over one connection per process, kept open between requests and reopened by kombu
+    when it drops, so a request doesn't pay for an AMQP handshake. Publishes are confirmed by the broker before
+    they return.
+
+    A channel can only be used by one thread at a time, so requests made while another is being published are
+    queued and sent together, up to `max_batch_size` at a time, by whichever thread publishes next.
+    """
+
+    def __init__(
+        self,
+        url: str = settings.AMQP_DSN,
+        queue_name: str = settings.LOYALTY_REQUEST_QUEUE,
+        max_batch_size: int = settings.AMQP_PUBLISH_MAX_BATCH_SIZE,
+        timeout: float = settings.AMQP_PUBLISH_TIMEOUT,
+    ) -> None:
+        self.url = url
+        # the same entities as kombu's SimpleQueue, which requests used to be published with
+        exchange = kombu.Exchange(queue_name, type="direct")
+        self.queue = kombu.Queue(queue_name, exchange, queue_name)
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self._connection: t.Optional[kombu.Connection] = None
+        self._producer: t.Optional[kombu.Producer] = None
+        self._pid: t.Optional[int] = None
+        self._pending: deque[tuple[Message, Future]] = deque()
+        self._pending_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+    def publish(self, message: Message) -> None:
+        future: Future = Future()
+        with self._pending_lock:
+            self._pending.append((message, future))
+        while not future.done():
+            with self._publish_lock:
+                if not future.done():
+                    self._publish_batch()
+        future.result()
+
+    def close(self) -> None:
+        with self._publish_lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.release()
+            self._connection = self._producer = None
+
+    def _publish_batch(self) -> None:
+        with self._pending_lock:
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+        try:
+            publish = self._get_publish()
+            for message, future in batch:
+                publish(
+                    message.body,
+                    headers=message.metadata,
+                    exchange=self.queue.exchange,
+                    routing_key=self.queue.routing_key,
+                    declare=[self.queue],
+                    timeout=self.timeout,
+                )
+                future.set_result(None)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _get_publish(self) -> t.Callable[..., t.Any]:
+        # a forked worker must not share its parent's connection
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = kombu.Connection(self.url, transport_options={"confirm_publish": True})
+            self._producer = self._connection.Producer()
+            self._pid = os.getpid()
+        return self._connection.ensure(
+            self._producer,
+            t.cast(kombu.Producer, self._producer).publish,
+            errback=_on_error,
+            max_retries=3,
+            interval_start=0.2,
+            interval_step=0.4,
+            interval_max=1,
         )
-        q = conn.SimpleQueue(settings.LOYALTY_REQUEST_QUEUE)
-        q.put(message.body, headers=message.metadata)
+
+
+request_producer = RequestProducer()
+
+
+def enqueue_request(message: Message) -> None:
+    request_producer.publish(message)
@@ -15,6 +15,9 @@ class RetryTaskStatuses(Enum):
 
 class RetryTask(Base):
     __tablename__ = "retry_task"
+    __table_args__ = (
+        s.UniqueConstraint("scheme_account_id", "journey_type", name="retry_task_scheme_account_journey_key"),
+    )
     id = s.Column(s.Integer, primary_key=True)
     time_created = s.Column(s.DateTime(timezone=True), server_default=func.now())
     time_updated = s.Column(s.DateTime(timezone=True), onupdate=func.now())
@@ -22,9 +25,9 @@ class RetryTask(Base):
     request_data = s.Column(s.JSON, nullable=False)
     journey_type = s.Column(s.String, nullable=False)
     message_uid = s.Column(s.String, nullable=False, unique=True)
-    scheme_account_id = s.Column(s.Integer, nullable=False, unique=True)
+    scheme_account_id = s.Column(s.Integer, nullable=False)
     scheme_identifier = s.Column(s.String, nullable=False)
-    next_attempt_time = s.Column(s.DateTime, nullable=True)
+    next_attempt_time = s.Column(s.DateTime, nullable=True, index=True)
     status = s.Column(s.Enum(RetryTaskStatuses), nullable=False, default=RetryTaskStatuses.PENDING, index=True)
     callback_retries = s.Column(s.Integer, nullable=False, default=0)
     awaiting_callback = s.Column(s.Boolean, nullable=False, default=False)
@@ -0,0 +1,153 @@
+"""
+Process-wide cache of merchant OAuth access tokens
+"""
+import threading
+import time
+import typing as t
+from contextlib import contextmanager
+
+import redis.exceptions as redis_exceptions
+
+import settings
+from app.redis_pool import get_redis
+from app.reporting import get_logger
+
+log = get_logger("oauth-token-cache")
+
+
+class StoredToken(t.NamedTuple):
+    token: str
+    timestamp: int  # when the token was fetched, in seconds since the epoch
+
+
+class OAuthTokenCache:
+    """
+    Thread-safe cache of merchant-wide OAuth tokens keyed by scheme slug, in front of the token each agent keeps
+    in its UserTokenStore so that every account and every process for a merchant shares one token.
+
+    A token is served from memory until it is `timeout` seconds old. Once it is within `refresh_ahead` seconds of
+    that the cached token is still returned but a single background thread refreshes it, so requests don't wait on
+    the merchant's token endpoint. Fetching a token is single-flight: threads wait on a per-slug lock and, with
+    `distributed_lock` set, processes wait on a Redis lock, then use the token stored by whoever got there first.
+    """
+
+    def __init__(
+        self,
+        refresh_ahead: int = settings.OAUTH_TOKEN_REFRESH_AHEAD,
+        lock_timeout: float = settings.OAUTH_TOKEN_LOCK_TIMEOUT,
+    ):
+        self.refresh_ahead = refresh_ahead
+        self.lock_timeout = lock_timeout
+        self.distributed_lock = True
+        self._tokens: dict[str, StoredToken] = {}
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        scheme_slug: str,
+        timeout: int,
+        load: t.Callable[[], t.Optional[StoredToken]],
+        refresh: t.Callable[[], StoredToken],
+    ) -> str:
+        """
+        :param scheme_slug: e.g. 'iceland-bonus-card'
+        :param timeout: seconds a token can be used for, the agent's oauth_token_timeout
+        :param load: returns the token shared through Redis if it is still valid, otherwise None
+        :param refresh: fetches a new token from the merchant and shares it, returning it
+        """
+        now = time.time()
+        stored = self._tokens.get(scheme_slug)
+        if stored and now - stored.timestamp < timeout:
+            if now - stored.timestamp >= timeout - self.refresh_ahead:
+                self._refresh_in_background(scheme_slug, timeout, load, refresh, stale=stored)
+            return stored.token
+
+        with self._get_key_lock(scheme_slug):
+            # another thread may have fetched the token while we were waiting on the lock
+            stored = self._tokens.get(scheme_slug)
+            if stored and time.time() - stored.timestamp < timeout:
+                return stored.token
+
+            stored = load()
+            if stored is None:
+                with self._locked(scheme_slug):
+                    # another process may have refreshed the token while we were waiting on the lock
+                    stored = load() or refresh()
+            self._tokens[scheme_slug] = stored
+            return stored.token
+
+    def invalidate(self, scheme_slug: t.Optional[str] = None) -> None:
+        """Drops cached tokens from memory, for every merchant when no scheme slug is given."""
+        with self._lock:
+            if scheme_slug is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(scheme_slug, None)
+
+    def _get_key_lock(self, scheme_slug: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(scheme_slug, threading.Lock())
+
+    def _refresh_in_background(
+        self,
+        scheme_slug: str,
+        timeout: int,
+        load: t.Callable[[], t.Optional[StoredToken]],
+        refresh: t.Callable[[], StoredToken],
+        stale: StoredToken,
+    ) -> None:
+        key_lock = self._get_key_lock(scheme_slug)
+        if not key_lock.acquire(blocking=False):
+            # a fetch or refresh is already in flight for this merchant
+            return
+
+        def refresh_token() -> None:
+            try:
+                with self._locked(scheme_slug):
+                    stored = load()
+                    # only use the shared token if another process has already refreshed it
+                    if stored is None or stored.timestamp <= stale.timestamp:
+                        stored = refresh()
+                self._tokens[scheme_slug] = stored
+            except Exception as e:
+                # keep serving the cached token until it expires
+                log.warning(f"Failed to refresh the OAuth token for {scheme_slug}: {repr(e)}")
+            finally:
+                key_lock.release()
+
+        threading.Thread(target=refresh_token, name=f"oauth-token-refresh-{scheme_slug}", daemon=True).start()
+
+    @contextmanager
+    def _locked(self, scheme_slug: str) -> t.Iterator[None]:
+        """
+        Holds the merchant's Redis lock while fetching a token. If Redis can't be reached or the lock isn't
+        released in time the token is fetched anyway, as a duplicate fetch is better than failing the request.
+        """
+        if not self.distributed_lock:
+            yield
+            return
+
+        lock = get_redis().lock(
+            f"oauth-token-lock-{scheme_slug}", timeout=self.lock_timeout, blocking_timeout=self.lock_timeout
+        )
+        try:
+            acquired = lock.acquire()
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to take the OAuth token lock for {scheme_slug}: {repr(e)}")
+            acquired = False
+        else:
+            if not acquired:
+                log.warning(f"Timed out waiting on the OAuth token lock for {scheme_slug}")
+
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis_exceptions.RedisError as e:
+                    log.warning(f"Failed to release the OAuth token lock for {scheme_slug}: {repr(e)}")
+
+
+oauth_token_cache = OAuthTokenCache()
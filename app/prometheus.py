@@ -1,9 +1,9 @@
 import os
+import threading
 import typing as t
-from contextlib import contextmanager
 
 from blinker import signal
-from prometheus_client import Counter, Histogram, push_to_gateway
+from prometheus_client import Counter, Gauge, Histogram, push_to_gateway
 from prometheus_client.registry import REGISTRY
 
 import settings
@@ -12,6 +12,68 @@ from app.reporting import get_logger
 log = get_logger("prometheus-manager")
 
 
+class PrometheusPusher:
+    """
+    Pushes the metrics registry to the PushGateway every `interval` seconds from a background thread,
+    so recording a metric on the request path is only an in-memory update.
+    Metrics are pushed one last time on shutdown, see app.shutdown for the order this happens in.
+    """
+
+    push_timeout = 3  # PushGateway should be running in the same pod
+
+    def __init__(self, interval: float = settings.PROMETHEUS_PUSH_INTERVAL) -> None:
+        self.interval = interval
+        self._thread: t.Optional[threading.Thread] = None
+        self._thread_pid: t.Optional[int] = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._shut_down = False
+
+    def ensure_started(self) -> None:
+        # a forked worker inherits the thread object but not the running thread, so check the owning process
+        if not settings.PUSH_PROMETHEUS_METRICS or self._thread_pid == os.getpid() or self._shut_down:
+            return
+        with self._thread_lock:
+            if self._thread_pid == os.getpid() or self._shut_down:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="prometheus-pusher", daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def push(self) -> None:
+        if not settings.PUSH_PROMETHEUS_METRICS:
+            return
+        log.debug("Pushing metrics to the Prometheus push gateway.")
+        try:
+            push_to_gateway(
+                gateway=settings.PROMETHEUS_PUSH_GATEWAY,
+                job=settings.PROMETHEUS_JOB,
+                registry=REGISTRY,
+                grouping_key={"pid": str(os.getpid())},
+                timeout=self.push_timeout,
+            )
+        except Exception as e:
+            log.exception(str(e))
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """Stops the background thread for good and pushes the current metrics one last time."""
+        with self._thread_lock:
+            self._shut_down = True
+            self._stopping.set()
+            if self._thread and self._thread_pid == os.getpid():
+                self._thread.join(timeout=timeout)
+            self._thread_pid = None
+        self.push()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self.push()
+
+
+prometheus_pusher = PrometheusPusher()
+
+
 class PrometheusManager:
     def __init__(self) -> None:
         self.metric_types = self._get_metric_types()
@@ -24,6 +86,14 @@ class PrometheusManager:
         signal("callback-fail").connect(self.callback_fail)
         signal("request-fail").connect(self.request_fail)
         signal("request-success").connect(self.request_success)
+        signal("audit-export").connect(self.audit_export)
+        signal("record-publish-request").connect(self.record_publish_request)
+        signal("publish-queue-depth").connect(self.publish_queue_depth)
+        signal("publish-dropped").connect(self.publish_dropped)
+        signal("circuit-breaker-state").connect(self.circuit_breaker_state)
+        signal("db-pool-wait").connect(self.db_pool_wait)
+        signal("security-timing").connect(self.security_timing)
+        signal("security-key-cache").connect(self.security_key_cache)
 
     def log_in_success(self, sender: t.Union[object, str], slug: str) -> None:
         """
@@ -102,6 +172,16 @@ class PrometheusManager:
         labels = {"slug": slug, "channel": channel}
         self._increment_counter(counter=counter, increment_by=1, labels=labels)
 
+    def audit_export(self, sender: t.Union[object, str], outcome: str, count: int) -> None:
+        """
+        :param sender: Could be an agent, or a string description of who the sender is
+        :param outcome: What happened to the audit logs: 'sent', 'failed' or 'dropped'
+        :param count: The number of audit logs
+        """
+        counter = self.metric_types["counters"]["audit_logs_exported"]
+        labels = {"outcome": outcome}
+        self._increment_counter(counter=counter, increment_by=count, labels=labels)
+
     def record_http_request(
         self,
         sender: t.Union[object, str],
@@ -119,18 +199,87 @@ class PrometheusManager:
         """
 
         histogram = self.metric_types["histograms"]["request_latency"]
-        with self._prometheus_push_manager(
-            prometheus_push_gateway=settings.PROMETHEUS_PUSH_GATEWAY,
-            prometheus_job=settings.PROMETHEUS_JOB,
-        ):
-            histogram.labels(slug=slug, endpoint=endpoint, response_code=response_code).observe(latency)
+        histogram.labels(slug=slug, endpoint=endpoint, response_code=response_code).observe(latency)
+        prometheus_pusher.ensure_started()
+
+    def record_publish_request(
+        self,
+        sender: t.Union[object, str],
+        destination: str,
+        latency: t.Union[int, float],
+        response_code: int,
+    ) -> None:
+        """
+        :param sender: Could be a publisher, or a string description of who the sender is
+        :param destination: The service published to e.g. 'hades'
+        :param latency: HTTP request time in seconds
+        :param response_code: HTTP response code e.g 200, 500
+        """
+        histogram = self.metric_types["histograms"]["publish_latency"]
+        histogram.labels(destination=destination, response_code=response_code).observe(latency)
+        prometheus_pusher.ensure_started()
+
+    def publish_queue_depth(self, sender: t.Union[object, str], destination: str, queue_depth: int) -> None:
+        """
+        :param sender: Could be a publisher, or a string description of who the sender is
+        :param destination: The service published to e.g. 'hades'
+        :param queue_depth: The number of requests queued or running for the destination
+        """
+        gauge = self.metric_types["gauges"]["publish_queue_depth"]
+        gauge.labels(destination=destination).set(queue_depth)
+        prometheus_pusher.ensure_started()
+
+    def publish_dropped(self, sender: t.Union[object, str], destination: str) -> None:
+        """
+        :param sender: Could be a publisher, or a string description of who the sender is
+        :param destination: The service published to e.g. 'hades'
+        """
+        counter = self.metric_types["counters"]["publish_dropped"]
+        labels = {"destination": destination}
+        self._increment_counter(counter=counter, increment_by=1, labels=labels)
+
+    def circuit_breaker_state(self, sender: t.Union[object, str], slug: str, state: str) -> None:
+        """
+        :param sender: Could be a circuit breaker, or a string description of who the sender is
+        :param slug: The scheme slug
+        :param state: 'closed', 'open' or 'half-open'
+        """
+        gauge = self.metric_types["gauges"]["circuit_breaker_open"]
+        gauge.labels(slug=slug).set(0 if state == "closed" else 1)
+        prometheus_pusher.ensure_started()
+
+    def db_pool_wait(self, sender: t.Union[object, str], wait_time: float) -> None:
+        """
+        :param sender: Could be a connection pool, or a string description of who the sender is
+        :param wait_time: Seconds spent waiting for a Postgres connection from the pool
+        """
+        histogram = self.metric_types["histograms"]["db_pool_wait"]
+        histogram.observe(wait_time)
+        prometheus_pusher.ensure_started()
+
+    def security_timing(self, sender: t.Union[object, str], slug: str, operation: str, duration: float) -> None:
+        """
+        :param sender: Could be a security agent or key cache, or a string description of who the sender is
+        :param slug: The scheme slug
+        :param operation: 'key_load', 'sign' or 'verify'
+        :param duration: Seconds the operation took
+        """
+        histogram = self.metric_types["histograms"]["security_operation"]
+        histogram.labels(slug=slug, operation=operation).observe(duration)
+        prometheus_pusher.ensure_started()
+
+    def security_key_cache(self, sender: t.Union[object, str], slug: str, outcome: str) -> None:
+        """
+        :param sender: Could be a key cache, or a string description of who the sender is
+        :param slug: The scheme slug
+        :param outcome: 'hit' or 'miss'
+        """
+        counter = self.metric_types["counters"]["security_key_cache"]
+        self._increment_counter(counter=counter, increment_by=1, labels={"slug": slug, "outcome": outcome})
 
     def _increment_counter(self, counter: Counter, increment_by: t.Union[int, float], labels: t.Dict):
-        with self._prometheus_push_manager(
-            prometheus_push_gateway=settings.PROMETHEUS_PUSH_GATEWAY,
-            prometheus_job=settings.PROMETHEUS_JOB,
-        ):
-            counter.labels(**labels).inc(increment_by)
+        counter.labels(**labels).inc(increment_by)
+        prometheus_pusher.ensure_started()
 
     @staticmethod
     def _get_metric_types() -> t.Dict:
@@ -180,36 +329,59 @@ class PrometheusManager:
                     documentation="Incremental count of successful (not failed) HTTP requests from our system",
                     labelnames=("slug", "channel"),
                 ),
+                "audit_logs_exported": Counter(
+                    name="audit_logs_exported",
+                    documentation="Incremental count of audit logs sent to, failed to send to or dropped before Atlas",
+                    labelnames=("outcome",),
+                ),
+                "publish_dropped": Counter(
+                    name="publish_dropped",
+                    documentation=(
+                        "Incremental count of publishes to Hades or Hermes dropped because too many were in flight"
+                    ),
+                    labelnames=("destination",),
+                ),
+                "security_key_cache": Counter(
+                    name="security_key_cache",
+                    documentation="Incremental count of security keys found in or parsed into the process' cache",
+                    labelnames=("slug", "outcome"),
+                ),
             },
             "histograms": {
                 "request_latency": Histogram(
                     name="request_latency_seconds",
                     documentation="Request latency seconds",
                     labelnames=("slug", "endpoint", "response_code"),
-                )
+                ),
+                "publish_latency": Histogram(
+                    name="publish_latency_seconds",
+                    documentation="Latency seconds of requests publishing to Hades and Hermes",
+                    labelnames=("destination", "response_code"),
+                ),
+                "db_pool_wait": Histogram(
+                    name="db_pool_wait_seconds",
+                    documentation="Seconds spent waiting for a Postgres connection from the process' pool",
+                    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0),
+                ),
+                "security_operation": Histogram(
+                    name="security_operation_seconds",
+                    documentation="Seconds spent loading keys for, signing and verifying merchant requests",
+                    labelnames=("slug", "operation"),
+                    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+                ),
+            },
+            "gauges": {
+                "publish_queue_depth": Gauge(
+                    name="publish_queue_depth",
+                    documentation="Number of requests queued or running for Hades or Hermes",
+                    labelnames=("destination",),
+                ),
+                "circuit_breaker_open": Gauge(
+                    name="circuit_breaker_open",
+                    documentation="1 while requests to a merchant are failing fast or waiting on a probe, otherwise 0",
+                    labelnames=("slug",),
+                ),
             },
         }
 
         return metric_types
-
-    @staticmethod
-    @contextmanager
-    def _prometheus_push_manager(prometheus_push_gateway: str, prometheus_job: str):
-        push_timeout = 3  # PushGateway should be running in the same pod
-        grouping_key = {"pid": str(os.getpid())}
-
-        try:
-            yield
-        finally:
-            if settings.PUSH_PROMETHEUS_METRICS:
-                log.debug("Prometheus push manager started.")
-                try:
-                    push_to_gateway(
-                        gateway=prometheus_push_gateway,
-                        job=prometheus_job,
-                        registry=REGISTRY,
-                        grouping_key=grouping_key,
-                        timeout=push_timeout,
-                    )
-                except Exception as e:
-                    log.exception(str(e))
@@ -1,14 +1,37 @@
+import asyncio
 import json
-from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
 from copy import deepcopy
 from decimal import Decimal
+from functools import partial
 
+import httpx
+import requests
+from blinker import signal
 from requests_futures.sessions import FuturesSession
 
+from app.async_http import get_async_client
 from app.encoding import JsonEncoder
 from app.http_request import get_headers
 from app.reporting import get_logger
-from settings import HADES_URL, HERMES_URL, MAX_VALUE_LABEL_LENGTH
+from app.requests_retry import KeepAliveHTTPAdapter
+from settings import (
+    HADES_BATCH_MAX_LATENCY,
+    HADES_BATCH_MAX_SIZE,
+    HADES_BATCH_PUBLISH,
+    HADES_PUBLISH_MAX_WORKERS,
+    HADES_URL,
+    HERMES_PUBLISH_MAX_WORKERS,
+    HERMES_URL,
+    MAX_VALUE_LABEL_LENGTH,
+    PUBLISH_ENQUEUE_TIMEOUT,
+    PUBLISH_MAX_IN_FLIGHT,
+    PUBLISH_TIMEOUT,
+)
 
 thread_pool_executor = ThreadPoolExecutor(max_workers=3)
 units = ["k", "M", "B", "T"]
@@ -17,33 +40,338 @@ PENDING_BALANCE = {"points": Decimal(0), "value": Decimal(0), "value_label": "Pe
 
 log = get_logger("publisher")
 
+OnPublished = t.Callable[[], None]
+
 
 def log_errors(resp, *args, **kwargs):
     if not resp.ok:
         log.warning(f"Request to {resp.url} failed: {resp.status_code} {resp.reason}")
 
 
-def post(url, data, tid):
-    session = FuturesSession(executor=thread_pool_executor)
-    session.post(url, data=json.dumps(data, cls=JsonEncoder), headers=get_headers(tid), hooks={"response": log_errors})
+def call_when_published(future: Future | None, *callbacks: OnPublished | None) -> None:
+    """Calls `callbacks` from the publisher's thread once the request succeeds, and never if it was dropped."""
+    on_published = [callback for callback in callbacks if callback is not None]
+    if future is None or not on_published:
+        return
+
+    def done(f: Future) -> None:
+        if f.exception() is None and f.result().ok:
+            for callback in on_published:
+                try:
+                    callback()
+                except Exception as e:
+                    log.exception(f"Failed to record a publish: {repr(e)}")
+
+    future.add_done_callback(done)
+
+
+class Publisher:
+    """
+    Long-lived publisher for one destination service. Requests are sent from the publisher's own thread pool
+    over pooled keep-alive connections, so a slow Hades doesn't hold up status updates to Hermes.
+    At most `max_in_flight` requests are queued or running at once. Beyond that callers wait up to
+    `enqueue_timeout` seconds for one to complete, after which the publish is dropped and counted.
+    """
+
+    def __init__(
+        self,
+        destination: str,
+        max_workers: int,
+        max_in_flight: int,
+        timeout: float = PUBLISH_TIMEOUT,
+        enqueue_timeout: float = PUBLISH_ENQUEUE_TIMEOUT,
+    ) -> None:
+        self.destination = destination
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.enqueue_timeout = enqueue_timeout
+        self.queue_depth = 0
+        self._lock = threading.Lock()
+        self._queue_depth_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._session: FuturesSession | None = None
+        self._session_pid: int | None = None
+        self._pid = os.getpid()
+
+    def request(self, method: str, url: str, data, tid) -> Future | None:
+        with self._lock:
+            self._reset_after_fork()
+            in_flight = self._in_flight
+
+        if not in_flight.acquire(timeout=self.enqueue_timeout):
+            log.warning(f"Too many requests in flight to {self.destination}, dropping {method} to {url}")
+            signal("publish-dropped").send(self, destination=self.destination)
+            return None
+
+        self._update_queue_depth(1)
+        try:
+            # submit under the lock so a concurrent shutdown can't close the executor in between
+            with self._lock:
+                future = self._get_session().request(
+                    method,
+                    url,
+                    data=json.dumps(data, cls=JsonEncoder),
+                    headers=get_headers(tid),
+                    timeout=self.timeout,
+                    hooks={"response": [log_errors, self._record_latency]},
+                )
+        except Exception:
+            self._request_done(in_flight)
+            raise
+
+        future.add_done_callback(partial(self._on_done, in_flight))
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Waits for queued requests to be sent if `wait` is True. Publishing again starts a new thread pool."""
+        with self._lock:
+            session = self._session if self._session_pid == os.getpid() else None
+            self._session_pid = None
+        if session:
+            session.executor.shutdown(wait=wait)
+
+    def _reset_after_fork(self) -> None:
+        # requests in flight when the parent forked will never complete in this process
+        if self._pid != os.getpid():
+            self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+            self.queue_depth = 0
+            self._pid = os.getpid()
+
+    def _get_session(self) -> FuturesSession:
+        """Must be called holding the lock. A forked worker inherits the executor but not its threads."""
+        if self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = KeepAliveHTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"publish-{self.destination}"
+            )
+            self._session = FuturesSession(executor=executor, session=session)
+            self._session_pid = os.getpid()
+        return self._session  # type: ignore
+
+    def _record_latency(self, resp, *args, **kwargs) -> None:
+        signal("record-publish-request").send(
+            self,
+            destination=self.destination,
+            latency=resp.elapsed.total_seconds(),
+            response_code=resp.status_code,
+        )
+
+    def _on_done(self, in_flight: threading.BoundedSemaphore, future: Future) -> None:
+        self._request_done(in_flight)
+        if exc := future.exception():
+            log.warning(f"Request to {self.destination} failed: {repr(exc)}")
+
+    def _request_done(self, in_flight: threading.BoundedSemaphore) -> None:
+        in_flight.release()
+        self._update_queue_depth(-1)
+
+    def _update_queue_depth(self, change: int) -> None:
+        with self._queue_depth_lock:
+            self.queue_depth += change
+            queue_depth = self.queue_depth
+        signal("publish-queue-depth").send(self, destination=self.destination, queue_depth=queue_depth)
+
+
+hades_publisher = Publisher("hades", max_workers=HADES_PUBLISH_MAX_WORKERS, max_in_flight=PUBLISH_MAX_IN_FLIGHT)
+hermes_publisher = Publisher("hermes", max_workers=HERMES_PUBLISH_MAX_WORKERS, max_in_flight=PUBLISH_MAX_IN_FLIGHT)
+
+
+class HadesBatcher:
+    """
+    Write-behind batcher for Hades. Balances and transactions published by concurrent journeys are held for up to
+    `max_latency` seconds, or until `max_batch_size` items are waiting, and then sent from a background thread.
+    Transactions published with the same transaction id, e.g. by a bulk balance refresh, are sent in one request
+    under that id, though the transactions added together are never split across requests. Hades takes one balance
+    per request, so only the latest balance for each scheme account is sent. Once shut down, items are published
+    immediately.
+
+    The `on_published` callback given with items is called once Hades has accepted them, see call_when_published.
+    """
+
+    def __init__(self, publisher: Publisher, max_latency: float, max_batch_size: int) -> None:
+        self.publisher = publisher
+        self.max_latency = max_latency
+        self.max_batch_size = max_batch_size
+        self._balances: dict[int, tuple[dict, str, OnPublished | None]] = {}
+        self._transactions: list[tuple[list[dict], str, OnPublished | None]] = []
+        self._transaction_count = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._thread_pid: int | None = None
+        self._thread_lock = threading.Lock()
+        self._shut_down = False
+
+    def add_balance(self, balance_item: dict, tid, on_published: OnPublished | None = None) -> None:
+        if self._shut_down:
+            self._send_balance(balance_item, tid, on_published)
+            return
+
+        self._ensure_started()
+        with self._lock:
+            # a balance replaced before it was sent is never published, so its callback is dropped with it
+            self._balances[balance_item["scheme_account_id"]] = (balance_item, tid, on_published)
+            self._wake_if_full()
+        self._flush_if_shut_down()
+
+    def add_transactions(self, transactions_items: list[dict], tid, on_published: OnPublished | None = None) -> None:
+        if self._shut_down:
+            self._send_transactions(transactions_items, tid, [on_published])
+            return
+
+        self._ensure_started()
+        with self._lock:
+            self._transactions.append((transactions_items, tid, on_published))
+            self._transaction_count += len(transactions_items)
+            self._wake_if_full()
+        self._flush_if_shut_down()
+
+    def flush(self) -> None:
+        """Publishes everything currently held from the calling thread."""
+        with self._lock:
+            balances, self._balances = self._balances, {}
+            transactions, self._transactions = self._transactions, []
+            self._transaction_count = 0
+
+        for balance_item, tid, on_published in balances.values():
+            self._send_balance(balance_item, tid, on_published)
+
+        batches: dict[str, tuple[list[dict], list[OnPublished | None]]] = {}
+        for transactions_items, tid, on_published in transactions:
+            batch, callbacks = batches.setdefault(tid, ([], []))
+            batch.extend(transactions_items)
+            callbacks.append(on_published)
+            if len(batch) >= self.max_batch_size:
+                self._send_transactions(batch, tid, callbacks)
+                del batches[tid]
+        for tid, (batch, callbacks) in batches.items():
+            self._send_transactions(batch, tid, callbacks)
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """Stops the background thread and publishes everything still held."""
+        with self._thread_lock:
+            self._shut_down = True
+            self._stopping.set()
+            self._wakeup.set()
+            if self._thread and self._thread_pid == os.getpid():
+                self._thread.join(timeout=timeout)
+        self.flush()
+
+    def _flush_if_shut_down(self) -> None:
+        # shutdown may have flushed between the check in add_* and the item being added
+        if self._shut_down:
+            self.flush()
+
+    def _wake_if_full(self) -> None:
+        """Must be called holding the lock."""
+        if len(self._balances) + self._transaction_count >= self.max_batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        # a forked worker inherits the thread object but not the running thread, so check the owning process
+        if self._thread_pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._thread_pid == os.getpid() or self._shut_down:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="hades-batcher", daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.max_latency)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.exception(f"Failed to publish batch to Hades: {repr(e)}")
+
+    def _send_balance(self, balance_item: dict, tid, on_published: OnPublished | None) -> None:
+        future = self.publisher.request("post", "{}/balance".format(HADES_URL), balance_item, tid)
+        call_when_published(future, on_published)
+
+    def _send_transactions(self, transactions_items: list[dict], tid, callbacks: list[OnPublished | None]) -> None:
+        log.debug(f"Publishing {len(transactions_items)} transactions to Hades, transaction: {tid}")
+        future = self.publisher.request("post", "{}/transactions".format(HADES_URL), transactions_items, tid)
+        call_when_published(future, *callbacks)
+
+
+hades_batcher = HadesBatcher(hades_publisher, max_latency=HADES_BATCH_MAX_LATENCY, max_batch_size=HADES_BATCH_MAX_SIZE)
+
+
+def get_publisher(url: str) -> Publisher:
+    return hades_publisher if url.startswith(HADES_URL) else hermes_publisher
+
+
+def post(url, data, tid) -> Future | None:
+    return get_publisher(url).request("post", url, data, tid)
 
 
 def put(url, data, tid):
-    session = FuturesSession(executor=thread_pool_executor)
-    session.put(url, data=json.dumps(data, cls=JsonEncoder), headers=get_headers(tid), hooks={"response": log_errors})
-
-
-def send_balance_to_hades(balance_item: dict, tid: str) -> None:
+    get_publisher(url).request("put", url, data, tid)
+
+
+async def post_async(url, data, tid) -> bool:
+    """
+    The asyncio counterpart of post, sent over a pooled httpx client per destination.
+    Returns whether the request succeeded.
+    """
+    destination = get_publisher(url).destination
+    started_at = time.perf_counter()
+    try:
+        resp = await get_async_client(f"publish-{destination}").post(
+            url, content=json.dumps(data, cls=JsonEncoder), headers=get_headers(tid), timeout=PUBLISH_TIMEOUT
+        )
+    except httpx.HTTPError as e:
+        log.warning(f"Request to {destination} failed: {repr(e)}")
+        return False
+
+    if not resp.is_success:
+        log.warning(f"Request to {resp.url} failed: {resp.status_code} {resp.reason_phrase}")
+    signal("record-publish-request").send(
+        "publish", destination=destination, latency=time.perf_counter() - started_at, response_code=resp.status_code
+    )
+    return resp.is_success
+
+
+def send_balance_to_hades(balance_item: dict, tid: str, on_published: OnPublished | None = None) -> None:
+    item = _hades_balance_item(balance_item)
+    if HADES_BATCH_PUBLISH:
+        hades_batcher.add_balance(item, tid, on_published=on_published)
+    else:
+        call_when_published(post("{}/balance".format(HADES_URL), item, tid), on_published)
+
+
+async def send_balance_to_hades_async(balance_item: dict, tid: str, on_published: OnPublished | None = None) -> None:
+    item = _hades_balance_item(balance_item)
+    if HADES_BATCH_PUBLISH:
+        hades_batcher.add_balance(item, tid, on_published=on_published)
+    elif await post_async("{}/balance".format(HADES_URL), item, tid) and on_published:
+        # callbacks record what was published in Redis, so keep them off the event loop
+        await asyncio.to_thread(on_published)
+
+
+def _hades_balance_item(balance_item: dict) -> dict:
     item = deepcopy(balance_item)
 
     # hades can't handle vouchers
     if "vouchers" in item:
         del item["vouchers"]
 
-    post("{}/balance".format(HADES_URL), item, tid)
+    return item
 
 
-def transactions(transactions_items, scheme_account_id, user_set, tid):
+def transactions(transactions_items, scheme_account_id, user_set, tid, on_published: OnPublished | None = None):
+    """
+    :param on_published: called once Hades has accepted the transactions, which may be from another thread
+    """
     if not transactions_items:
         return None
 
@@ -51,15 +379,46 @@ def transactions(transactions_items, scheme_account_id, user_set, tid):
         transaction_item["scheme_account_id"] = scheme_account_id
         transaction_item["user_set"] = user_set
 
-    post("{}/transactions".format(HADES_URL), transactions_items, tid)
+    if HADES_BATCH_PUBLISH:
+        hades_batcher.add_transactions(transactions_items, tid, on_published=on_published)
+    else:
+        call_when_published(post("{}/transactions".format(HADES_URL), transactions_items, tid), on_published)
 
     return transactions_items
 
 
-def balance(balance_item, scheme_account_id, user_set, tid):
+async def transactions_async(
+    transactions_items, scheme_account_id, user_set, tid, on_published: OnPublished | None = None
+):
+    if not transactions_items:
+        return None
+
+    for transaction_item in transactions_items:
+        transaction_item["scheme_account_id"] = scheme_account_id
+        transaction_item["user_set"] = user_set
+
+    if HADES_BATCH_PUBLISH:
+        hades_batcher.add_transactions(transactions_items, tid, on_published=on_published)
+    elif await post_async("{}/transactions".format(HADES_URL), transactions_items, tid) and on_published:
+        await asyncio.to_thread(on_published)
+
+    return transactions_items
+
+
+def balance(balance_item, scheme_account_id, user_set, tid, on_published: OnPublished | None = None):
+    """
+    :param on_published: called once Hades has accepted the balance, which may be from another thread
+    """
     balance_item = create_balance_object(balance_item, scheme_account_id, user_set)
 
-    send_balance_to_hades(balance_item, tid)
+    send_balance_to_hades(balance_item, tid, on_published)
+    return balance_item
+
+
+async def balance_async(balance_item, scheme_account_id, user_set, tid, on_published: OnPublished | None = None):
+    balance_item = create_balance_object(balance_item, scheme_account_id, user_set)
+
+    await send_balance_to_hades_async(balance_item, tid, on_published)
     return balance_item
 
 
@@ -69,6 +428,12 @@ def status(scheme_account_id, status, tid, user_info, journey=None):
     return status
 
 
+async def status_async(scheme_account_id, status, tid, user_info, journey=None):
+    data = {"status": status, "journey": journey, "user_info": user_info}
+    await post_async("{}/schemes/accounts/{}/status".format(HERMES_URL, scheme_account_id), data, tid)
+    return status
+
+
 def zero_balance(scheme_account_id, user_id, tid):
     return balance(PENDING_BALANCE, scheme_account_id, user_id, tid)
 
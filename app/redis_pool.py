@@ -0,0 +1,71 @@
+"""
+Process-wide Redis connection pools shared by every Redis user in Midas
+"""
+import threading
+import typing as t
+
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+from redis import ConnectionPool, Redis
+from user_auth_token import UserTokenStore
+
+import settings
+
+_clients: dict[bool, Redis] = {}
+_clients_lock = threading.Lock()
+_user_token_store: t.Optional[UserTokenStore] = None
+
+
+def get_redis(decode_responses: bool = False) -> Redis:
+    """
+    Returns the process-wide client for REDIS_URL, creating it on first use. Clients are backed by one connection
+    pool per decode mode, holding up to REDIS_MAX_CONNECTIONS connections. Connections idle for longer than
+    REDIS_HEALTH_CHECK_INTERVAL seconds are checked with a PING before they are reused, and pools are recreated in
+    a child process after a fork.
+    """
+    with _clients_lock:
+        client = _clients.get(decode_responses)
+        if client is None:
+            pool = ConnectionPool.from_url(
+                settings.REDIS_URL,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+                socket_connect_timeout=3,
+                socket_keepalive=True,
+                retry_on_timeout=False,
+                decode_responses=decode_responses,
+            )
+            client = _clients[decode_responses] = Redis(connection_pool=pool)
+        return client
+
+
+def get_user_token_store() -> UserTokenStore:
+    """Returns the process-wide UserTokenStore, so agents don't each open their own connections to Redis."""
+    global _user_token_store
+    with _clients_lock:
+        if _user_token_store is None:
+            _user_token_store = UserTokenStore(settings.REDIS_URL)
+        return _user_token_store
+
+
+class RedisPoolCollector(Collector):
+    """Reports the connections of each pool when metrics are pushed."""
+
+    def collect(self) -> t.Iterator[GaugeMetricFamily]:
+        gauge = GaugeMetricFamily(
+            "redis_pool_connections",
+            "Number of connections in the process' Redis connection pools, by state",
+            labels=("decode_responses", "state"),
+        )
+        with _clients_lock:
+            pools = [(str(decode_responses), client.connection_pool) for decode_responses, client in _clients.items()]
+        for decode_responses, pool in pools:
+            in_use = len(getattr(pool, "_in_use_connections", ()))
+            idle = len(getattr(pool, "_available_connections", ()))
+            gauge.add_metric([decode_responses, "in_use"], in_use)
+            gauge.add_metric([decode_responses, "idle"], idle)
+            gauge.add_metric([decode_responses, "max"], pool.max_connections)
+        yield gauge
+
+
+REGISTRY.register(RedisPoolCollector())
@@ -1,15 +1,34 @@
 """
 Handle our persistence of the retry counts
 """
+import asyncio
+import typing as t
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from functools import wraps
 
 import redis.exceptions as redis_exceptions
 from redis import Redis
+from redis.client import Pipeline
 
 import settings
 from app.exceptions import ServiceConnectionError
+from app.redis_pool import get_redis
 
-redis = Redis.from_url(settings.REDIS_URL)
+redis = get_redis()
+
+# INCR never sets an expiry, so the increment and the TTL are applied together. A TTL is only set on keys that don't
+# have one, so a maxed out count keeps the expiry set by max_out_count.
+INC_COUNT_WITH_TTL = """
+local count = redis.call('INCR', KEYS[1])
+if redis.call('TTL', KEYS[1]) == -1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+_inc_count_with_ttl = redis.register_script(INC_COUNT_WITH_TTL)
+
+_pipeline: ContextVar[t.Optional[Pipeline]] = ContextVar("retry_count_pipeline", default=None)
 
 
 def redis_connection(func):
@@ -33,13 +52,52 @@ def get_count(key):
 
 @redis_connection
 def max_out_count(key, max_retries):
-    redis.setex(key, 60 * 15, max_retries)
+    _get_client().setex(key, 60 * 15, max_retries)
 
 
 @redis_connection
 def inc_count(key):
-    redis.incr(key)
+    _inc_count_with_ttl(keys=[key], args=[settings.RETRY_COUNT_TTL], client=_get_client())
 
 
 def get_key(agent, user_name):
     return "retry-{0}-{1}".format(agent, user_name).lower()
+
+
+@contextmanager
+def pipelined() -> t.Iterator[None]:
+    """
+    Queues the retry count writes made inside the block on one pipeline, which is sent to Redis in a single round
+    trip when the block exits, whether or not it raised.
+    """
+    pipe = redis.pipeline(transaction=False)
+    token = _pipeline.set(pipe)
+    try:
+        yield
+    finally:
+        _pipeline.reset(token)
+        _flush(pipe)
+
+
+@asynccontextmanager
+async def pipelined_async() -> t.AsyncIterator[None]:
+    """The asyncio counterpart of pipelined, which flushes the pipeline on a worker thread."""
+    pipe = redis.pipeline(transaction=False)
+    token = _pipeline.set(pipe)
+    try:
+        yield
+    finally:
+        _pipeline.reset(token)
+        await asyncio.to_thread(_flush, pipe)
+
+
+@redis_connection
+def _flush(pipe: Pipeline) -> None:
+    if len(pipe):
+        pipe.execute()
+
+
+def _get_client() -> Redis:
+    # an empty pipeline is falsy, so check for None
+    pipe = _pipeline.get()
+    return redis if pipe is None else pipe
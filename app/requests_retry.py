@@ -1,8 +1,79 @@
+import socket
+import threading
 import typing as t
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
+from urllib3.connection import HTTPConnection
+
+import settings
+
+KEEP_ALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, "TCP_KEEPIDLE"):  # not available on macOS
+    KEEP_ALIVE_SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, settings.HTTP_KEEP_ALIVE_IDLE))
+
+_pooled_adapters: dict[tuple, HTTPAdapter] = {}
+_pooled_adapters_lock = threading.Lock()
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that enables TCP keep-alive on its pooled connections so that idle connections to merchants
+    are not silently dropped by load balancers between requests.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + KEEP_ALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _make_retry(retries: int, backoff_factor: float, status_forcelist: t.Tuple) -> Retry:
+    return Retry(
+        total=retries,
+        read=retries,
+        connect=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=("PUT", "GET", "HEAD", "OPTIONS", "POST", "DELETE", "TRACE"),
+    )
+
+
+def get_pooled_adapter(
+    pool_key: str,
+    retries: int = 3,
+    backoff_factor: float = 0.3,
+    status_forcelist: t.Tuple = (500, 502, 504),
+) -> HTTPAdapter:
+    """
+    Returns the process-wide adapter for the given pool key (usually a scheme slug), creating it on first use.
+    Adapters hold a urllib3 PoolManager which keeps a connection pool per merchant host and is safe to share
+    between threads, so TCP and TLS connections are reused by every agent instance for that merchant.
+    A retry policy configured for the pool key in HTTP_RETRY_POLICIES overrides the given one.
+    """
+    policy = {"retries": retries, "backoff_factor": backoff_factor, "status_forcelist": status_forcelist}
+    policy.update(settings.HTTP_RETRY_POLICIES.get(pool_key, {}))
+    key = (pool_key, policy["retries"], policy["backoff_factor"], tuple(policy["status_forcelist"]))
+
+    with _pooled_adapters_lock:
+        adapter = _pooled_adapters.get(key)
+        if adapter is None:
+            adapter = KeepAliveHTTPAdapter(
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                max_retries=_make_retry(policy["retries"], policy["backoff_factor"], tuple(policy["status_forcelist"])),
+            )
+            _pooled_adapters[key] = adapter
+
+    return adapter
+
+
+def close_pooled_adapters() -> None:
+    """Closes every pooled connection and forgets the shared adapters."""
+    with _pooled_adapters_lock:
+        for adapter in _pooled_adapters.values():
+            adapter.close()
+        _pooled_adapters.clear()
 
 
 def requests_retry_session(
@@ -10,24 +81,23 @@ def requests_retry_session(
     backoff_factor: float = 0.3,
     status_forcelist: t.Tuple = (500, 502, 504),
     session: requests.Session | None = None,
+    pool_key: str | None = None,
 ) -> requests.Session:
     """
     Create a requests session with the given retry policy.
     This method will create a new session if an existing one is not provided.
+    If a pool key is given the session uses the shared connection pool for that key instead of its own,
+    see get_pooled_adapter.
     See urllib3.util.retry.Retry for more information about this functionality.
     """
     if session is None:
         session = requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-        allowed_methods=("PUT", "GET", "HEAD", "OPTIONS", "POST", "DELETE", "TRACE"),
-    )
 
-    adapter = HTTPAdapter(max_retries=retry)
+    if pool_key:
+        adapter = get_pooled_adapter(pool_key, retries, backoff_factor, status_forcelist)
+    else:
+        adapter = HTTPAdapter(max_retries=_make_retry(retries, backoff_factor, status_forcelist))
+
     session.mount("http://", adapter)
     session.mount("https://", adapter)
 
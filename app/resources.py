@@ -12,10 +12,10 @@ import settings
 from app import publish
 from app.agents.schemas import transaction_tuple_to_dict
 from app.encoding import JsonEncoder
-from app.encryption import AESCipher, get_aes_key
+from app.encryption import AESCipher, MultiKeyCipher, aes_keyring
 from app.exceptions import BaseError, UnknownError
 from app.journeys.common import agent_login, get_agent_class
-from app.journeys.view import async_get_balance_and_publish, get_balance_and_publish
+from app.journeys.view import async_get_balance_and_publish, get_balance_and_publish, get_balances_and_publish
 from app.messaging import queue
 from app.publish import thread_pool_executor
 from app.reporting import get_logger
@@ -116,6 +116,46 @@ class Balance(Resource):
         return prev_balance
 
 
+class BulkBalance(Resource):
+    """
+    Refreshes the balances of many scheme accounts for one scheme in a single request.
+    Expects a JSON body of {"accounts": [...]} where each account has the same fields as the balance
+    query parameters, and returns an outcome for each account rather than failing the whole request.
+    """
+
+    def post(self, scheme_slug) -> wrappers.Response:
+        accounts = (request.get_json(silent=True) or {}).get("accounts")
+        if not accounts or not isinstance(accounts, list):
+            abort(400, message='Please provide a list of "accounts"')
+        if len(accounts) > settings.BULK_BALANCE_MAX_ACCOUNTS:
+            abort(400, message=f"At most {settings.BULK_BALANCE_MAX_ACCOUNTS} accounts can be refreshed at once")
+
+        agent_class = get_agent_class(scheme_slug)
+        if agent_class.is_async:
+            abort(400, message="Bulk balance refreshes are not supported for async agents")
+
+        tid = request.headers.get("transaction")
+        aes = aes_keyring.get_cipher()
+        user_infos = []
+        invalid_outcomes = []
+        for account in accounts:
+            try:
+                user_infos.append(get_bulk_user_info(account, aes))
+                invalid_outcomes.append(None)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                invalid_outcomes.append(
+                    {
+                        "scheme_account_id": account.get("scheme_account_id") if isinstance(account, dict) else None,
+                        "balance": None,
+                        "status": None,
+                        "error": {"name": "Invalid account", "message": repr(e)},
+                    }
+                )
+
+        results = iter(get_balances_and_publish(agent_class, scheme_slug, user_infos, tid))
+        return create_response({"results": [outcome or next(results) for outcome in invalid_outcomes]})
+
+
 class Join(Resource):
     def post(self, scheme_slug) -> wrappers.Response:
         data = request.get_json()
@@ -238,11 +278,28 @@ class AgentQuestions(Resource):
         return agent.update_questions(questions)
 
 
-def decrypt_credentials(credentials) -> dict:
-    aes = AESCipher(get_aes_key("aes-keys"))
+def decrypt_credentials(credentials, aes: AESCipher | MultiKeyCipher | None = None) -> dict:
+    aes = aes or aes_keyring.get_cipher()
     return json.loads(aes.decrypt(credentials.replace(" ", "+")))
 
 
+def get_bulk_user_info(account: dict, aes: MultiKeyCipher) -> dict:
+    user_set = get_user_set_from_request(account)
+    if not user_set:
+        raise KeyError('Please provide either "user_set" or "user_id"')
+
+    status = account.get("status")
+    journey_type = account.get("journey_type")
+    return {
+        "credentials": decrypt_credentials(account["credentials"], aes),
+        "status": int(status) if status is not None else None,
+        "user_set": user_set,
+        "bink_user_id": account.get("bink_user_id"),
+        "journey_type": int(journey_type) if journey_type is not None else None,
+        "scheme_account_id": int(account["scheme_account_id"]),
+    }
+
+
 def create_response(response_data) -> wrappers.Response:
     response = make_response(json.dumps(response_data, cls=JsonEncoder), 200)
     response.headers["Content-Type"] = "application/json"
@@ -0,0 +1,127 @@
+"""
+Schedules retries from the retry_task table, so a task's next_attempt_time is the only record of when it runs
+"""
+import threading
+import typing as t
+from datetime import datetime
+
+from rq.registry import ScheduledJobRegistry
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+import settings
+from app import db
+from app.models import RetryTask, RetryTaskStatuses
+from app.reporting import get_logger
+from app.retry_util import enqueue_due_retry_task
+
+log = get_logger("retry-scheduler")
+
+
+class RetryScheduler:
+    """
+    Polls retry_task for tasks whose next_attempt_time is due and enqueues them on the midas-retry queue, where the
+    retry workers run them and handle_retry_task_request_error schedules the next attempt if they fail.
+
+    Due tasks are claimed `batch_size` at a time with SELECT ... FOR UPDATE SKIP LOCKED and their next_attempt_time
+    is cleared, so any number of retry workers can run a scheduler without a task being enqueued twice. A claimed
+    task that can't be enqueued gets its next_attempt_time back and is picked up again on a later poll.
+
+    Retries scheduled with rq's enqueue_at before the scheduler was enabled are removed from rq on every poll, as their
+    tasks' next_attempt_time was saved when they were scheduled, so they run once from here rather than from both.
+    """
+
+    def __init__(
+        self,
+        connection: t.Any,
+        interval: float = settings.RETRY_SCHEDULER_INTERVAL,
+        batch_size: int = settings.RETRY_SCHEDULER_BATCH_SIZE,
+    ) -> None:
+        self.connection = connection
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread: t.Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self.run, name="retry-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def run(self) -> None:
+        log.info("Starting retry scheduler...")
+        while not self._stopping.is_set():
+            try:
+                self.cancel_rq_scheduled_jobs()
+            except Exception as e:
+                log.warning(f"Failed to cancel retries scheduled with rq: {repr(e)}")
+            try:
+                dispatched = self.dispatch_due_tasks()
+            except Exception as e:
+                log.exception(f"Failed to dispatch due retry tasks: {repr(e)}")
+                dispatched = 0
+            # keep claiming while there is a backlog, otherwise wait for the next poll
+            if dispatched < self.batch_size:
+                self._stopping.wait(self.interval)
+
+    def cancel_rq_scheduled_jobs(self) -> int:
+        """Removes the retries still scheduled with rq, returning how many were removed."""
+        registry = ScheduledJobRegistry("midas-retry", connection=self.connection)
+        job_ids = registry.get_job_ids()
+        for job_id in job_ids:
+            registry.remove(job_id, delete_job=True)
+        if job_ids:
+            log.info(f"Cancelled {len(job_ids)} retries scheduled with rq, they will be dispatched by their tasks")
+        return len(job_ids)
+
+    def dispatch_due_tasks(self) -> int:
+        """Claims a batch of due tasks and enqueues them, returning how many were claimed."""
+        with db.session_scope() as session:
+            tasks = (
+                session.execute(
+                    select(RetryTask)
+                    .where(
+                        RetryTask.status.in_([RetryTaskStatuses.PENDING, RetryTaskStatuses.RETRYING]),
+                        RetryTask.next_attempt_time <= func.now(),
+                    )
+                    .order_by(RetryTask.next_attempt_time)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                .scalars()
+                .all()
+            )
+            claimed = [(task, task.next_attempt_time) for task in tasks]
+            for task in tasks:
+                task.next_attempt_time = None  # type: ignore
+            # keep the tasks' data for enqueueing once the claim is committed
+            session.flush()
+            session.expunge_all()
+
+        # the claim is committed before the jobs are enqueued, so a job never runs for a task another scheduler
+        # could still claim
+        for task, next_attempt_time in claimed:
+            self._dispatch(task, next_attempt_time)
+        return len(claimed)
+
+    def _dispatch(self, task: RetryTask, next_attempt_time: datetime) -> None:
+        try:
+            enqueue_due_retry_task(connection=self.connection, retry_task=task)
+        except Exception as e:
+            log.warning(f"Failed to enqueue retry task {task.id}, it will be retried on a later poll: {repr(e)}")
+            self._unclaim(task.id, next_attempt_time)
+        else:
+            log.debug(f"Enqueued retry task {task.id} due at {next_attempt_time}")
+
+    @staticmethod
+    def _unclaim(task_id: int, next_attempt_time: datetime) -> None:
+        with db.session_scope() as session:
+            task = session.get(RetryTask, task_id)
+            # the task may have been deleted, or rescheduled by a job, since it was claimed
+            if task is not None and task.next_attempt_time is None:
+                task.next_attempt_time = next_attempt_time
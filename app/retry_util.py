@@ -6,6 +6,7 @@ import rq
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
 
+import settings
 from app import db
 from app.models import RetryTask, RetryTaskStatuses
 from settings import DEFAULT_FAILURE_TTL
@@ -58,15 +59,14 @@ def create_task_with_delay(
 
 
 def get_task(db_session: Session, scheme_account_id: str, journey_type: str = "attempt-join") -> RetryTask:
-    return (
-        db_session.execute(
-            select(RetryTask).where(
-                RetryTask.scheme_account_id == scheme_account_id and RetryTask.journey_type == journey_type
-            )
+    """Looks up a task through the unique index on (scheme_account_id, journey_type)."""
+    return db_session.execute(
+        # pass each condition to where(): joined with Python's `and`, the first evaluates as false and is used alone
+        select(RetryTask).where(
+            RetryTask.scheme_account_id == scheme_account_id,
+            RetryTask.journey_type == journey_type,
         )
-        .unique()
-        .scalar_one()
-    )
+    ).scalar_one()
 
 
 def delete_task(db_session: Session, retry_task: RetryTask):
@@ -96,7 +96,7 @@ def reset_task_for_callback_attempt(
     retry_task.callback_retries += 1
     retry_task.attempts = 0
     retry_task.status = retry_status
-    retry_task.next_attempt_time = (next_attempt_time,)  # type: ignore
+    retry_task.next_attempt_time = next_attempt_time
     db_session.add(retry_task)
     db_session.commit()
     return retry_task
@@ -118,31 +118,33 @@ def fail_callback_task(db_session: Session, retry_task: RetryTask):
 
 
 def enqueue_retry_task_delay(*, connection: t.Any, args: list, delay_seconds: float, call_function: str):
-    q = rq.Queue("midas-retry", connection=connection)
+    """
+    Returns when the task should next be attempted, which the caller saves as the task's next_attempt_time. The job
+    is scheduled with rq unless RETRY_SCHEDULER_ENABLED is set, in which case app.retry_scheduler enqueues it once
+    the next_attempt_time is due.
+    """
     next_attempt_time = datetime.now(tz=timezone.utc) + timedelta(seconds=delay_seconds)
-    q.enqueue_at(
-        next_attempt_time,
-        call_function,
-        args=args,
-        failure_ttl=DEFAULT_FAILURE_TTL,
-        at_front=False,
-    )
+    if not settings.RETRY_SCHEDULER_ENABLED:
+        q = rq.Queue("midas-retry", connection=connection)
+        q.enqueue_at(
+            next_attempt_time,
+            call_function,
+            args=args,
+            failure_ttl=DEFAULT_FAILURE_TTL,
+            at_front=False,
+        )
     return next_attempt_time
 
 
 def enqueue_retry_login_task_delay(
     *, connection: t.Any, retry_task: RetryTask, delay_seconds: float, call_function: str
 ):
-    q = rq.Queue("midas-retry", connection=connection)
-    next_attempt_time = datetime.now(tz=timezone.utc) + timedelta(seconds=delay_seconds)
-    q.enqueue_at(
-        next_attempt_time,
-        call_function,
+    return enqueue_retry_task_delay(
+        connection=connection,
         args=[retry_task.request_data, retry_task.scheme_identifier, 5],
-        failure_ttl=DEFAULT_FAILURE_TTL,
-        at_front=False,
+        delay_seconds=delay_seconds,
+        call_function=call_function,
     )
-    return next_attempt_time
 
 
 def enqueue_retry_task(*, connection: t.Any, retry_task: RetryTask) -> rq.job.Job:
@@ -161,6 +163,20 @@ def enqueue_retry_task(*, connection: t.Any, retry_task: RetryTask) -> rq.job.Jo
     return job
 
 
+def enqueue_due_retry_task(*, connection: t.Any, retry_task: RetryTask) -> rq.job.Job:
+    """Enqueues a task claimed by app.retry_scheduler to run now, with the journey it was scheduled for."""
+    if retry_task.journey_type != "attempt-login":
+        return enqueue_retry_task(connection=connection, retry_task=retry_task)
+
+    q = rq.Queue("midas-retry", connection=connection)
+    return q.enqueue(
+        "app.journeys.join.login_and_publish_status",
+        args=[retry_task.request_data, retry_task.scheme_identifier, 5],
+        failure_ttl=DEFAULT_FAILURE_TTL,
+        at_front=False,
+    )
+
+
 def view_session(f: t.Callable) -> t.Callable:
     """A flask view decorator that creates a database session for use by the wrapped view."""
 
@@ -6,12 +6,16 @@ from app.exceptions import ValidationError
 class BaseSecurity:
     time_limit = 120
 
-    def __init__(self, credentials=None):
+    def __init__(self, credentials=None, scheme_slug=None, handler_type=None):
         """
         :param credentials: list if dicts e.g
         [{'type': 'bink_private_key', 'storage_key': 'vaultkey', 'value': 'keyvalue'}]
+        :param scheme_slug: slug of the scheme the credentials are configured for, used to cache parsed keys
+        :param handler_type: handler type the credentials are configured for, used to cache parsed keys
         """
         self.credentials = credentials
+        self.scheme_slug = scheme_slug
+        self.handler_type = handler_type
 
     def encode(self, *args, **kwargs):  # pragma: no cover
         """
@@ -19,6 +23,13 @@ class BaseSecurity:
         """
         raise NotImplementedError()
 
+    def reject(self, request_data):
+        """
+        Called when the merchant rejects a request signed by encode e.g. with a 401. Does nothing unless the agent
+        caches the credentials it signs with.
+        :param request_data: the dict returned by encode
+        """
+
     def decode(self, *args, **kwargs):  # pragma: no cover
         """
         :return: json string of payload
@@ -0,0 +1,76 @@
+"""
+Process-wide cache of parsed security agent keys
+"""
+import hashlib
+import threading
+import time
+import typing as t
+
+from blinker import signal
+from Crypto.PublicKey import RSA as CRYPTO_RSA
+from Crypto.Signature import pkcs1_15
+
+from app.config_cache import config_cache
+
+# (scheme slug, handler type, SHA-256 fingerprint of the key as configured)
+CacheKey = t.Tuple[t.Optional[str], t.Optional[int], str]
+
+
+class CachedRSAKey(t.NamedTuple):
+    key: CRYPTO_RSA.RsaKey
+    # a PKCS#1 v1.5 signer for a private key, or verifier for a public key; it holds no per-message state
+    scheme: t.Any
+
+
+class SecurityKeyCache:
+    """
+    Thread-safe cache of parsed keys and their signer/verifier objects, keyed by (scheme slug, handler type, key
+    fingerprint), so a burst of callbacks doesn't parse the same PEM for every request. Keying by fingerprint means
+    a key rotated in Vault is parsed as soon as its configuration is reloaded, and entries are dropped whenever the
+    configuration cache is invalidated for the slug and handler type.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[CacheKey, CachedRSAKey] = {}
+        self._lock = threading.Lock()
+
+    def get_rsa_key(self, scheme_slug: t.Optional[str], handler_type: t.Optional[int], pem: str) -> CachedRSAKey:
+        """
+        :param scheme_slug: e.g. 'iceland-bonus-card', or None for a security agent made without one
+        :param handler_type: a handler type from Configuration e.g. Configuration.JOIN_HANDLER
+        :param pem: the key as stored in the security credentials
+        """
+        key = (scheme_slug, handler_type, hashlib.sha256(pem.encode("utf8")).hexdigest())
+        entry = self._entries.get(key)
+        if entry is not None:
+            signal("security-key-cache").send(self, slug=scheme_slug or "", outcome="hit")
+            return entry
+
+        start = time.perf_counter()
+        rsa_key = CRYPTO_RSA.importKey(pem)
+        entry = CachedRSAKey(key=rsa_key, scheme=pkcs1_15.new(rsa_key))
+        signal("security-timing").send(
+            self, slug=scheme_slug or "", operation="key_load", duration=time.perf_counter() - start
+        )
+        signal("security-key-cache").send(self, slug=scheme_slug or "", outcome="miss")
+        with self._lock:
+            # threads parsing the same key at once produce equivalent entries, so the last one wins
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, scheme_slug: t.Optional[str] = None, handler_type: t.Optional[int] = None) -> None:
+        """
+        Drops cached keys. With no arguments the whole cache is cleared, with only a scheme slug every handler type
+        for that slug is dropped.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if scheme_slug is not None and key[0] != scheme_slug:
+                    continue
+                if handler_type is not None and key[1] != handler_type:
+                    continue
+                del self._entries[key]
+
+
+security_key_cache = SecurityKeyCache()
+config_cache.add_invalidation_listener(security_key_cache.invalidate)
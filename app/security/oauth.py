@@ -5,20 +5,29 @@ import sentry_sdk
 
 from app.exceptions import ConfigurationError, ServiceConnectionError
 from app.security.base import BaseSecurity
+from app.security.token_cache import security_token_cache
 
 
 class OAuth(BaseSecurity):
+    """
+    Signs requests with an OAuth client credentials token, shared through security_token_cache until it expires.
+    Callers should pass the signed request to reject if the merchant responds 401, so the token isn't used again.
+    """
+
     def encode(self, json_data):
         try:
             credentials = self.credentials["outbound"]["credentials"][0]["value"]
             url = credentials["url"]
-            resp = requests.post(url=url, data=credentials["payload"])
-            resp.raise_for_status()
-            response_json = resp.json()
 
+            def fetch_token():
+                resp = requests.post(url=url, data=credentials["payload"])
+                resp.raise_for_status()
+                return resp.json()
+
+            access_token = security_token_cache.get(url, credentials["payload"].get("client_id", ""), fetch_token)
             request_data = {
                 "json": json.loads(json_data),
-                "headers": {"Authorization": "{} {}".format(credentials["prefix"], response_json["access_token"])},
+                "headers": {"Authorization": "{} {}".format(credentials["prefix"], access_token)},
             }
         except requests.RequestException as e:
             sentry_sdk.capture_message("Failed request to get oauth token from {}. exception: {}".format(url, e))
@@ -27,3 +36,9 @@ class OAuth(BaseSecurity):
             raise ConfigurationError(exception=e) from e
 
         return request_data
+
+    def reject(self, request_data):
+        """Drops the token `request_data` was signed with, so the next encode fetches a new one."""
+        credentials = self.credentials["outbound"]["credentials"][0]["value"]
+        access_token = request_data["headers"]["Authorization"].removeprefix("{} ".format(credentials["prefix"]))
+        security_token_cache.reject(credentials["url"], credentials["payload"].get("client_id", ""), access_token)
@@ -1,17 +1,20 @@
 import base64
 import json
+import time
 
+from blinker import signal
 from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA as CRYPTO_RSA
-from Crypto.Signature import pkcs1_15
 
 from app.exceptions import ConfigurationError, ValidationError
 from app.security.base import BaseSecurity
+from app.security.key_cache import security_key_cache
 
 
 class RSA(BaseSecurity):
     """
     Generate and verify requests with an RSA signature.
+
+    Parsed keys and their signers/verifiers are shared through security_key_cache.
     """
 
     def encode(self, json_data):
@@ -21,10 +24,11 @@ class RSA(BaseSecurity):
         """
         json_data_with_timestamp, timestamp = self._add_timestamp(json_data)
 
-        key = CRYPTO_RSA.importKey(self._get_key("bink_private_key", self.credentials["outbound"]["credentials"]))
+        signer = self._get_cached_key("bink_private_key", self.credentials["outbound"]["credentials"]).scheme
+        start = time.perf_counter()
         digest = SHA256.new(json_data_with_timestamp.encode("utf8"))
-        signer = pkcs1_15.new(key)
         signature = base64.b64encode(signer.sign(digest)).decode("utf8")
+        self._record_timing("sign", start)
 
         encoded_request = {
             "json": json.loads(json_data),
@@ -59,17 +63,29 @@ class RSA(BaseSecurity):
 
         json_data_with_timestamp = "{}{}".format(json_data, timestamp)
         try:
-            key = CRYPTO_RSA.importKey(self._get_key("merchant_public_key", self.credentials["inbound"]["credentials"]))
+            verifier = self._get_cached_key("merchant_public_key", self.credentials["inbound"]["credentials"]).scheme
         except KeyError as e:
             raise ConfigurationError(exception=e) from e
 
+        start = time.perf_counter()
         digest = SHA256.new(json_data_with_timestamp.encode("utf8"))
-        signer = pkcs1_15.new(key)
         decoded_sig = base64.b64decode(signature)
 
         try:
-            signer.verify(digest, decoded_sig)
+            verifier.verify(digest, decoded_sig)
         except ValueError as e:
             raise ValidationError(exception=e) from e
+        finally:
+            self._record_timing("verify", start)
 
         return json_data
+
+    def _get_cached_key(self, key_type, credentials_list):
+        return security_key_cache.get_rsa_key(
+            self.scheme_slug, self.handler_type, self._get_key(key_type, credentials_list)
+        )
+
+    def _record_timing(self, operation, start):
+        signal("security-timing").send(
+            self, slug=self.scheme_slug or "", operation=operation, duration=time.perf_counter() - start
+        )
@@ -0,0 +1,199 @@
+"""
+Process-wide cache of the OAuth tokens used to sign outbound requests
+"""
+import json
+import threading
+import time
+import typing as t
+from contextlib import contextmanager
+
+import redis.exceptions as redis_exceptions
+
+import settings
+from app.redis_pool import get_redis
+from app.reporting import get_logger
+
+log = get_logger("security-token-cache")
+
+CacheKey = t.Tuple[str, str]  # (token url, client id)
+
+
+class CachedToken(t.NamedTuple):
+    access_token: str
+    expires_at: float  # in seconds since the epoch
+
+
+class MemoryTokenBackend:
+    """Keeps tokens in this process only."""
+
+    def get(self, key: CacheKey) -> t.Optional[CachedToken]:
+        return None
+
+    def set(self, key: CacheKey, token: CachedToken) -> None:
+        pass
+
+    def delete(self, key: CacheKey, access_token: str) -> None:
+        pass
+
+    @contextmanager
+    def lock(self, key: CacheKey) -> t.Iterator[None]:
+        yield
+
+
+class RedisTokenBackend(MemoryTokenBackend):
+    """
+    Shares tokens with other processes through Redis, where they expire with the token. Only one process fetches a
+    token at a time, holding a Redis lock for at most `lock_timeout` seconds. If Redis can't be reached the token is
+    fetched anyway, as a duplicate fetch is better than failing the request.
+
+    Tokens are stored in Redis unencrypted, so anyone who can read the Redis database can use them until they
+    expire. Only use this backend with a Redis that is restricted to Midas.
+    """
+
+    def __init__(self, lock_timeout: float = settings.SECURITY_TOKEN_LOCK_TIMEOUT) -> None:
+        self.lock_timeout = lock_timeout
+
+    def get(self, key: CacheKey) -> t.Optional[CachedToken]:
+        try:
+            value = get_redis().get(self._redis_key(key))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to get the shared OAuth token for {key[0]}: {repr(e)}")
+            return None
+        return CachedToken(**json.loads(value)) if value else None
+
+    def set(self, key: CacheKey, token: CachedToken) -> None:
+        ttl = int(token.expires_at - time.time())
+        if ttl <= 0:
+            return
+        try:
+            get_redis().set(self._redis_key(key), json.dumps(token._asdict()), ex=ttl)
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to share the OAuth token for {key[0]}: {repr(e)}")
+
+    def delete(self, key: CacheKey, access_token: str) -> None:
+        # leave a token another process has fetched since this one was rejected
+        token = self.get(key)
+        if token is None or token.access_token != access_token:
+            return
+        try:
+            get_redis().delete(self._redis_key(key))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to delete the shared OAuth token for {key[0]}: {repr(e)}")
+
+    @contextmanager
+    def lock(self, key: CacheKey) -> t.Iterator[None]:
+        lock = get_redis().lock(
+            f"{self._redis_key(key)}-lock", timeout=self.lock_timeout, blocking_timeout=self.lock_timeout
+        )
+        try:
+            acquired = lock.acquire()
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to take the OAuth token lock for {key[0]}: {repr(e)}")
+            acquired = False
+
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis_exceptions.RedisError as e:
+                    log.warning(f"Failed to release the OAuth token lock for {key[0]}: {repr(e)}")
+
+    @staticmethod
+    def _redis_key(key: CacheKey) -> str:
+        return "security-oauth-token:{}:{}".format(*key)
+
+
+class SecurityTokenCache:
+    """
+    Thread-safe cache of OAuth client credentials tokens keyed by (token url, client id), so that signing an
+    outbound request doesn't fetch a new token each time.
+
+    A token is used until `refresh_margin` seconds before the expiry given by its `expires_in`. Tokens without an
+    expiry are not cached. Fetching is single-flight: threads wait on a per-key lock and, with a shared backend,
+    processes wait on the backend's lock, then use the token fetched by whoever got there first.
+    """
+
+    def __init__(
+        self,
+        backend: t.Optional[MemoryTokenBackend] = None,
+        refresh_margin: int = settings.SECURITY_TOKEN_REFRESH_MARGIN,
+    ) -> None:
+        self.backend = backend or MemoryTokenBackend()
+        self.refresh_margin = refresh_margin
+        self._tokens: dict[CacheKey, CachedToken] = {}
+        self._key_locks: dict[CacheKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, client_id: str, fetch: t.Callable[[], dict]) -> str:
+        """
+        :param url: the token endpoint
+        :param client_id: the client the token is for
+        :param fetch: requests a token, returning the token endpoint's response JSON
+        """
+        key = (url, client_id)
+        token = self._tokens.get(key)
+        if self._is_valid(token):
+            return t.cast(CachedToken, token).access_token
+
+        with self._get_key_lock(key):
+            # another thread may have fetched the token while we were waiting on the lock
+            token = self._tokens.get(key)
+            if self._is_valid(token):
+                return t.cast(CachedToken, token).access_token
+
+            token = self.backend.get(key)
+            if not self._is_valid(token):
+                with self.backend.lock(key):
+                    # another process may have fetched the token while we were waiting on the lock
+                    token = self.backend.get(key)
+                    if not self._is_valid(token):
+                        token = self._fetch(key, fetch)
+            token = t.cast(CachedToken, token)
+            if token.expires_at:
+                self._tokens[key] = token
+            return token.access_token
+
+    def reject(self, url: str, client_id: str, access_token: str) -> None:
+        """
+        Drops `access_token` from memory and the backend once a merchant has rejected it e.g. with a 401, so the
+        next request fetches a new token rather than using a revoked one until it expires.
+        """
+        key = (url, client_id)
+        with self._get_key_lock(key):
+            token = self._tokens.get(key)
+            if token is not None and token.access_token == access_token:
+                del self._tokens[key]
+            self.backend.delete(key, access_token)
+
+    def invalidate(self, url: t.Optional[str] = None) -> None:
+        """Drops cached tokens from memory, for every token url when no url is given."""
+        with self._lock:
+            for key in list(self._tokens):
+                if url is None or key[0] == url:
+                    del self._tokens[key]
+
+    def _fetch(self, key: CacheKey, fetch: t.Callable[[], dict]) -> CachedToken:
+        fetched_at = time.time()
+        response_json = fetch()
+        expires_in = response_json.get("expires_in")
+        token = CachedToken(
+            access_token=response_json["access_token"],
+            expires_at=fetched_at + int(expires_in) if expires_in else 0,
+        )
+        if token.expires_at:
+            self.backend.set(key, token)
+        return token
+
+    def _is_valid(self, token: t.Optional[CachedToken]) -> bool:
+        return token is not None and time.time() < token.expires_at - self.refresh_margin
+
+    def _get_key_lock(self, key: CacheKey) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+
+security_token_cache = SecurityTokenCache(
+    backend=RedisTokenBackend() if settings.SECURITY_TOKEN_BACKEND == "redis" else MemoryTokenBackend()
+)
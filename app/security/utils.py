@@ -4,7 +4,7 @@ from importlib import import_module
 from flask import request
 from soteria import configuration
 
-import settings
+from app.config_cache import config_cache
 from app.exceptions import ConfigurationError, UnknownError
 from app.security import registry
 
@@ -44,16 +44,12 @@ def authorise(handler_type):
     def decorator(fn):
         def wrapper(*args, **kwargs):
             try:
-                config = configuration.Configuration(
-                    kwargs["scheme_slug"],
-                    handler_type,
-                    settings.VAULT_URL,
-                    settings.VAULT_TOKEN,
-                    settings.CONFIG_SERVICE_URL,
-                    settings.AZURE_AAD_TENANT_ID,
-                )
+                config = config_cache.get(kwargs["scheme_slug"], handler_type, configuration.Configuration)
                 security_agent = get_security_agent(
-                    config.security_credentials["inbound"]["service"], config.security_credentials
+                    config.security_credentials["inbound"]["service"],
+                    config.security_credentials,
+                    scheme_slug=kwargs["scheme_slug"],
+                    handler_type=handler_type,
                 )
 
                 decoded_data = json.loads(security_agent.decode(request.headers, request.get_data().decode("utf8")))
@@ -0,0 +1,23 @@
+"""
+Ordered shutdown of the background senders, registered to run at interpreter exit.
+"""
+import atexit
+
+from app.audit import audit_exporter
+from app.prometheus import prometheus_pusher
+from app.publish import hades_batcher, hades_publisher, hermes_publisher
+
+
+def shutdown_background_senders() -> None:
+    """
+    Publishes and audit exports record metrics as they finish, so they are flushed first and
+    the metrics are pushed last. Batched Hades items are handed to the Hades publisher before it shuts down.
+    """
+    hades_batcher.shutdown()
+    hades_publisher.shutdown()
+    hermes_publisher.shutdown()
+    audit_exporter.shutdown()
+    prometheus_pusher.shutdown()
+
+
+atexit.register(shutdown_background_senders)
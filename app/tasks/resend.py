@@ -1,10 +1,8 @@
 import importlib
 import json
 
-from redis import Redis
-
-import settings
 from app.api import celery
+from app.redis_pool import get_redis
 
 
 @celery.task
@@ -20,7 +18,7 @@ class ReTryTaskStore:
         self.task_list = task_list
         self.retry_name = retry_name
         self.retry_results = retry_results
-        self.storage = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.storage = get_redis(decode_responses=True)
 
     @property
     def length(self):
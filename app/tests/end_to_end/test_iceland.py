@@ -11,7 +11,7 @@ from soteria.configuration import Configuration
 from user_auth_token import UserTokenStore
 
 import settings
-from app.encryption import AESCipher, get_aes_key
+from app.encryption import MultiKeyCipher, get_aes_keys
 from app.urls import api
 
 
@@ -35,7 +35,7 @@ class EndpointURLS:
 class HermesRequest:
     # Request from Hermes
     encrypted_credentials = (
-        AESCipher(get_aes_key("aes-keys"))
+        MultiKeyCipher(get_aes_keys("aes-keys"))
         .encrypt(
             json.dumps(
                 {"card_number": "6332040030541927282", "last_name": "Jones", "postcode": "kt130bm", "consents": []}
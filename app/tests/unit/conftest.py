@@ -1,10 +1,21 @@
 import json
 from http import HTTPStatus
+from unittest import mock
 
 import httpretty
 import pytest
 
+import settings
 from app.api import create_app
+from app.audit import AuditExporter
+from app.circuit_breaker import reset_circuit_breakers
+from app.config_cache import config_cache
+from app.encryption import aes_keyring
+from app.oauth_token_cache import oauth_token_cache
+from app.publish import HadesBatcher
+from app.requests_retry import close_pooled_adapters
+from app.security.token_cache import security_token_cache
+from app.tests.unit.fixtures.in_memory_redis import InMemoryRedis
 
 
 @pytest.fixture
@@ -161,3 +172,76 @@ def redis_retry_pretty_fix(monkeypatch):
     monkeypatch.setattr("app.redis_retry.get_count", get_count)
     monkeypatch.setattr("app.redis_retry.inc_count", inc_count)
     monkeypatch.setattr("app.redis_retry.max_out_count", max_out_count)
+
+
+@pytest.fixture(autouse=True)
+def disable_config_cache(monkeypatch):
+    """
+    Tests mock the Configuration class per test, so make sure agents never share a configuration cached by a
+    previous test. Tests for the cache itself use their own ConfigurationCache instance.
+    """
+    monkeypatch.setattr(config_cache, "ttl", 0)
+
+
+@pytest.fixture(autouse=True)
+def in_memory_redis(monkeypatch):
+    """
+    Transaction watermarks and balance hashes are kept in Redis, so give each test an empty Redis of its own rather
+    than let it find what a previous test published.
+    """
+    redis = InMemoryRedis()
+    monkeypatch.setattr("app.transaction_watermarks.get_redis", lambda: redis)
+    monkeypatch.setattr("app.balance_changes.get_redis", lambda: redis)
+    return redis
+
+
+@pytest.fixture(autouse=True)
+def reload_aes_keys():
+    """Tests mock the AES keys per test, so don't let one test decrypt with keys loaded by a previous test."""
+    yield
+    aes_keyring.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def isolated_oauth_tokens(monkeypatch):
+    """
+    Don't let a token fetched or mocked by one test be used by the next, and don't take the Redis lock around
+    fetches. Tests for the cache itself use their own OAuthTokenCache instance.
+    """
+    monkeypatch.setattr(oauth_token_cache, "distributed_lock", False)
+    yield
+    oauth_token_cache.invalidate()
+    security_token_cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def reset_pooled_adapters():
+    """Don't let pooled connections opened while a test mocked the network leak into the next test."""
+    yield
+    close_pooled_adapters()
+
+
+@pytest.fixture(autouse=True)
+def close_circuit_breakers():
+    """Don't let failures mocked by one test open the circuit for the next test."""
+    yield
+    reset_circuit_breakers()
+
+
+@pytest.fixture(autouse=True)
+def isolated_background_senders(monkeypatch):
+    """
+    Audit logs and Hades batches are held in memory and sent from background threads, so give each test an exporter
+    and batcher of its own, sending to mocks, rather than let what one test queued be sent during the next. Tests that
+    assert on the requests to Atlas or Hades turn off AUDIT_EXPORT_ASYNC or HADES_BATCH_PUBLISH.
+    """
+    exporter = AuditExporter()
+    exporter.session = mock.MagicMock()
+    batcher = HadesBatcher(
+        mock.MagicMock(), max_latency=settings.HADES_BATCH_MAX_LATENCY, max_batch_size=settings.HADES_BATCH_MAX_SIZE
+    )
+    monkeypatch.setattr("app.audit.audit_exporter", exporter)
+    monkeypatch.setattr("app.publish.hades_batcher", batcher)
+    yield
+    batcher.shutdown()
+    exporter.shutdown()
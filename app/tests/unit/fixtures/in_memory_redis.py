@@ -0,0 +1,97 @@
+"""
+In-process stand-in for Redis, for tests and benchmarks that shouldn't share state through a real one
+"""
+import threading
+import time
+import typing as t
+
+
+class InMemoryRedis:
+    """The subset of redis.Redis used by app.redis_retry, balance changes and transaction watermarks, kept in a dict."""
+
+    def __init__(self) -> None:
+        self._values: dict[str, tuple[bytes, t.Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> t.Optional[bytes]:
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, None))
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: t.Any, ex: t.Optional[float] = None, px: t.Optional[int] = None) -> bool:
+        ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+        with self._lock:
+            self._values[key] = (str(value).encode(), time.monotonic() + ttl if ttl is not None else None)
+        return True
+
+    def setex(self, key: str, ttl: float, value: t.Any) -> bool:
+        return self.set(key, value, ex=ttl)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expires_at = self._values.get(key, (b"0", None))
+            count = int(value) + 1
+            self._values[key] = (str(count).encode(), expires_at)
+            return count
+
+    def evalsha(self, sha: str, numkeys: int, *keys_and_args: t.Any) -> int:
+        """Stands in for app.redis_retry's increment with TTL, the only script Midas runs."""
+        key, ttl = keys_and_args
+        with self._lock:
+            value, expires_at = self._values.get(key, (b"0", None))
+            count = int(value) + 1
+            self._values[key] = (str(count).encode(), expires_at or time.monotonic() + int(ttl))
+            return count
+
+    def register_script(self, script: str) -> t.Callable[..., int]:
+        """Stands in for app.balance_changes' RECORD_IF_UNCHANGED, the only script registered on a given client."""
+
+        def record_if_unchanged(keys: list[str], args: list[t.Any], client: t.Any = None) -> int:
+            [key], [expected, value, ttl] = keys, args
+            with self._lock:
+                current, expires_at = self._values.get(key, (b"", None))
+                if expires_at is not None and expires_at <= time.monotonic():
+                    current = b""
+                if current != str(expected).encode():
+                    return 0
+                self._values[key] = (str(value).encode(), time.monotonic() + int(ttl))
+                return 1
+
+        return record_if_unchanged
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryPipeline":
+        return InMemoryPipeline(self)
+
+    def exists(self, *keys: str) -> int:
+        return sum(self.get(key) is not None for key in keys)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._values.pop(key, None) is not None for key in keys)
+
+
+class InMemoryPipeline:
+    """Queues commands for an InMemoryRedis until they are executed, like redis.client.Pipeline."""
+
+    def __init__(self, redis: InMemoryRedis) -> None:
+        self._redis = redis
+        self._commands: list[t.Callable[[], t.Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def __getattr__(self, name: str) -> t.Callable[..., "InMemoryPipeline"]:
+        command = getattr(self._redis, name)
+
+        def queue(*args: t.Any, **kwargs: t.Any) -> "InMemoryPipeline":
+            self._commands.append(lambda: command(*args, **kwargs))
+            return self
+
+        return queue
+
+    def execute(self) -> list[t.Any]:
+        commands, self._commands = self._commands, []
+        return [command() for command in commands]
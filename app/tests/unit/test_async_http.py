@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.async_http import AsyncRetryError, client_scope, get_async_client, request_with_retries
+
+
+def test_get_async_client_shares_clients_per_pool_key_within_a_scope():
+    async def get_clients():
+        async with client_scope():
+            first = get_async_client("bpl-trenette")
+            assert get_async_client("bpl-trenette") is first
+            assert get_async_client("iceland-bonus-card") is not first
+        return first
+
+    assert asyncio.run(get_clients()).is_closed
+
+
+def test_get_async_client_outside_scope():
+    with pytest.raises(RuntimeError):
+        get_async_client("bpl-trenette")
+
+
+def test_request_with_retries_retries_status_forcelist():
+    statuses = iter([502, 500, 200])
+    transport = httpx.MockTransport(lambda request: httpx.Response(next(statuses)))
+
+    async def request():
+        async with client_scope(transport):
+            return await request_with_retries(
+                get_async_client("bpl-trenette"), "get", "https://bpl.test/", backoff_factor=0
+            )
+
+    assert asyncio.run(request()).status_code == 200
+
+
+def test_request_with_retries_raises_when_retries_are_exhausted():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(504)
+
+    async def request():
+        async with client_scope(httpx.MockTransport(handler)):
+            return await request_with_retries(
+                get_async_client("bpl-trenette"), "get", "https://bpl.test/", retries=2, backoff_factor=0
+            )
+
+    with pytest.raises(AsyncRetryError):
+        asyncio.run(request())
+    assert len(requests) == 3
+
+
+def test_request_with_retries_sends_string_data_as_content():
+    bodies = []
+
+    def handler(request):
+        bodies.append(request.content)
+        return httpx.Response(200)
+
+    async def request():
+        async with client_scope(httpx.MockTransport(handler)):
+            await request_with_retries(get_async_client("bpl-trenette"), "post", "https://bpl.test/", data='{"a": 1}')
+
+    asyncio.run(request())
+    assert bodies == [b'{"a": 1}']
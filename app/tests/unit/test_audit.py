@@ -1,7 +1,8 @@
 import json
 import logging
+import os
 import unittest
-from unittest.mock import ANY, Mock, patch
+from unittest.mock import ANY, MagicMock, Mock, patch
 from uuid import uuid4
 
 import arrow
@@ -10,6 +11,7 @@ import requests
 
 import settings
 from app.audit import (  # noqa
+    AuditExporter,
     AuditLogger,
     AuditLogType,
     RequestAuditLog,
@@ -27,6 +29,14 @@ def raise_exception(request, uri, headers):
     raise requests.exceptions.RequestException()
 
 
+def record_request(sent: list):
+    def callback(request, uri, headers):
+        sent.append(json.loads(request.body.decode("utf-8")))
+        return [200, headers, ""]
+
+    return callback
+
+
 class TestAudit(unittest.TestCase):
     def test_sanitise_sensitive_fields(self):
         payload = {
@@ -72,6 +82,7 @@ class TestAudit(unittest.TestCase):
         assert result == expected, "new payload should be sanitised"
         assert payload != result, "original payload should not be changed"
 
+    @patch("settings.AUDIT_EXPORT_ASYNC", False)
     @httpretty.activate
     def test_sending_to_atlas_excludes_sensitive_fields(self):
         httpretty.register_uri("POST", settings.ATLAS_URL + "/audit/membership/")
@@ -222,6 +233,7 @@ class TestAudit(unittest.TestCase):
 
         assert result is None
 
+    @patch("settings.AUDIT_EXPORT_ASYNC", False)
     @httpretty.activate
     def test_send_to_atlas_resp_not_ok(self):
         httpretty.register_uri("POST", settings.ATLAS_URL + "/audit/membership/", status=404)
@@ -247,6 +259,7 @@ class TestAudit(unittest.TestCase):
 
         assert "Error response from Atlas when sending audit logs" in captured.records[1].getMessage()
 
+    @patch("settings.AUDIT_EXPORT_ASYNC", False)
     @httpretty.activate
     def test_send_to_atlas_request_exception(self):
         httpretty.register_uri("POST", settings.ATLAS_URL + "/audit/membership/", body=raise_exception)
@@ -272,6 +285,92 @@ class TestAudit(unittest.TestCase):
 
         assert "Error sending audit logs to Atlas" in captured.records[1].getMessage()
 
+    @patch("app.audit.audit_exporter")
+    @patch("app.audit.post_audit_logs")
+    def test_send_to_atlas_async_uses_exporter(self, mock_post_audit_logs, mock_audit_exporter):
+        response_audit_log = ResponseAuditLog(
+            audit_log_type=AuditLogType.RESPONSE,
+            channel="bink",
+            membership_plan_slug="scheme_slug",
+            handler_type="join",
+            message_uid="message_uid_01",
+            record_uid="record_uid_01",
+            timestamp=arrow.utcnow().int_timestamp,
+            integration_service="integration_service",
+            payload={"value": "something"},
+            status_code=201,
+        )
+
+        with patch("settings.AUDIT_EXPORT_ASYNC", True):
+            AuditLogger().send_to_atlas(response_audit_log, {})
+
+        mock_audit_exporter.export.assert_called_once_with(serialize(response_audit_log, {}))
+        assert not mock_post_audit_logs.called
+
+    @httpretty.activate
+    def test_audit_exporter_flush_sends_batches(self):
+        sent = []
+        httpretty.register_uri("POST", settings.ATLAS_URL + "/audit/membership/", body=record_request(sent))
+        exporter = AuditExporter(max_queue_size=10, batch_size=2, flush_interval=0.1, enqueue_timeout=0)
+        for message_uid in range(3):
+            exporter.queue.put({"message_uid": message_uid})
+
+        exporter.flush()
+
+        assert sent == [
+            {"audit_logs": [{"message_uid": 0}, {"message_uid": 1}]},
+            {"audit_logs": [{"message_uid": 2}]},
+        ]
+        assert exporter.queue.empty()
+
+    @patch("app.audit.signal")
+    def test_audit_exporter_drops_logs_when_queue_is_full(self, mock_signal):
+        exporter = AuditExporter(max_queue_size=1, batch_size=10, flush_interval=10, enqueue_timeout=0)
+        with patch.object(exporter, "_ensure_started"):
+            exporter.export({"message_uid": 1})
+            exporter.export({"message_uid": 2})
+
+        assert exporter.queue.qsize() == 1
+        mock_signal.assert_called_with("audit-export")
+        mock_signal.return_value.send.assert_called_once_with(exporter, outcome="dropped", count=1)
+        assert exporter.queue.get_nowait() == {"message_uid": 1}
+
+    @httpretty.activate
+    def test_audit_exporter_sends_queued_logs_on_shutdown(self):
+        sent = []
+        httpretty.register_uri("POST", settings.ATLAS_URL + "/audit/membership/", body=record_request(sent))
+        exporter = AuditExporter(max_queue_size=10, batch_size=10, flush_interval=0.05, enqueue_timeout=0)
+
+        exporter.export({"message_uid": 1})
+        exporter.shutdown()
+
+        assert sent == [{"audit_logs": [{"message_uid": 1}]}]
+        assert exporter.queue.empty()
+
+    @httpretty.activate
+    def test_audit_exporter_sends_synchronously_after_shutdown(self):
+        sent = []
+        httpretty.register_uri("POST", settings.ATLAS_URL + "/audit/membership/", body=record_request(sent))
+        exporter = AuditExporter(max_queue_size=10, batch_size=10, flush_interval=0.05, enqueue_timeout=0)
+        exporter.shutdown()
+
+        exporter.export({"message_uid": 1})
+
+        assert sent == [{"audit_logs": [{"message_uid": 1}]}]
+        assert exporter._thread is None
+
+    def test_audit_exporter_shutdown_does_not_flush_while_thread_is_running(self):
+        exporter = AuditExporter(max_queue_size=10, batch_size=10, flush_interval=0.05, enqueue_timeout=0)
+        exporter._thread = MagicMock()
+        exporter._thread.is_alive.return_value = True
+        exporter._thread_pid = os.getpid()
+
+        with patch.object(exporter, "flush") as mock_flush:
+            exporter.shutdown(timeout=0)
+
+        exporter._thread.join.assert_called_once_with(timeout=0)
+        assert not mock_flush.called
+
     @patch("app.audit.sanitise_rpc")
     @patch("app.audit.sanitise_json")
     def test_correct_sanitise_method_called_when_rpc(self, mock_sanitise_json, mock_sanitise_rpc):
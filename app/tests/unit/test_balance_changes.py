@@ -0,0 +1,138 @@
+from unittest import mock
+
+import pytest
+import redis.exceptions as redis_exceptions
+
+from app.agents.schemas import Balance
+from app.balance_changes import BalanceChangeDetector, balance_changes
+from app.exceptions import UnknownError
+from app.journeys.view import get_balance_and_publish
+from app.scheme_account import SchemeAccountStatus
+
+BALANCE_ITEM = {"points": 10, "value": 10, "value_label": "£10", "reward_tier": 0, "vouchers": []}
+
+
+def test_content_hash_covers_balance_status_and_journey():
+    content_hash = BalanceChangeDetector.content_hash(BALANCE_ITEM, "1", SchemeAccountStatus.ACTIVE, None)
+
+    assert content_hash == BalanceChangeDetector.content_hash(dict(BALANCE_ITEM), "1", SchemeAccountStatus.ACTIVE, None)
+    assert content_hash != BalanceChangeDetector.content_hash(
+        {**BALANCE_ITEM, "points": 11}, "1", SchemeAccountStatus.ACTIVE, None
+    )
+    assert content_hash != BalanceChangeDetector.content_hash(
+        {**BALANCE_ITEM, "vouchers": [{"state": "issued"}]}, "1", SchemeAccountStatus.ACTIVE, None
+    )
+    assert content_hash != BalanceChangeDetector.content_hash(BALANCE_ITEM, "1", SchemeAccountStatus.ACTIVE, "join")
+
+
+def test_record_published():
+    detector = BalanceChangeDetector(mode="heartbeat", republish_interval=60)
+    assert detector.last_published(1) is None
+
+    detector.record_published(1, "hash-1", None)
+    assert detector.last_published(1) == "hash-1"
+    assert detector.last_published(2) is None
+
+    detector.record_published(1, "hash-2", "hash-1")
+    assert detector.last_published(1) == "hash-2"
+
+
+def test_record_published_keeps_a_newer_hash():
+    detector = BalanceChangeDetector(mode="heartbeat", republish_interval=60)
+    # two refreshes compare against no hash, and the second is accepted by Hades first
+    detector.record_published(1, "hash-2", None)
+
+    detector.record_published(1, "hash-1", None)
+
+    assert detector.last_published(1) == "hash-2"
+
+
+def test_unchanged_balance_is_republished_after_interval(in_memory_redis):
+    detector = BalanceChangeDetector(mode="heartbeat", republish_interval=60)
+    detector.record_published(1, "hash-1", None)
+
+    with mock.patch(
+        "app.tests.unit.fixtures.in_memory_redis.time.monotonic",
+        return_value=in_memory_redis._values["balance-hash-1"][1],
+    ):
+        assert detector.last_published(1) is None
+
+
+def test_forget():
+    detector = BalanceChangeDetector(mode="heartbeat", republish_interval=60)
+    detector.record_published(1, "hash-1", None)
+
+    detector.forget(1)
+    assert detector.last_published(1) is None
+    # a publish confirmed after the account was forgotten doesn't restore it
+    detector.record_published(1, "hash-2", "hash-1")
+    assert detector.last_published(1) is None
+
+
+@mock.patch("app.balance_changes.get_redis")
+def test_balance_is_changed_without_redis(mock_get_redis):
+    mock_get_redis.return_value.get.side_effect = redis_exceptions.ConnectionError
+    mock_get_redis.return_value.register_script.return_value.side_effect = redis_exceptions.ConnectionError
+    detector = BalanceChangeDetector(mode="heartbeat", republish_interval=60)
+
+    assert detector.last_published(1) is None
+    detector.record_published(1, "hash-1", None)
+
+
+@pytest.mark.parametrize("mode,status_publishes", [("heartbeat", 2), ("skip", 1)])
+@mock.patch("app.journeys.view.publish_transactions")
+@mock.patch("app.journeys.view.publish")
+@mock.patch("app.journeys.view.agent_login")
+def test_unchanged_balance_is_not_published_again(
+    mock_agent_login, mock_publish, mock_publish_transactions, mode, status_publishes, monkeypatch
+):
+    monkeypatch.setattr(balance_changes, "mode", mode)
+    mock_agent_login.return_value.identifier = None
+    mock_agent_login.return_value.create_journey = None
+    mock_agent_login.return_value.balance.return_value = Balance(points=10, value=10, value_label="£10")
+    user_info = {"scheme_account_id": 1, "user_set": "1", "status": SchemeAccountStatus.ACTIVE}
+
+    get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+    mock_publish.balance.call_args.kwargs["on_published"]()
+    get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+
+    assert mock_publish.balance.call_count == 1
+    assert mock_publish.create_balance_object.call_count == 1
+    assert mock_publish.status.call_count == status_publishes
+    assert mock_publish_transactions.call_count == 2
+
+
+@mock.patch("app.journeys.view.publish_transactions")
+@mock.patch("app.journeys.view.publish")
+@mock.patch("app.journeys.view.agent_login")
+def test_failed_refresh_forgets_balance(mock_agent_login, mock_publish, mock_publish_transactions, monkeypatch):
+    monkeypatch.setattr(balance_changes, "mode", "skip")
+    mock_agent_login.return_value.identifier = None
+    mock_agent_login.return_value.create_journey = None
+    mock_agent_login.return_value.balance.return_value = Balance(points=10, value=10, value_label="£10")
+    user_info = {"scheme_account_id": 1, "user_set": "1", "status": SchemeAccountStatus.ACTIVE}
+
+    get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+    mock_publish.balance.call_args.kwargs["on_published"]()
+    mock_agent_login.return_value.balance.side_effect = ValueError
+    with pytest.raises(UnknownError):
+        get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+    mock_agent_login.return_value.balance.side_effect = None
+    get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+
+    assert mock_publish.balance.call_count == 2
+
+
+@mock.patch("app.journeys.view.publish_transactions")
+@mock.patch("app.journeys.view.publish")
+@mock.patch("app.journeys.view.agent_login")
+def test_balance_is_published_again_until_hades_accepts_it(mock_agent_login, mock_publish, mock_publish_transactions):
+    mock_agent_login.return_value.identifier = None
+    mock_agent_login.return_value.create_journey = None
+    mock_agent_login.return_value.balance.return_value = Balance(points=10, value=10, value_label="£10")
+    user_info = {"scheme_account_id": 1, "user_set": "1", "status": SchemeAccountStatus.ACTIVE}
+
+    get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+    get_balance_and_publish("agent-class", "slug", dict(user_info), "tid")
+
+    assert mock_publish.balance.call_count == 2
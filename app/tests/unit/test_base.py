@@ -1,3 +1,4 @@
+from decimal import Decimal
 from http import HTTPStatus
 from unittest import TestCase, mock
 from urllib.parse import urljoin
@@ -8,7 +9,16 @@ import pytest
 from soteria.configuration import Configuration
 
 from app.agents.base import BaseAgent, create_error_response
-from app.exceptions import EndSiteDownError, GeneralError, IPBlockedError, StatusLoginFailedError, UnknownError
+from app.agents.schemas import Transaction
+from app.circuit_breaker import CircuitState, get_circuit_breaker
+from app.exceptions import (
+    EndSiteDownError,
+    GeneralError,
+    IPBlockedError,
+    NotSentError,
+    StatusLoginFailedError,
+    UnknownError,
+)
 from app.scheme_account import JourneyTypes
 
 
@@ -30,6 +40,34 @@ class TestBase(TestCase):
             base_agent = BaseAgent(0, user_info, Configuration.JOIN_HANDLER, "test-agent")
         return base_agent
 
+    def test_hash_transactions(self):
+        # Hades deduplicates transactions by hash, so these must never change
+        transactions = [
+            Transaction(date=arrow.get("2022-03-01T10:30:00+00:00"), description="Coffee", points=Decimal("5.50")),
+            Transaction(date=arrow.get("2022-03-01T10:30:00+00:00"), description="Coffee", points=Decimal("5.50")),
+            Transaction(
+                date=arrow.get("2022-03-02T12:00:00+00:00"),
+                description="Lunch",
+                points=Decimal("-2"),
+                location="London",
+                value=Decimal("10.00"),
+            ),
+            Transaction(date="2022-03-03 09:00:00", description="Breakfast", points=Decimal("1")),
+        ]
+
+        hashed_transactions = self.mock_base_agent().hash_transactions(transactions)
+
+        self.assertEqual(
+            [tx.hash for tx in hashed_transactions],
+            [
+                "e6bd418dc145dc6948b979069010d008",
+                "f498ccb73c8a91a988c73921aa11fc0e",
+                "dd9a438a9dcffe6d3017cb9764938e7b",
+                "d6236e1785e6bd6a93e9fa2a6231ef50",
+            ],
+        )
+        self.assertEqual([tx._replace(hash=None) for tx in hashed_transactions], transactions)
+
     @mock.patch("app.agents.base.Configuration")
     @mock.patch.object(BaseAgent, "join")
     def test_attempt_join(self, mocked_join, mock_config):
@@ -93,6 +131,21 @@ class TestBase(TestCase):
         # THEN
         mock_signal.assert_has_calls(expected_calls)
 
+    @httpretty.activate
+    @mock.patch("app.requests_retry.Retry")
+    def test_make_request_fails_fast_once_the_circuit_is_open(self, mock_retry):
+        m = self.mock_base_agent()
+        api_url = "http://fake.com/api/Contact/AddMemberNumber"
+        httpretty.register_uri(httpretty.GET, api_url, status=HTTPStatus.BAD_GATEWAY)
+        breaker = get_circuit_breaker(m.scheme_slug)
+
+        for _ in range(breaker.failure_threshold):
+            self.assertRaises(EndSiteDownError, m.make_request, api_url, method="get")
+
+        self.assertEqual(breaker.state, CircuitState.OPEN)
+        self.assertRaises(NotSentError, m.make_request, api_url, method="get")
+        self.assertEqual(len(httpretty.latest_requests()), breaker.failure_threshold)
+
     @httpretty.activate
     @mock.patch("app.agents.base.signal", autospec=True)
     def test_make_request_fail_with_loginerror_calls_signals(self, mock_signal):
@@ -284,6 +337,45 @@ class TestBase(TestCase):
         self.assertEqual("Unknown error", e.exception.name)
         self.assertEqual(520, e.exception.code)
 
+    @mock.patch.object(BaseAgent, "get_auth_url_and_payload", return_value=("https://merchant/token", {}))
+    @mock.patch.object(BaseAgent, "_refresh_token", return_value="merchant-token")
+    def test_oauth_token_is_shared_by_accounts_of_the_same_merchant(self, mock_refresh_token, mock_auth_url):
+        first_agent = self.mock_base_agent()
+        second_agent = self.mock_base_agent()
+        second_agent.scheme_id = 195
+        for agent in (first_agent, second_agent):
+            agent.oauth_token_timeout = 3599
+            agent.token_store = mock.MagicMock(NoSuchToken=KeyError)
+            agent.token_store.get.side_effect = KeyError
+
+        first_agent._oauth_authentication()
+        second_agent._oauth_authentication()
+
+        mock_refresh_token.assert_called_once()
+        first_agent.token_store.set.assert_called_once_with(scheme_account_id="test-agent", token=mock.ANY)
+        self.assertEqual(second_agent.headers["Authorization"], "Bearer merchant-token")
+
+    @mock.patch("app.agents.base.requests_retry_session")
+    @mock.patch.object(BaseAgent, "get_auth_url_and_payload", return_value=("https://merchant/token", {"id": "1"}))
+    def test_oauth_token_refresher_leaves_the_agent_alone(self, mock_auth_url, mock_retry_session):
+        agent = self.mock_base_agent()
+        agent.token_store = mock.MagicMock()
+        agent.session = mock.MagicMock()
+        agent.headers = {"Authorization": "Bearer old-token", "Secondary-Key": "key"}
+        mock_retry_session.return_value.post.return_value.json.return_value = {"access_token": "new-token"}
+
+        refresh = agent._token_refresher()
+        # the agent carries on while the cache refreshes the token on another thread
+        agent.headers = {"Content-Type": "application/json"}
+        stored = refresh()
+
+        self.assertEqual(stored.token, "new-token")
+        mock_retry_session.return_value.post.assert_called_once_with(
+            "https://merchant/token", data={"id": "1"}, headers={"Secondary-Key": "key"}
+        )
+        agent.session.post.assert_not_called()
+        self.assertEqual(agent.headers, {"Content-Type": "application/json"})
+
     def test_token_store_legacy_token_with_timestamp_as_list(self):
         """
         Some old Iceland tokens stored in the redis cache contained a timestamp value in a list
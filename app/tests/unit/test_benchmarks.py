@@ -0,0 +1,77 @@
+import json
+from types import SimpleNamespace
+
+from benchmarks.hash_transactions import run_benchmark
+from benchmarks.run import compare
+from benchmarks.stages import StageTimer, load_stage_durations, percentile, summarise
+from app.tests.unit.fixtures.in_memory_redis import InMemoryRedis
+
+
+def make_result(throughput=100.0, p95=10.0, p99=20.0, errors=0):
+    return {"throughput": throughput, "latency": {"p95": p95, "p99": p99}, "errors": errors}
+
+
+def test_percentile():
+    values = [0.5, 0.1, 0.3, 0.2, 0.4]
+    assert percentile(values, 50) == 0.3
+    assert percentile(values, 99) == 0.5
+    assert percentile(values, 1) == 0.1
+    assert percentile([], 50) == 0.0
+
+
+def test_summarise_reports_milliseconds():
+    summary = summarise([0.001, 0.002, 0.003])
+    assert summary == {"count": 3, "mean": 2.0, "p50": 2.0, "p95": 3.0, "p99": 3.0, "max": 3.0}
+
+
+def test_compare_with_baseline():
+    baseline = make_result()
+    assert compare(make_result(throughput=85, p95=11.9, p99=23), baseline, max_regression=0.2) == []
+
+    regressions = compare(make_result(throughput=70, p95=13, p99=30, errors=1), baseline, max_regression=0.2)
+    assert len(regressions) == 4
+
+
+def test_stage_timer_wraps_each_owner(tmp_path):
+    first = SimpleNamespace(balance=lambda: "first")
+    second = SimpleNamespace(balance=lambda: "second")
+    timer = StageTimer()
+
+    timer.wrap("agent.balance", [first, second], "balance")
+
+    assert first.balance() == "first"
+    assert second.balance() == "second"
+    timer.dump(tmp_path / "1.json")
+    (tmp_path / "2.json").write_text(json.dumps({"agent.balance": [0.5], "hades.http": [0.1]}))
+    durations = load_stage_durations(tmp_path)
+    assert len(durations["agent.balance"]) == 3
+    assert durations["hades.http"] == [0.1]
+
+
+def test_in_memory_redis():
+    redis = InMemoryRedis()
+    assert redis.get("retry-key") is None
+    assert redis.incr("retry-key") == 1
+    redis.setex("max-key", 60, 3)
+    assert redis.get("max-key") == b"3"
+    redis.set("expired-key", "open", px=-1)
+    assert redis.exists("max-key", "expired-key") == 1
+    assert redis.delete("max-key") == 1
+
+
+def test_in_memory_redis_pipeline():
+    redis = InMemoryRedis()
+    pipe = redis.pipeline(transaction=False)
+    pipe.evalsha("sha", 1, "retry-key", 60)
+    pipe.setex("max-key", 60, 3)
+    assert len(pipe) == 2 and redis.get("retry-key") is None
+
+    assert pipe.execute() == [1, True]
+    assert redis.get("retry-key") == b"1"
+    assert len(pipe) == 0
+
+
+def test_hash_transactions_benchmark_checks_hashes_match():
+    result = run_benchmark(transaction_count=20, repeat=2)
+
+    assert result["current"]["count"] == result["legacy"]["count"] == 2
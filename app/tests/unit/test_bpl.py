@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import json
 from decimal import Decimal
@@ -8,14 +9,18 @@ from urllib.parse import urljoin
 
 import arrow
 import httpretty
+import httpx
 from flask_testing import TestCase
 
 import settings
 from app.agents.bpl import Bpl
 from app.api import create_app  # noqa
+from app.async_http import client_scope
 from app.bpl_callback import JoinCallbackBpl  # noqa
-from app.exceptions import GeneralError, StatusLoginFailedError
-from app.models import RetryTask
+from app.circuit_breaker import get_circuit_breaker
+from app.error_handler import handle_request_exception
+from app.exceptions import EndSiteDownError, GeneralError, NotSentError, StatusLoginFailedError
+from app.models import RetryTask, RetryTaskStatuses
 from app.vouchers import VoucherState, voucher_state_names
 
 data = {
@@ -126,6 +131,64 @@ class TestBplCallback(TestCase):
         self.assertEqual(balance.value, Decimal("0.1"))
         self.assertEqual(balance.vouchers[0].value, Decimal("0.1"))
 
+    def test_balance_async(self):
+        response_data = {
+            "UUID": "54a259f2-3602-4cc8-8f57-7839de7e5700",
+            "account_number": "TRNT9288336436",
+            "current_balances": [{"value": 0.1, "campaign_slug": "mocked-trenette-active-campaign"}],
+            "transaction_history": [],
+            "pending_rewards": [],
+            "rewards": [],
+        }
+        requests = []
+
+        def handler(request):
+            requests.append((request.method, str(request.url)))
+            return httpx.Response(HTTPStatus.OK, json=response_data if request.method == "GET" else None)
+
+        async def balance():
+            async with client_scope(httpx.MockTransport(handler)):
+                return await self.bpl.balance_async()
+
+        balance = asyncio.run(balance())
+
+        self.assertEqual(balance.value, Decimal("0.1"))
+        self.assertEqual(
+            requests,
+            [
+                ("GET", f"{self.bpl.base_url}54a259f2-3602-4cc8-8f57-1239de7e5700?tx_qty=5"),
+                ("PUT", urljoin(settings.HERMES_URL, "schemes/accounts/1/credentials")),
+            ],
+        )
+        self.assertEqual(self.bpl.identifier["merchant_identifier"], "54a259f2-3602-4cc8-8f57-7839de7e5700")
+
+    def test_login_async_error(self):
+        self.bpl.credentials.pop("merchant_identifier")
+
+        def handler(request):
+            return httpx.Response(HTTPStatus.NOT_FOUND, json={"code": "NO_ACCOUNT_FOUND"})
+
+        async def login():
+            async with client_scope(httpx.MockTransport(handler)):
+                await self.bpl.login_async()
+
+        with self.assertRaises(StatusLoginFailedError):
+            asyncio.run(login())
+
+    def test_login_async_transport_error_is_retryable(self):
+        self.bpl.credentials.pop("merchant_identifier")
+        self.bpl.max_retries = 0
+
+        def handler(request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+        async def login():
+            async with client_scope(httpx.MockTransport(handler)):
+                await self.bpl.login_async()
+
+        with self.assertRaises(EndSiteDownError):
+            asyncio.run(login())
+
     @httpretty.activate
     def test_vouchers(self):
         url = f"{self.bpl.base_url}54a259f2-3602-4cc8-8f57-1239de7e5700"
@@ -219,6 +282,37 @@ class TestBplCallback(TestCase):
         )
         self.assertEqual({"method": "post", "audit": True, "json": bpl_payload}, mock_make_request.call_args.kwargs)
 
+    @httpretty.activate
+    @mock.patch("app.error_handler.update_task_for_retry")
+    @mock.patch("app.error_handler.enqueue_retry_task_delay", return_value=arrow.utcnow())
+    @mock.patch("app.error_handler.get_task")
+    @mock.patch("app.agents.bpl.get_task")
+    def test_join_with_circuit_open_is_retried(
+        self, mock_bpl_get_task, mock_get_task, mock_enqueue_retry, mock_update_task_for_retry
+    ):
+        httpretty.register_uri(httpretty.POST, f"{self.bpl.base_url}enrolment", status=HTTPStatus.ACCEPTED)
+        mock_get_task.return_value = RetryTask(attempts=0, journey_type="attempt-join", request_data={})
+        breaker = get_circuit_breaker(self.bpl.scheme_slug)
+
+        # as if another process had opened the circuit
+        with mock.patch.object(breaker, "_is_open_in_redis", return_value=True):
+            with self.assertRaises(NotSentError) as e:
+                self.bpl.join()
+
+        self.assertEqual(httpretty.latest_requests(), [])
+        mock_bpl_get_task.assert_not_called()
+        handle_request_exception(
+            mock.MagicMock(),
+            connection=mock.MagicMock(),
+            backoff_base=3,
+            max_retries=3,
+            job=mock.MagicMock(args=[1]),
+            exc_value=e.exception,
+            retryable_exceptions=[NotSentError],
+        )
+        mock_enqueue_retry.assert_called_once()
+        self.assertEqual(mock_update_task_for_retry.call_args.kwargs["retry_status"], RetryTaskStatuses.RETRYING)
+
 
 class TestBPLAdd(TestCase):
     def create_app(self):
@@ -0,0 +1,148 @@
+from unittest import mock
+
+import pytest
+
+from app.circuit_breaker import AIMDLimiter, CircuitBreaker, CircuitState, get_circuit_breaker, reset_circuit_breakers
+from app.exceptions import EndSiteDownError, NotSentError, StatusLoginFailedError
+
+
+def make_breaker(**kwargs):
+    options = {
+        "failure_threshold": 2,
+        "reset_timeout": 30,
+        "slow_call_seconds": 10,
+        "min_concurrency": 1,
+        "max_concurrency": 4,
+        "shared": False,
+    }
+    options.update(kwargs)
+    return CircuitBreaker("bpl-trenette", **options)
+
+
+def fail(breaker, error=EndSiteDownError):
+    with pytest.raises(error):
+        with breaker.guard():
+            raise error()
+
+
+def test_circuit_opens_after_consecutive_failures_and_fails_fast():
+    breaker = make_breaker()
+    fail(breaker)
+    assert breaker.state is CircuitState.CLOSED
+    fail(breaker)
+    assert breaker.state is CircuitState.OPEN
+
+    sent = mock.MagicMock()
+    with pytest.raises(NotSentError) as e:
+        with breaker.guard():
+            sent()
+    sent.assert_not_called()
+    # there is no response for agents to read an error code from
+    assert e.value.exception.response is None
+
+
+def test_merchant_responses_reset_the_failure_count():
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker, error=StatusLoginFailedError)
+    fail(breaker)
+
+    assert breaker.state is CircuitState.CLOSED
+
+
+def test_slow_responses_count_as_failures():
+    breaker = make_breaker(slow_call_seconds=0)
+    for _ in range(2):
+        with breaker.guard():
+            pass
+
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_half_open_probe_closes_the_circuit():
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+
+    with mock.patch("app.circuit_breaker.time.monotonic", return_value=breaker._opened_at + 31):
+        with breaker.guard():
+            assert breaker.state is CircuitState.HALF_OPEN
+            # only the probe is let through while half-open
+            with pytest.raises(NotSentError):
+                with breaker.guard():
+                    pass
+
+    assert breaker.state is CircuitState.CLOSED
+
+
+def test_failed_half_open_probe_reopens_the_circuit():
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+
+    with mock.patch("app.circuit_breaker.time.monotonic", return_value=breaker._opened_at + 31):
+        fail(breaker)
+
+    assert breaker.state is CircuitState.OPEN
+    with pytest.raises(NotSentError):
+        with breaker.guard():
+            pass
+
+
+def test_requests_over_the_concurrency_limit_fail_fast():
+    breaker = make_breaker(max_concurrency=1)
+    with breaker.guard():
+        with pytest.raises(NotSentError):
+            with breaker.guard():
+                pass
+
+    assert breaker.limiter.in_flight == 0
+
+
+def test_aimd_limiter():
+    limiter = AIMDLimiter(min_limit=1, max_limit=8)
+    assert limiter.try_acquire()
+    limiter.release(healthy=False)
+    assert limiter.limit == 4
+    limiter.try_acquire()
+    limiter.release(healthy=True)
+    assert limiter.limit == 4.25
+    limiter.try_acquire()
+    limiter.release(healthy=None)
+    assert limiter.limit == 4.25
+
+    for _ in range(5):
+        limiter.release(healthy=False)
+    assert limiter.limit == 1
+
+
+def test_shared_circuit_is_opened_in_redis():
+    breaker = make_breaker(shared=True)
+    with mock.patch("app.circuit_breaker.get_redis") as mock_get_redis:
+        mock_redis = mock_get_redis.return_value
+        mock_redis.exists.return_value = 0
+        fail(breaker)
+        fail(breaker)
+
+    mock_redis.set.assert_called_once_with("circuit-breaker-open-bpl-trenette", "open", px=30000)
+
+
+def test_circuit_opened_by_another_process_fails_fast():
+    breaker = make_breaker(shared=True)
+    with mock.patch("app.circuit_breaker.get_redis") as mock_get_redis:
+        mock_redis = mock_get_redis.return_value
+        mock_redis.exists.return_value = 1
+        with pytest.raises(NotSentError):
+            with breaker.guard():
+                pass
+
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_get_circuit_breaker_is_per_slug():
+    breaker = get_circuit_breaker("bpl-trenette")
+    assert get_circuit_breaker("bpl-trenette") is breaker
+    assert get_circuit_breaker("the-works") is not breaker
+
+    reset_circuit_breakers()
+    assert get_circuit_breaker("bpl-trenette") is not breaker
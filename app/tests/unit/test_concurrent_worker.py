@@ -0,0 +1,146 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from app.concurrent_worker import ConcurrentWorker, JobWorker, get_job_slug
+
+
+def make_job(func_name="app.journeys.join.attempt_join", args=(1, "tid", "bpl-trenette", {})):
+    job = mock.MagicMock(func_name=func_name, args=list(args), origin="midas-retry", timeout=None)
+    job.id = f"job-{id(job)}"
+    return job
+
+
+@pytest.fixture
+def worker():
+    worker = ConcurrentWorker(queues=["midas-retry"], connection=mock.MagicMock(), concurrency=3, slug_concurrency=2)
+    worker.set_state = mock.MagicMock()
+    yield worker
+    worker._executor.shutdown(wait=True)
+
+
+def test_get_job_slug():
+    assert get_job_slug(make_job()) == "bpl-trenette"
+    assert get_job_slug(make_job("app.journeys.join.login_and_publish_status", ({}, "slim-chickens", 5))) == (
+        "slim-chickens"
+    )
+    assert get_job_slug(make_job("app.journeys.join.attempt_join", ())) is None
+    assert get_job_slug(make_job("app.tasks.other", ("bpl-trenette",))) is None
+
+
+def wait_for_jobs(worker):
+    """Waits for every running and deferred job to finish, as the worker does before it deregisters."""
+    with mock.patch("rq.worker.Worker.teardown"):
+        worker.teardown()
+
+
+def test_jobs_run_concurrently_up_to_the_merchant_limit(worker):
+    queue = mock.MagicMock()
+    jobs = [make_job(), make_job(), make_job(), make_job(args=(2, "tid", "iceland-bonus-card", {}))]
+
+    release = threading.Event()
+    started = []
+
+    def perform_job(job, queue):
+        started.append(job)
+        release.wait(timeout=5)
+        return True
+
+    with mock.patch.object(worker, "_perform_job", side_effect=perform_job):
+        # only three threads, so deferring the third bpl-trenette job frees a slot for the fourth
+        for job in jobs:
+            assert worker._slots.acquire(timeout=5)
+            worker.execute_job(job, queue)
+
+        assert worker._deferred_count == 1
+        assert started == [jobs[0], jobs[1], jobs[3]]
+
+        release.set()
+        wait_for_jobs(worker)
+
+    # the deferred job runs once a bpl-trenette job has finished, without going back on the queue
+    queue.push_job_id.assert_not_called()
+    assert started == [jobs[0], jobs[1], jobs[3], jobs[2]]
+    assert worker._running == 0
+    assert worker._deferred_count == 0
+    assert worker._running_by_slug["bpl-trenette"] == 0
+    # every slot is free again
+    for _ in range(worker.concurrency):
+        assert worker._slots.acquire(blocking=False)
+
+
+def test_worker_waits_for_deferred_jobs_to_start(worker):
+    worker.slot_wait = 0.01
+    worker.max_deferred = 1
+    worker._running_by_slug["bpl-trenette"] = worker.slug_concurrency
+    worker._running = worker.slug_concurrency
+
+    def finish_a_job():
+        worker._job_done(finished, "bpl-trenette")
+
+    finished = mock.MagicMock()
+    finished.exception.return_value = None
+    assert worker._slots.acquire(timeout=5)
+    with mock.patch.object(worker, "_perform_job", return_value=True), mock.patch.object(
+        worker, "heartbeat", side_effect=finish_a_job
+    ) as mock_heartbeat:
+        worker.execute_job(make_job(), mock.MagicMock())
+
+    # the worker checked in with rq while it waited, when one of the merchant's jobs finished
+    mock_heartbeat.assert_called_once()
+    assert worker._deferred_count == 0
+
+
+def test_each_thread_performs_jobs_with_its_own_worker(worker):
+    job_workers = []
+    both_started = threading.Barrier(2, timeout=5)
+
+    def perform_job(self, job, queue):
+        job_workers.append(self)
+        both_started.wait()
+        return True
+
+    with mock.patch.object(JobWorker, "perform_job", autospec=True, side_effect=perform_job):
+        for job in [make_job(), make_job(args=(2, "tid", "iceland-bonus-card", {}))]:
+            assert worker._slots.acquire(timeout=5)
+            worker.execute_job(job, mock.MagicMock())
+        wait_for_jobs(worker)
+
+    first, second = job_workers
+    assert first is not second
+    assert first.name != second.name
+    assert first.name.startswith(f"{worker.name}-rq-job")
+    assert second.name.startswith(f"{worker.name}-rq-job")
+
+
+def test_exception_handlers_run_for_failed_jobs(worker):
+    handled = threading.Event()
+
+    def handler(job, exc_type, exc_value, traceback):
+        handled.set()
+
+    worker.push_exc_handler(handler)
+    job = make_job()
+    job.perform.side_effect = ValueError
+
+    with mock.patch.object(JobWorker, "prepare_job_execution"), mock.patch.object(JobWorker, "handle_job_failure"):
+        assert worker._slots.acquire(timeout=5)
+        worker.execute_job(job, mock.MagicMock())
+        wait_for_jobs(worker)
+
+    assert handled.is_set()
+
+
+def test_dequeue_waits_for_a_free_thread(worker):
+    worker.slot_wait = 0.01
+    worker._stop_requested = True
+    for _ in range(worker.concurrency):
+        worker._slots.acquire()
+
+    with mock.patch.object(worker, "heartbeat"), mock.patch(
+        "rq.worker.Worker.dequeue_job_and_maintain_ttl"
+    ) as mock_dequeue:
+        assert worker.dequeue_job_and_maintain_ttl(timeout=None) is None
+
+    mock_dequeue.assert_not_called()
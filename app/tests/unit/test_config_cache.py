@@ -0,0 +1,138 @@
+import threading
+import time
+from unittest import mock
+
+from app.config_cache import ConfigurationCache
+
+JOIN_HANDLER = 2
+VALIDATE_HANDLER = 3
+
+
+def test_get_loads_and_caches_configuration():
+    mock_config_class = mock.MagicMock()
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+
+    first = cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+    second = cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+
+    assert first is second
+    mock_config_class.assert_called_once()
+    assert mock_config_class.call_args[0][:2] == ("bpl-trenette", JOIN_HANDLER)
+
+
+def test_get_caches_per_slug_and_handler_type():
+    mock_config_class = mock.MagicMock(side_effect=lambda *args: mock.MagicMock())
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+
+    join_config = cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+    validate_config = cache.get("bpl-trenette", VALIDATE_HANDLER, mock_config_class)
+    other_config = cache.get("the-works", JOIN_HANDLER, mock_config_class)
+
+    assert len({id(join_config), id(validate_config), id(other_config)}) == 3
+    assert mock_config_class.call_count == 3
+
+
+def test_zero_ttl_disables_cache():
+    mock_config_class = mock.MagicMock()
+    cache = ConfigurationCache(ttl=0, refresh_ahead=0)
+
+    cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+    cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+
+    assert mock_config_class.call_count == 2
+
+
+def test_expired_configuration_is_reloaded():
+    mock_config_class = mock.MagicMock()
+    cache = ConfigurationCache(ttl=60, refresh_ahead=0)
+
+    with mock.patch("app.config_cache.time.monotonic", return_value=1000):
+        cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+    with mock.patch("app.config_cache.time.monotonic", return_value=1061):
+        cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+
+    assert mock_config_class.call_count == 2
+
+
+def test_configuration_near_expiry_is_refreshed_in_background():
+    refreshed = threading.Event()
+    new_config = mock.MagicMock()
+    mock_config_class = mock.MagicMock(side_effect=[mock.MagicMock(), new_config])
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+    old_config = cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+
+    def fetch(key, config_class):
+        ConfigurationCache._fetch(cache, key, config_class)
+        refreshed.set()
+
+    with mock.patch.object(cache, "_fetch", side_effect=fetch):
+        entry = cache._entries[("bpl-trenette", JOIN_HANDLER)]
+        with mock.patch("app.config_cache.time.monotonic", return_value=entry.refresh_at + 1):
+            assert cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class) is old_config
+        assert refreshed.wait(timeout=5)
+
+    assert cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class) is new_config
+
+
+def test_concurrent_requests_load_configuration_once():
+    def slow_config(*args):
+        time.sleep(0.1)
+        return mock.MagicMock()
+
+    mock_config_class = mock.MagicMock(side_effect=slow_config)
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    mock_config_class.assert_called_once()
+    assert len({id(result) for result in results}) == 1
+
+
+def test_invalidate():
+    mock_config_class = mock.MagicMock()
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+    cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+    cache.get("bpl-trenette", VALIDATE_HANDLER, mock_config_class)
+    cache.get("the-works", JOIN_HANDLER, mock_config_class)
+
+    cache.invalidate("bpl-trenette", JOIN_HANDLER)
+    assert set(cache._entries) == {("bpl-trenette", VALIDATE_HANDLER), ("the-works", JOIN_HANDLER)}
+
+    cache.invalidate("bpl-trenette")
+    assert set(cache._entries) == {("the-works", JOIN_HANDLER)}
+
+    cache.invalidate()
+    assert cache._entries == {}
+
+
+def test_invalidate_calls_listeners():
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+    listener = mock.MagicMock()
+    cache.add_invalidation_listener(listener)
+
+    cache.invalidate("bpl-trenette", JOIN_HANDLER)
+    cache.invalidate()
+
+    assert listener.call_args_list == [mock.call("bpl-trenette", JOIN_HANDLER), mock.call(None, None)]
+
+
+def test_invalidate_during_load_does_not_cache_stale_configuration():
+    cache = ConfigurationCache(ttl=60, refresh_ahead=10)
+
+    def config_invalidated_while_loading(*args):
+        cache.invalidate("bpl-trenette")
+        return mock.MagicMock()
+
+    mock_config_class = mock.MagicMock(side_effect=config_invalidated_while_loading)
+
+    cache.get("bpl-trenette", JOIN_HANDLER, mock_config_class)
+
+    assert cache._entries == {}
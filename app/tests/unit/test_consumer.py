@@ -1,3 +1,6 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase, mock
 
 import kombu
@@ -136,3 +139,137 @@ class TestConsumer(TestCase):
         # Sentry error should be raised if message has errors but the called removed journey will not raise a
         # sentry error if the agent has not been configured for removed handler
         self.assertTrue(mock_sentry.called)
+
+
+@mock.patch("app.messaging.consumer.build_message")
+@mock.patch("app.messaging.consumer.MessageDispatcher")
+class TestConsumerConcurrency(TestCase):
+    def make_consumer(self):
+        return TaskConsumer(
+            connection=kombu.Connection("memory://"), prefetch_count=5, max_workers=2, removal_max_workers=1
+        )
+
+    @staticmethod
+    def make_message(redelivered=False, body=b"{}"):
+        return mock.MagicMock(
+            headers={"type": "loyalty_card.removed"}, body=body, delivery_info={"redelivered": redelivered}
+        )
+
+    def test_message_is_acked_after_its_handler_finishes(self, mock_dispatcher, mock_build_message):
+        consumer = self.make_consumer()
+        handler_done = threading.Event()
+        mock_dispatcher.return_value.dispatch.side_effect = lambda request: handler_done.wait(timeout=5)
+        message = self.make_message()
+
+        consumer.on_message({}, message)
+        consumer.on_iteration()
+        message.ack.assert_not_called()
+
+        handler_done.set()
+        consumer._executor.shutdown(wait=True)
+        consumer.on_iteration()
+        message.ack.assert_called_once()
+
+    def test_failed_message_is_requeued_once_then_rejected(self, mock_dispatcher, mock_build_message):
+        consumer = self.make_consumer()
+        mock_dispatcher.return_value.dispatch.side_effect = ValueError
+        first_delivery, redelivery = self.make_message(), self.make_message(redelivered=True)
+
+        consumer.on_message({}, first_delivery)
+        consumer._executor.shutdown(wait=True)
+        consumer.on_iteration()
+        consumer._executor = ThreadPoolExecutor(max_workers=1)
+        consumer.on_message({}, redelivery)
+        consumer._executor.shutdown(wait=True)
+        consumer.on_iteration()
+
+        first_delivery.requeue.assert_called_once()
+        redelivery.reject.assert_called_once()
+        first_delivery.ack.assert_not_called()
+        redelivery.ack.assert_not_called()
+
+    def test_message_redelivered_after_a_crash_is_requeued_on_its_first_failure(
+        self, mock_dispatcher, mock_build_message
+    ):
+        consumer = self.make_consumer()
+        mock_dispatcher.return_value.dispatch.side_effect = ValueError
+        redelivery, other_message = self.make_message(redelivered=True), self.make_message(body=b'{"other": 1}')
+
+        consumer.on_message({}, redelivery)
+        consumer._executor.shutdown(wait=True)
+        consumer.on_iteration()
+        consumer._executor = ThreadPoolExecutor(max_workers=1)
+        consumer.on_message({}, other_message)
+        consumer._executor.shutdown(wait=True)
+        consumer.on_iteration()
+
+        redelivery.requeue.assert_called_once()
+        other_message.requeue.assert_called_once()
+        redelivery.reject.assert_not_called()
+
+    @mock.patch("app.messaging.consumer.ConsumerMixin.consume")
+    def test_events_are_drained_with_a_short_timeout(self, mock_consume, mock_dispatcher, mock_build_message):
+        consumer = self.make_consumer()
+
+        consumer.consume(limit=None)
+
+        mock_consume.assert_called_once_with(limit=None, timeout=None, safety_interval=consumer.drain_timeout)
+
+    def test_unreadable_message_is_rejected(self, mock_dispatcher, mock_build_message):
+        consumer = self.make_consumer()
+        mock_build_message.side_effect = KeyError("type")
+        message = self.make_message()
+
+        consumer.on_message({}, message)
+
+        message.reject.assert_called_once()
+        mock_dispatcher.return_value.dispatch.assert_not_called()
+
+    def test_removals_do_not_block_joins(self, mock_dispatcher, mock_build_message):
+        consumer = self.make_consumer()
+        removal_done = threading.Event()
+        join_done = threading.Event()
+        removal = LoyaltyCardRemoved(
+            channel="test.com",
+            transaction_id="1",
+            bink_user_id="99999",
+            request_id="1223232",
+            account_id="12345678989",
+            loyalty_plan="10",
+        )
+        join = JoinApplication(
+            channel="test",
+            transaction_id="2",
+            bink_user_id="1234",
+            request_id=123,
+            loyalty_plan="1234",
+            account_id="456",
+            join_data={"abc": "def"},
+        )
+
+        def dispatch(request):
+            if request is removal:
+                removal_done.wait(timeout=5)
+            else:
+                join_done.set()
+
+        mock_dispatcher.return_value.dispatch.side_effect = dispatch
+        mock_build_message.side_effect = [removal, removal, join]
+
+        # the removal pool has one thread, which the first removal holds
+        for _ in range(3):
+            consumer.on_message({}, self.make_message())
+
+        self.assertTrue(join_done.wait(timeout=5))
+        removal_done.set()
+
+    def test_running_handlers_finish_before_the_consumer_stops(self, mock_dispatcher, mock_build_message):
+        consumer = self.make_consumer()
+        mock_dispatcher.return_value.dispatch.side_effect = lambda request: time.sleep(0.05)
+        message = self.make_message()
+
+        consumer.on_message({}, message)
+        consumer.should_stop = True
+        consumer.on_consume_end(consumer.connection, mock.MagicMock())
+
+        message.ack.assert_called_once()
@@ -0,0 +1,64 @@
+from unittest import mock
+
+import pytest
+import sqlalchemy as s
+from blinker import signal
+from sqlalchemy.pool import NullPool
+
+from app import db
+from app.db import TimedQueuePool, create_engine
+
+
+@pytest.fixture
+def sqlite_dsn(tmp_path, monkeypatch):
+    monkeypatch.setattr("settings.POSTGRES_DSN", f"sqlite:///{tmp_path / 'midas.db'}")
+    monkeypatch.setattr("settings.POSTGRES_CONNECT_ARGS", {})
+
+
+def test_engine_pools_connections(sqlite_dsn, monkeypatch):
+    monkeypatch.setattr("settings.POSTGRES_POOL_SIZE", 3)
+    monkeypatch.setattr("settings.POSTGRES_MAX_OVERFLOW", 1)
+    monkeypatch.setattr("settings.POSTGRES_POOL_TIMEOUT", 7)
+
+    engine = create_engine()
+
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 1
+    assert engine.pool._timeout == 7
+    assert engine.pool._pre_ping
+
+
+def test_engine_without_a_pool(sqlite_dsn, monkeypatch):
+    monkeypatch.setattr("settings.POSTGRES_POOL", "null")
+
+    assert isinstance(create_engine().pool, NullPool)
+
+
+def test_connections_are_reused_and_waits_are_reported(sqlite_dsn):
+    engine = create_engine()
+    waits = []
+
+    def record_wait(sender, wait_time):
+        waits.append(wait_time)
+
+    signal("db-pool-wait").connect(record_wait)
+    try:
+        with engine.connect() as conn:
+            first = conn.connection.dbapi_connection
+        with engine.connect() as conn:
+            conn.execute(s.text("SELECT 1"))
+            second = conn.connection.dbapi_connection
+    finally:
+        signal("db-pool-wait").disconnect(record_wait)
+
+    assert first is second
+    assert len(waits) == 2
+    assert all(wait >= 0 for wait in waits)
+
+
+def test_forked_process_does_not_share_connections():
+    with mock.patch.object(db.engine, "dispose") as mock_dispose:
+        db._dispose_in_child()
+
+    mock_dispose.assert_called_once_with(close=False)
@@ -1,9 +1,11 @@
 import json
+import threading
 import unittest
+from unittest import mock
 
 from Crypto import Random
 
-from app.encryption import AESCipher
+from app.encryption import AESCipher, AESKeyring, MultiKeyCipher
 
 
 class TestEncryption(unittest.TestCase):
@@ -39,5 +41,91 @@ class TestEncryption(unittest.TestCase):
         self.assertRaises(TypeError, aes_cipher.decrypt, "")
 
 
+class TestMultiKeyCipher(unittest.TestCase):
+    def setUp(self):
+        self.key = Random.get_random_bytes(32)
+        self.previous_key = Random.get_random_bytes(32)
+
+    def test_decrypts_with_current_and_previous_keys(self):
+        cipher = MultiKeyCipher([self.key, self.previous_key])
+
+        self.assertEqual(cipher.decrypt(AESCipher(self.key).encrypt("current")), "current")
+        self.assertEqual(cipher.decrypt(AESCipher(self.previous_key).encrypt("previous")), "previous")
+
+    def test_encrypts_with_current_key(self):
+        cipher = MultiKeyCipher([self.key, self.previous_key])
+
+        self.assertEqual(AESCipher(self.key).decrypt(cipher.encrypt("message")), "message")
+
+    def test_tries_last_used_key_first(self):
+        cipher = MultiKeyCipher([self.key, self.previous_key])
+        cipher.decrypt(AESCipher(self.previous_key).encrypt("previous"))
+
+        with mock.patch.object(cipher.ciphers[0], "decrypt_strict") as mock_decrypt:
+            cipher.decrypt(AESCipher(self.previous_key).encrypt("previous"))
+
+        mock_decrypt.assert_not_called()
+
+    def test_no_matching_key(self):
+        cipher = MultiKeyCipher([self.key, self.previous_key])
+
+        self.assertRaises(ValueError, cipher.decrypt, AESCipher(Random.get_random_bytes(32)).encrypt("message" * 10))
+
+
+class TestAESKeyring(unittest.TestCase):
+    def setUp(self):
+        self.key = Random.get_random_bytes(32)
+        self.keyring = AESKeyring("aes-keys", ttl=3600, refresh_ahead=300)
+
+    @mock.patch("app.encryption.get_aes_keys")
+    def test_keys_are_loaded_once(self, mock_get_aes_keys):
+        mock_get_aes_keys.return_value = [self.key]
+        encrypted = AESCipher(self.key).encrypt("message")
+
+        self.assertEqual(self.keyring.decrypt(encrypted), "message")
+        self.assertIs(self.keyring.get_cipher(), self.keyring.get_cipher())
+        mock_get_aes_keys.assert_called_once_with("aes-keys")
+
+    @mock.patch("app.encryption.get_aes_keys")
+    def test_keys_near_expiry_are_refreshed_in_background(self, mock_get_aes_keys):
+        rotated_key = Random.get_random_bytes(32)
+        refreshed = threading.Event()
+
+        def get_aes_keys(secret_name):
+            if mock_get_aes_keys.call_count > 1:
+                refreshed.set()
+                return [rotated_key, self.key]
+            return [self.key]
+
+        mock_get_aes_keys.side_effect = get_aes_keys
+        cipher = self.keyring.get_cipher()
+        self.keyring._refresh_at = 0
+
+        self.assertIs(self.keyring.get_cipher(), cipher)
+        self.assertTrue(refreshed.wait(timeout=5))
+        # wait for the refresh thread to release the lock
+        with self.keyring._load_lock:
+            pass
+        self.assertEqual(self.keyring.decrypt(AESCipher(rotated_key).encrypt("rotated")), "rotated")
+
+    @mock.patch("app.encryption.get_aes_keys")
+    def test_failed_reload_uses_previous_keys(self, mock_get_aes_keys):
+        mock_get_aes_keys.side_effect = [[self.key], Exception("Key Vault is down")]
+        cipher = self.keyring.get_cipher()
+        self.keyring._expires_at = 0
+
+        self.assertIs(self.keyring.get_cipher(), cipher)
+
+    @mock.patch("app.encryption.get_aes_keys")
+    def test_invalidate(self, mock_get_aes_keys):
+        mock_get_aes_keys.return_value = [self.key]
+        self.keyring.get_cipher()
+
+        self.keyring.invalidate()
+        self.keyring.get_cipher()
+
+        self.assertEqual(mock_get_aes_keys.call_count, 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from decimal import Decimal
 from http import HTTPStatus
@@ -6,6 +7,7 @@ from unittest.mock import ANY, MagicMock, Mock, call
 
 import arrow
 import httpretty
+import httpx
 from flask_testing import TestCase as FlaskTestCase
 from requests import Response
 from soteria.configuration import Configuration
@@ -14,6 +16,7 @@ from app.agents.base import Balance, BaseAgent
 from app.agents.iceland import Iceland
 from app.agents.schemas import Transaction
 from app.api import create_app
+from app.async_http import client_scope
 from app.exceptions import (
     AccountAlreadyExistsError,
     CardNotRegisteredError,
@@ -293,6 +296,26 @@ class TestIcelandAdd(TestCase):
         self.assertTrue(isinstance(agent_instance, Iceland))
         self.assertTrue(mock_login.called)
 
+    @mock.patch("app.agents.iceland.Iceland.authenticate", return_value="a_token")
+    def test_login_async_success(self, mock_oath):
+        def handler(request):
+            return httpx.Response(
+                200,
+                json={"balance": 10.0, "barcode": "a_barcode", "card_number": "a_card_number", "transactions": []},
+            )
+
+        async def login():
+            async with client_scope(httpx.MockTransport(handler)):
+                await self.iceland.login_async()
+                return await self.iceland.balance_async()
+
+        balance = asyncio.run(login())
+
+        self.assertTrue(mock_oath.called)
+        self.assertEqual("SYNC", self.iceland.integration_service)
+        self.assertEqual(balance.points, Decimal("10.00"))
+        self.assertEqual(self.iceland.identifier["barcode"], "a_barcode")
+
     @httpretty.activate
     @mock.patch("app.agents.iceland.Iceland.authenticate", return_value="a_token")
     @mock.patch("requests.Session.post", autospec=True)
@@ -1,7 +1,9 @@
 import json
 import unittest
+from unittest import mock
 
 import httpretty
+import requests
 from soteria.configuration import Configuration
 
 from app.exceptions import ConfigurationError, ServiceConnectionError
@@ -46,6 +48,51 @@ class TestOauth(unittest.TestCase):
         resp = self.oauth.encode(json.dumps({"key": "value"}))
         self.assertEqual(self.expected_success_resp, resp)
 
+    @httpretty.activate
+    @mock.patch("app.security.oauth.requests.post", wraps=requests.post)
+    def test_encode_reuses_token_until_it_expires(self, mock_post):
+        httpretty.register_uri(
+            httpretty.POST,
+            uri=self.token_url,
+            responses=[
+                httpretty.Response(body=json.dumps({"access_token": "a_token", "expires_in": 3600}), status=200),
+                httpretty.Response(body=json.dumps({"access_token": "another_token"}), status=200),
+            ],
+        )
+        self.assertEqual(self.expected_success_resp, self.oauth.encode(json.dumps({"key": "value"})))
+        self.assertEqual(self.expected_success_resp, self.oauth.encode(json.dumps({"key": "value"})))
+        self.assertEqual(mock_post.call_count, 1)
+
+    @httpretty.activate
+    @mock.patch("app.security.oauth.requests.post", wraps=requests.post)
+    def test_encode_after_reject_fetches_new_token(self, mock_post):
+        httpretty.register_uri(
+            httpretty.POST,
+            uri=self.token_url,
+            responses=[
+                httpretty.Response(body=json.dumps({"access_token": "a_token", "expires_in": 3600}), status=200),
+                httpretty.Response(body=json.dumps({"access_token": "another_token", "expires_in": 3600}), status=200),
+            ],
+        )
+        request_data = self.oauth.encode(json.dumps({"key": "value"}))
+        self.oauth.reject(request_data)
+
+        resp = self.oauth.encode(json.dumps({"key": "value"}))
+        self.assertEqual(resp["headers"], {"Authorization": "Bearer another_token"})
+        self.assertEqual(mock_post.call_count, 2)
+
+    @httpretty.activate
+    @mock.patch("app.security.oauth.requests.post", wraps=requests.post)
+    def test_encode_without_expiry_fetches_token_each_time(self, mock_post):
+        httpretty.register_uri(
+            httpretty.POST,
+            uri=self.token_url,
+            responses=[httpretty.Response(body=json.dumps({"access_token": "a_token"}), status=200)],
+        )
+        self.oauth.encode(json.dumps({"key": "value"}))
+        self.oauth.encode(json.dumps({"key": "value"}))
+        self.assertEqual(mock_post.call_count, 2)
+
     @httpretty.activate
     def test_encode_on_request_failure(self):
         httpretty.register_uri(
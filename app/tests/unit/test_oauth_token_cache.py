@@ -0,0 +1,139 @@
+import threading
+import time
+from unittest import mock
+
+import redis.exceptions as redis_exceptions
+
+from app.oauth_token_cache import OAuthTokenCache, StoredToken
+
+TIMEOUT = 3600
+
+
+def make_cache(distributed_lock=False):
+    cache = OAuthTokenCache(refresh_ahead=300, lock_timeout=5)
+    cache.distributed_lock = distributed_lock
+    return cache
+
+
+def fresh_token(token="token-1", age=0):
+    return StoredToken(token=token, timestamp=int(time.time()) - age)
+
+
+def test_get_uses_the_shared_token_and_keeps_it_in_memory():
+    cache = make_cache()
+    load = mock.MagicMock(return_value=fresh_token())
+    refresh = mock.MagicMock()
+
+    assert cache.get("iceland-bonus-card", TIMEOUT, load, refresh) == "token-1"
+    assert cache.get("iceland-bonus-card", TIMEOUT, load, refresh) == "token-1"
+
+    load.assert_called_once()
+    refresh.assert_not_called()
+
+
+def test_get_refreshes_when_there_is_no_shared_token():
+    cache = make_cache()
+    load = mock.MagicMock(return_value=None)
+    refresh = mock.MagicMock(return_value=fresh_token("token-2"))
+
+    assert cache.get("iceland-bonus-card", TIMEOUT, load, refresh) == "token-2"
+    assert cache.get("iceland-bonus-card", TIMEOUT, load, refresh) == "token-2"
+
+    refresh.assert_called_once()
+
+
+def test_expired_token_in_memory_is_fetched_again():
+    cache = make_cache()
+    cache._tokens["iceland-bonus-card"] = fresh_token("old", age=TIMEOUT)
+    refresh = mock.MagicMock(return_value=fresh_token("new"))
+
+    assert cache.get("iceland-bonus-card", TIMEOUT, lambda: None, refresh) == "new"
+
+
+def test_token_near_expiry_is_refreshed_in_background():
+    cache = make_cache()
+    cache._tokens["iceland-bonus-card"] = old = fresh_token("old", age=TIMEOUT - 100)
+    refreshed = threading.Event()
+
+    def refresh():
+        refreshed.set()
+        return fresh_token("new")
+
+    assert cache.get("iceland-bonus-card", TIMEOUT, lambda: old, refresh) == "old"
+    assert refreshed.wait(timeout=5)
+    # wait for the refresh thread to release the merchant's lock
+    with cache._get_key_lock("iceland-bonus-card"):
+        pass
+    assert cache.get("iceland-bonus-card", TIMEOUT, lambda: old, refresh) == "new"
+
+
+def test_background_refresh_uses_a_token_already_refreshed_by_another_process():
+    cache = make_cache()
+    cache._tokens["iceland-bonus-card"] = fresh_token("old", age=TIMEOUT - 100)
+    refresh = mock.MagicMock()
+
+    cache.get("iceland-bonus-card", TIMEOUT, lambda: fresh_token("other-process"), refresh)
+    with cache._get_key_lock("iceland-bonus-card"):
+        pass
+
+    refresh.assert_not_called()
+    assert cache._tokens["iceland-bonus-card"].token == "other-process"
+
+
+def test_concurrent_requests_fetch_the_token_once():
+    def slow_refresh():
+        time.sleep(0.1)
+        return fresh_token()
+
+    cache = make_cache()
+    refresh = mock.MagicMock(side_effect=slow_refresh)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("iceland-bonus-card", TIMEOUT, lambda: None, refresh)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    refresh.assert_called_once()
+    assert results == ["token-1"] * 10
+
+
+def test_refresh_holds_the_redis_lock_and_rechecks_the_shared_token():
+    cache = make_cache(distributed_lock=True)
+    load = mock.MagicMock(side_effect=[None, fresh_token("other-process")])
+    refresh = mock.MagicMock()
+
+    with mock.patch("app.oauth_token_cache.get_redis") as mock_get_redis:
+        mock_redis = mock_get_redis.return_value
+        mock_redis.lock.return_value.acquire.return_value = True
+        assert cache.get("iceland-bonus-card", TIMEOUT, load, refresh) == "other-process"
+
+    mock_redis.lock.assert_called_once_with("oauth-token-lock-iceland-bonus-card", timeout=5, blocking_timeout=5)
+    mock_redis.lock.return_value.release.assert_called_once()
+    refresh.assert_not_called()
+
+
+def test_refresh_without_redis():
+    cache = make_cache(distributed_lock=True)
+    refresh = mock.MagicMock(return_value=fresh_token())
+
+    with mock.patch("app.oauth_token_cache.get_redis") as mock_get_redis:
+        mock_redis = mock_get_redis.return_value
+        mock_redis.lock.return_value.acquire.side_effect = redis_exceptions.ConnectionError
+        assert cache.get("iceland-bonus-card", TIMEOUT, lambda: None, refresh) == "token-1"
+
+    mock_redis.lock.return_value.release.assert_not_called()
+
+
+def test_invalidate():
+    cache = make_cache()
+    cache._tokens = {"iceland-bonus-card": fresh_token(), "squaremeal": fresh_token()}
+
+    cache.invalidate("squaremeal")
+    assert set(cache._tokens) == {"iceland-bonus-card"}
+
+    cache.invalidate()
+    assert cache._tokens == {}
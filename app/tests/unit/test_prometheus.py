@@ -1,8 +1,11 @@
+import os
 from unittest import TestCase, mock
 
 from blinker import signal
+from prometheus_client.registry import REGISTRY
 
 import settings
+from app.prometheus import PrometheusPusher
 
 
 class TestPrometheus(TestCase):
@@ -119,3 +122,103 @@ class TestPrometheus(TestCase):
         signal("request-success").send(self, slug="test-prometheus", channel="com.bink.wallet")
         # THEN
         mock_prometheus_counter_inc.assert_called_once()
+
+    @mock.patch("app.prometheus.Counter.inc", autospec=True)
+    def test_audit_export(self, mock_prometheus_counter_inc):
+        """
+        Test that the audit logs exported counter increments by the number of logs
+        """
+        # GIVEN
+        settings.PUSH_PROMETHEUS_METRICS = False  # Disable the attempted push
+        # WHEN
+        signal("audit-export").send(self, outcome="sent", count=5)
+        # THEN
+        mock_prometheus_counter_inc.assert_called_once_with(mock.ANY, 5)
+
+    @mock.patch("app.prometheus.Histogram.observe", autospec=True)
+    def test_db_pool_wait(self, mock_prometheus_histogram_observe):
+        """
+        Test that the time waited for a Postgres connection is observed
+        """
+        # GIVEN
+        settings.PUSH_PROMETHEUS_METRICS = False  # Disable the attempted push
+        # WHEN
+        signal("db-pool-wait").send(self, wait_time=0.25)
+        # THEN
+        mock_prometheus_histogram_observe.assert_called_once_with(mock.ANY, 0.25)
+
+    @mock.patch("app.prometheus.Histogram.observe", autospec=True)
+    def test_security_timing(self, mock_prometheus_histogram_observe):
+        """
+        Test that the time taken to verify a request signature is observed
+        """
+        # GIVEN
+        settings.PUSH_PROMETHEUS_METRICS = False  # Disable the attempted push
+        # WHEN
+        signal("security-timing").send(self, slug="test-prometheus", operation="verify", duration=0.002)
+        # THEN
+        mock_prometheus_histogram_observe.assert_called_once_with(mock.ANY, 0.002)
+
+    @mock.patch("app.prometheus.Counter.inc", autospec=True)
+    def test_security_key_cache(self, mock_prometheus_counter_inc):
+        """
+        Test that the security key cache hit counter increments
+        """
+        # GIVEN
+        settings.PUSH_PROMETHEUS_METRICS = False  # Disable the attempted push
+        # WHEN
+        signal("security-key-cache").send(self, slug="test-prometheus", outcome="hit")
+        # THEN
+        mock_prometheus_counter_inc.assert_called_once_with(mock.ANY, 1)
+
+
+class TestPrometheusPusher(TestCase):
+    def tearDown(self) -> None:
+        settings.PUSH_PROMETHEUS_METRICS = False
+
+    @mock.patch("app.prometheus.push_to_gateway", autospec=True)
+    def test_push(self, mock_push_to_gateway):
+        settings.PUSH_PROMETHEUS_METRICS = True
+        PrometheusPusher(interval=60).push()
+
+        mock_push_to_gateway.assert_called_once_with(
+            gateway=settings.PROMETHEUS_PUSH_GATEWAY,
+            job=settings.PROMETHEUS_JOB,
+            registry=REGISTRY,
+            grouping_key={"pid": str(os.getpid())},
+            timeout=3,
+        )
+
+    @mock.patch("app.prometheus.push_to_gateway", autospec=True)
+    def test_push_disabled(self, mock_push_to_gateway):
+        settings.PUSH_PROMETHEUS_METRICS = False
+        pusher = PrometheusPusher(interval=60)
+        pusher.ensure_started()
+        pusher.push()
+
+        self.assertIsNone(pusher._thread)
+        mock_push_to_gateway.assert_not_called()
+
+    @mock.patch("app.prometheus.push_to_gateway", autospec=True)
+    def test_counter_increment_does_not_push(self, mock_push_to_gateway):
+        settings.PUSH_PROMETHEUS_METRICS = True
+        with mock.patch("app.prometheus.prometheus_pusher", PrometheusPusher(interval=60)) as pusher:
+            signal("log-in-success").send(self, slug="test-prometheus")
+
+            mock_push_to_gateway.assert_not_called()
+            self.assertTrue(pusher._thread.is_alive())
+
+            pusher.shutdown()
+            self.assertFalse(pusher._thread.is_alive())
+            mock_push_to_gateway.assert_called_once()
+
+    @mock.patch("app.prometheus.push_to_gateway", autospec=True)
+    def test_ensure_started_after_shutdown_does_not_restart(self, mock_push_to_gateway):
+        settings.PUSH_PROMETHEUS_METRICS = True
+        pusher = PrometheusPusher(interval=60)
+        pusher.shutdown()
+
+        pusher.ensure_started()
+
+        self.assertIsNone(pusher._thread)
+        mock_push_to_gateway.assert_called_once()
@@ -1,8 +1,33 @@
+import asyncio
+import json
+import threading
 import unittest
+from concurrent.futures import Future
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
-from app.publish import PENDING_BALANCE, balance, create_balance_object, minify_number, transactions, zero_balance
+import httpretty
+import httpx
+import requests
+
+from app.async_http import client_scope
+from app.publish import (
+    PENDING_BALANCE,
+    HadesBatcher,
+    Publisher,
+    balance,
+    call_when_published,
+    create_balance_object,
+    get_publisher,
+    hades_publisher,
+    hermes_publisher,
+    minify_number,
+    status_async,
+    transactions,
+    transactions_async,
+    zero_balance,
+)
+from settings import HADES_URL, HERMES_URL
 
 expected_balance = {
     "scheme_account_id": 1,
@@ -14,6 +39,7 @@ expected_balance = {
 
 
 class TestRetry(unittest.TestCase):
+    @patch("app.publish.HADES_BATCH_PUBLISH", False)
     @patch("app.publish.post", autospec=True)
     def test_transactions(self, mock_post):
         items = transactions(
@@ -28,6 +54,7 @@ class TestRetry(unittest.TestCase):
         self.assertTrue(mock_post.called)
         self.assertTrue(mock_post.call_args[0][0][-13:], "/transactions")
 
+    @patch("app.publish.HADES_BATCH_PUBLISH", False)
     @patch("app.publish.post", autospec=True)
     def test_balance(self, mock_post):
         b = {
@@ -61,6 +88,7 @@ class TestRetry(unittest.TestCase):
 
         self.assertEqual(item["value_label"], "Reward")
 
+    @patch("app.publish.HADES_BATCH_PUBLISH", False)
     @patch("app.publish.post", autospec=True)
     def test_zero_balance(self, mock_post):
         item = zero_balance(5, 8, "123-12")
@@ -117,3 +145,260 @@ class TestRetry(unittest.TestCase):
         for test_case in test_cases:
             n = minify_number(test_case[0])
             self.assertEqual(n, test_case[1])
+
+
+class TestPublisher(unittest.TestCase):
+    def test_get_publisher(self):
+        self.assertIs(get_publisher(f"{HADES_URL}/balance"), hades_publisher)
+        self.assertIs(get_publisher(f"{HERMES_URL}/schemes/accounts/1/status"), hermes_publisher)
+
+    @httpretty.activate
+    def test_request(self):
+        httpretty.register_uri(httpretty.POST, "http://hades.test/balance", status=201)
+        publisher = Publisher("hades", max_workers=2, max_in_flight=5)
+
+        resp = publisher.request("post", "http://hades.test/balance", {"points": Decimal("1.5")}, "123-12").result()
+        publisher.shutdown()
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(json.loads(httpretty.last_request().body), {"points": 1.5})
+        self.assertEqual(httpretty.last_request().headers["transaction"], "123-12")
+        self.assertEqual(publisher.queue_depth, 0)
+
+    @httpretty.activate
+    def test_request_blocks_when_max_in_flight_reached(self):
+        release = threading.Event()
+
+        def slow_response(request, uri, response_headers):
+            release.wait(timeout=5)
+            return [200, response_headers, ""]
+
+        httpretty.register_uri(httpretty.POST, "http://hermes.test/status", body=slow_response)
+        publisher = Publisher("hermes", max_workers=2, max_in_flight=1, enqueue_timeout=5)
+        first = publisher.request("post", "http://hermes.test/status", {}, "1")
+        second_sent = threading.Event()
+
+        def send_second():
+            publisher.request("post", "http://hermes.test/status", {}, "2")
+            second_sent.set()
+
+        threading.Thread(target=send_second).start()
+        self.assertFalse(second_sent.wait(timeout=0.2))
+        self.assertEqual(publisher.queue_depth, 1)
+
+        release.set()
+        first.result()
+        self.assertTrue(second_sent.wait(timeout=5))
+        publisher.shutdown()
+        self.assertEqual(publisher.queue_depth, 0)
+
+    @httpretty.activate
+    @patch("app.publish.signal")
+    def test_request_dropped_when_max_in_flight_reached(self, mock_signal):
+        release = threading.Event()
+
+        def slow_response(request, uri, response_headers):
+            release.wait(timeout=5)
+            return [200, response_headers, ""]
+
+        httpretty.register_uri(httpretty.POST, "http://hades.test/balance", body=slow_response)
+        publisher = Publisher("hades", max_workers=1, max_in_flight=1, enqueue_timeout=0.05)
+        first = publisher.request("post", "http://hades.test/balance", {}, "1")
+
+        self.assertIsNone(publisher.request("post", "http://hades.test/balance", {}, "2"))
+        mock_signal.assert_any_call("publish-dropped")
+
+        release.set()
+        first.result()
+        publisher.shutdown()
+        self.assertEqual(publisher.queue_depth, 0)
+
+    @httpretty.activate
+    def test_request_after_shutdown_uses_new_executor(self):
+        httpretty.register_uri(httpretty.POST, "http://hades.test/balance", status=200)
+        publisher = Publisher("hades", max_workers=1, max_in_flight=2)
+        publisher.request("post", "http://hades.test/balance", {}, "1").result()
+        publisher.shutdown()
+
+        resp = publisher.request("post", "http://hades.test/balance", {}, "2").result()
+        publisher.shutdown()
+
+        self.assertEqual(resp.status_code, 200)
+
+    @patch("app.publish.log")
+    def test_request_logs_connection_errors(self, mock_log):
+        publisher = Publisher("hades", max_workers=1, max_in_flight=1)
+
+        future = publisher.request("post", "http://localhost:1/balance", {}, "123-12")
+        publisher.shutdown()
+
+        self.assertIsNotNone(future.exception())
+        self.assertTrue(mock_log.warning.called)
+        self.assertEqual(publisher.queue_depth, 0)
+
+
+class TestCallWhenPublished(unittest.TestCase):
+    def test_called_once_the_request_succeeds(self):
+        future = Future()
+        on_published = MagicMock()
+        call_when_published(future, on_published, None)
+        on_published.assert_not_called()
+
+        future.set_result(MagicMock(ok=True))
+        on_published.assert_called_once_with()
+
+    def test_not_called_if_the_request_fails(self):
+        on_published = MagicMock()
+        failed, errored = Future(), Future()
+        call_when_published(failed, on_published)
+        call_when_published(errored, on_published)
+        call_when_published(None, on_published)
+
+        failed.set_result(MagicMock(ok=False))
+        errored.set_exception(requests.ConnectionError())
+        on_published.assert_not_called()
+
+
+class TestHadesBatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.publisher = MagicMock()
+        self.batcher = HadesBatcher(self.publisher, max_latency=60, max_batch_size=3)
+
+    def tearDown(self) -> None:
+        self.batcher.shutdown()
+
+    def test_flush_coalesces_transactions_and_keeps_latest_balance(self):
+        self.batcher.add_balance({"scheme_account_id": 1, "points": 1}, "tid-1")
+        self.batcher.add_balance({"scheme_account_id": 1, "points": 2}, "tid-2")
+        self.batcher.add_balance({"scheme_account_id": 2, "points": 3}, "tid-3")
+        self.batcher.add_transactions([{"scheme_account_id": 1, "id": "a"}], "tid-4")
+        self.batcher.add_transactions(
+            [{"scheme_account_id": 2, "id": "b"}, {"scheme_account_id": 2, "id": "c"}], "tid-4"
+        )
+        self.batcher.add_transactions([{"scheme_account_id": 3, "id": "d"}], "tid-4")
+
+        self.batcher.flush()
+
+        calls = [call[0] for call in self.publisher.request.call_args_list]
+        self.assertEqual(
+            calls[:2],
+            [
+                ("post", f"{HADES_URL}/balance", {"scheme_account_id": 1, "points": 2}, "tid-2"),
+                ("post", f"{HADES_URL}/balance", {"scheme_account_id": 2, "points": 3}, "tid-3"),
+            ],
+        )
+        self.assertEqual(
+            calls[2:],
+            [
+                (
+                    "post",
+                    f"{HADES_URL}/transactions",
+                    [
+                        {"scheme_account_id": 1, "id": "a"},
+                        {"scheme_account_id": 2, "id": "b"},
+                        {"scheme_account_id": 2, "id": "c"},
+                    ],
+                    "tid-4",
+                ),
+                ("post", f"{HADES_URL}/transactions", [{"scheme_account_id": 3, "id": "d"}], "tid-4"),
+            ],
+        )
+
+    def test_transactions_are_sent_under_the_transaction_id_they_were_published_with(self):
+        self.batcher.add_transactions([{"scheme_account_id": 1, "id": "a"}], "tid-1")
+        self.batcher.add_transactions([{"scheme_account_id": 2, "id": "b"}], "tid-2")
+        self.batcher.add_transactions([{"scheme_account_id": 3, "id": "c"}], "tid-1")
+
+        self.batcher.flush()
+
+        self.assertEqual(
+            [call[0] for call in self.publisher.request.call_args_list],
+            [
+                (
+                    "post",
+                    f"{HADES_URL}/transactions",
+                    [{"scheme_account_id": 1, "id": "a"}, {"scheme_account_id": 3, "id": "c"}],
+                    "tid-1",
+                ),
+                ("post", f"{HADES_URL}/transactions", [{"scheme_account_id": 2, "id": "b"}], "tid-2"),
+            ],
+        )
+
+    def test_full_batch_is_sent_before_max_latency(self):
+        sent = threading.Event()
+        self.publisher.request.side_effect = lambda *args: sent.set()
+
+        self.batcher.add_transactions([{"id": "a"}, {"id": "b"}, {"id": "c"}], "tid-1")
+
+        self.assertTrue(sent.wait(timeout=5))
+
+    def test_shutdown_sends_held_items_and_later_items_immediately(self):
+        self.batcher.add_balance({"scheme_account_id": 1, "points": 1}, "tid-1")
+        self.batcher.shutdown()
+        self.assertEqual(self.publisher.request.call_count, 1)
+
+        self.batcher.add_transactions([{"scheme_account_id": 1, "id": "a"}], "tid-2")
+        self.assertEqual(self.publisher.request.call_count, 2)
+        self.assertFalse(self.batcher._thread.is_alive())
+
+    @patch("app.publish.HADES_BATCH_PUBLISH", True)
+    @patch("app.publish.hades_batcher", autospec=True)
+    def test_balance_and_transactions_are_batched(self, mock_hades_batcher):
+        balance({"points": Decimal(1), "value": Decimal(0), "value_label": "", "vouchers": []}, 5, 8, "123-12")
+        transactions([{}], 5, 8, "123-12")
+
+        balance_item, tid = mock_hades_batcher.add_balance.call_args[0]
+        self.assertNotIn("vouchers", balance_item)
+        self.assertEqual(balance_item["points_label"], "1")
+        self.assertEqual(tid, "123-12")
+        mock_hades_batcher.add_transactions.assert_called_once_with(
+            [{"scheme_account_id": 5, "user_set": 8}], "123-12", on_published=None
+        )
+
+    def test_transactions_added_together_are_sent_together(self):
+        future = Future()
+        self.publisher.request.return_value = future
+        published = []
+        self.batcher.add_transactions([{"id": "a"}, {"id": "b"}], "tid-1", on_published=lambda: published.append("ab"))
+        self.batcher.add_transactions([{"id": "c"}, {"id": "d"}], "tid-1", on_published=lambda: published.append("cd"))
+
+        self.batcher.flush()
+        future.set_result(MagicMock(ok=True))
+
+        [(_, _, data, _)] = [call[0] for call in self.publisher.request.call_args_list]
+        self.assertEqual(data, [{"id": "a"}, {"id": "b"}, {"id": "c"}, {"id": "d"}])
+        self.assertEqual(published, ["ab", "cd"])
+
+
+class TestPublishAsync(unittest.TestCase):
+    def test_status_async(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
+
+        async def publish_status():
+            async with client_scope(httpx.MockTransport(handler)):
+                return await status_async(1, 1, "123-12", {"user_set": "1"}, journey="join")
+
+        self.assertEqual(asyncio.run(publish_status()), 1)
+        self.assertEqual(str(requests[0].url), f"{HERMES_URL}/schemes/accounts/1/status")
+        self.assertEqual(requests[0].headers["transaction"], "123-12")
+        self.assertEqual(
+            json.loads(requests[0].content), {"status": 1, "journey": "join", "user_info": {"user_set": "1"}}
+        )
+
+    @patch("app.publish.HADES_BATCH_PUBLISH", False)
+    def test_transactions_async_calls_on_published_off_the_event_loop(self):
+        published_on = []
+
+        async def publish_transactions():
+            async with client_scope(httpx.MockTransport(lambda request: httpx.Response(200))):
+                await transactions_async(
+                    [{"id": "a"}], 1, "1", "123-12", on_published=lambda: published_on.append(threading.get_ident())
+                )
+
+        asyncio.run(publish_transactions())
+        self.assertEqual(len(published_on), 1)
+        self.assertNotEqual(published_on[0], threading.get_ident())
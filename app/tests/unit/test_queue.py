@@ -0,0 +1,120 @@
+import threading
+import time
+from unittest import mock
+from uuid import uuid4
+
+import kombu
+import pytest
+from olympus_messaging import JoinApplication
+
+from app.messaging.queue import RequestProducer
+
+
+def make_message(request_id=123):
+    message = JoinApplication(
+        channel="test",
+        transaction_id="123",
+        bink_user_id="1234",
+        request_id=request_id,
+        loyalty_plan="iceland-bonus-card",
+        account_id="456",
+        join_data={"encrypted_credentials": "abc"},
+    )
+    message.body = {"request_id": request_id}
+    message.metadata = {"type": "join_application"}
+    return message
+
+
+@pytest.fixture
+def producer():
+    # queues on the memory transport outlive the connection, so each test gets its own
+    producer = RequestProducer(url="memory://", queue_name=f"loyalty-request-{uuid4()}", max_batch_size=10)
+    yield producer
+    producer.close()
+
+
+def read_queue(producer):
+    with kombu.Connection("memory://") as conn:
+        queue = conn.SimpleQueue(producer.queue)
+        messages = []
+        while True:
+            try:
+                message = queue.get(block=False)
+            except queue.Empty:
+                return messages
+            messages.append((message.payload, message.headers))
+            message.ack()
+
+
+def test_publish_reuses_the_connection(producer):
+    producer.publish(make_message(1))
+    connection = producer._connection
+    producer.publish(make_message(2))
+
+    assert producer._connection is connection
+    assert read_queue(producer) == [
+        ({"request_id": 1}, {"type": "join_application"}),
+        ({"request_id": 2}, {"type": "join_application"}),
+    ]
+
+
+def test_publishes_are_confirmed(producer):
+    with mock.patch("app.messaging.queue.kombu.Connection", wraps=kombu.Connection) as mock_connection:
+        producer.publish(make_message())
+
+    mock_connection.assert_called_once_with("memory://", transport_options={"confirm_publish": True})
+
+
+def test_connection_is_reopened_in_a_forked_process(producer):
+    producer.publish(make_message(1))
+    connection = producer._connection
+
+    with mock.patch("app.messaging.queue.os.getpid", return_value=-1):
+        producer.publish(make_message(2))
+
+    assert producer._connection is not connection
+    assert len(read_queue(producer)) == 2
+
+
+def test_requests_waiting_on_a_publish_are_sent_together(producer):
+    publishing = threading.Event()
+    release = threading.Event()
+    batches: list[list] = []
+
+    def get_publish():
+        batch: list = []
+        batches.append(batch)
+
+        def publish(body, **kwargs):
+            batch.append(body["request_id"])
+            if len(batches) == 1:
+                publishing.set()
+                release.wait(timeout=5)
+
+        return publish
+
+    with mock.patch.object(producer, "_get_publish", side_effect=get_publish):
+        first = threading.Thread(target=producer.publish, args=(make_message(1),))
+        first.start()
+        assert publishing.wait(timeout=5)
+        others = [threading.Thread(target=producer.publish, args=(make_message(i),)) for i in range(2, 5)]
+        for thread in others:
+            thread.start()
+        # wait for the other requests to queue up behind the first publish
+        while len(producer._pending) < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in [first, *others]:
+            thread.join(timeout=5)
+
+    assert batches[0] == [1]
+    assert sorted(batches[1]) == [2, 3, 4]
+    assert len(batches) == 2
+
+
+def test_publish_error_is_raised_to_every_request_in_the_batch(producer):
+    with mock.patch.object(producer, "_get_publish", side_effect=ConnectionRefusedError):
+        with pytest.raises(ConnectionRefusedError):
+            producer.publish(make_message())
+
+    assert not producer._pending
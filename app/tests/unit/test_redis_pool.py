@@ -0,0 +1,43 @@
+from unittest import mock
+
+from prometheus_client.registry import REGISTRY
+
+from app import redis_pool
+from app.redis_pool import get_redis, get_user_token_store
+
+
+def test_get_redis_shares_a_client_per_decode_mode():
+    client = get_redis()
+
+    assert get_redis() is client
+    assert get_redis(decode_responses=True) is not client
+    assert get_redis(decode_responses=True).connection_pool.connection_kwargs["decode_responses"] is True
+
+
+def test_redis_users_share_the_pool():
+    from app import db, redis_retry
+    from app.tasks.resend import ReTryTaskStore
+
+    assert redis_retry.redis is db.redis_raw is get_redis()
+    assert ReTryTaskStore().storage is ReTryTaskStore().storage
+
+
+def test_pool_is_configured_from_settings():
+    with mock.patch.dict(redis_pool._clients, clear=True), mock.patch.multiple(
+        "settings", REDIS_MAX_CONNECTIONS=7, REDIS_HEALTH_CHECK_INTERVAL=15
+    ):
+        pool = get_redis().connection_pool
+
+    assert pool.max_connections == 7
+    assert pool.connection_kwargs["health_check_interval"] == 15
+
+
+def test_get_user_token_store_is_shared():
+    assert get_user_token_store() is get_user_token_store()
+
+
+def test_pool_connections_are_collected():
+    get_redis()
+
+    assert REGISTRY.get_sample_value("redis_pool_connections", {"decode_responses": "False", "state": "max"}) == 50
+    assert REGISTRY.get_sample_value("redis_pool_connections", {"decode_responses": "False", "state": "in_use"}) == 0
@@ -4,7 +4,16 @@ from unittest.mock import patch
 import redis
 
 from app.exceptions import ServiceConnectionError
-from app.redis_retry import get_count, get_key, inc_count, redis_connection
+import settings
+from app.redis_retry import (
+    _inc_count_with_ttl,
+    get_count,
+    get_key,
+    inc_count,
+    max_out_count,
+    pipelined,
+    redis_connection,
+)
 
 
 class TestRedisRetry(unittest.TestCase):
@@ -14,7 +23,57 @@ class TestRedisRetry(unittest.TestCase):
     @patch("app.redis_retry.redis")
     def test_inc_count(self, mock_redis):
         inc_count("345")
-        self.assertEqual(mock_redis.incr.call_args[0][0], "345")
+        sha, numkeys, key, ttl = mock_redis.evalsha.call_args[0]
+        self.assertEqual(sha, _inc_count_with_ttl.sha)
+        self.assertEqual((numkeys, key, ttl), (1, "345", settings.RETRY_COUNT_TTL))
+
+    @patch("app.redis_retry.redis")
+    def test_writes_are_pipelined(self, mock_redis):
+        mock_pipe = mock_redis.pipeline.return_value
+        mock_pipe.__len__.return_value = 2
+
+        with pipelined():
+            inc_count("345")
+            max_out_count("678", 3)
+            mock_pipe.execute.assert_not_called()
+
+        mock_redis.pipeline.assert_called_once_with(transaction=False)
+        mock_pipe.evalsha.assert_called_once()
+        mock_pipe.setex.assert_called_once_with("678", 60 * 15, 3)
+        mock_pipe.execute.assert_called_once()
+        mock_redis.evalsha.assert_not_called()
+        mock_redis.setex.assert_not_called()
+
+    @patch("app.redis_retry.redis")
+    def test_pipeline_is_flushed_when_the_block_raises(self, mock_redis):
+        mock_pipe = mock_redis.pipeline.return_value
+        mock_pipe.__len__.return_value = 1
+
+        with self.assertRaises(ValueError):
+            with pipelined():
+                inc_count("345")
+                raise ValueError
+
+        mock_pipe.execute.assert_called_once()
+
+    @patch("app.redis_retry.redis")
+    def test_empty_pipeline_is_not_sent(self, mock_redis):
+        mock_redis.pipeline.return_value.__len__.return_value = 0
+
+        with pipelined():
+            pass
+
+        mock_redis.pipeline.return_value.execute.assert_not_called()
+
+    @patch("app.redis_retry.redis")
+    def test_pipeline_connection_error(self, mock_redis):
+        mock_pipe = mock_redis.pipeline.return_value
+        mock_pipe.__len__.return_value = 1
+        mock_pipe.execute.side_effect = redis.exceptions.ConnectionError
+
+        with self.assertRaises(ServiceConnectionError):
+            with pipelined():
+                inc_count("345")
 
     @patch("app.redis_retry.redis")
     def test_get_count(self, mock_redis):
@@ -2,7 +2,8 @@ import httpretty
 import pytest
 from requests.exceptions import RetryError
 
-from app.requests_retry import requests_retry_session
+import settings
+from app.requests_retry import close_pooled_adapters, get_pooled_adapter, requests_retry_session
 
 
 @httpretty.activate
@@ -28,3 +29,47 @@ def test_retries_on_error():
     with pytest.raises(RetryError):
         s.get("https://httpbin.org/get")
     assert len(httpretty.latest_requests()) == 4
+
+
+def test_pooled_sessions_share_adapter():
+    close_pooled_adapters()
+    s1 = requests_retry_session(pool_key="bpl-trenette")
+    s2 = requests_retry_session(pool_key="bpl-trenette")
+    s3 = requests_retry_session(pool_key="the-works")
+
+    assert s1 is not s2
+    assert s1.get_adapter("https://merchant.com") is s2.get_adapter("https://merchant.com")
+    assert s1.get_adapter("https://merchant.com") is not s3.get_adapter("https://merchant.com")
+    close_pooled_adapters()
+
+
+def test_unpooled_sessions_do_not_share_adapter():
+    s1 = requests_retry_session()
+    s2 = requests_retry_session()
+    assert s1.get_adapter("https://merchant.com") is not s2.get_adapter("https://merchant.com")
+
+
+def test_pooled_adapter_uses_slug_retry_policy(monkeypatch):
+    close_pooled_adapters()
+    monkeypatch.setattr(settings, "HTTP_RETRY_POLICIES", {"the-works": {"retries": 1, "status_forcelist": [502]}})
+    adapter = get_pooled_adapter("the-works", retries=3)
+
+    assert adapter.max_retries.total == 1
+    assert adapter.max_retries.status_forcelist == (502,)
+    assert get_pooled_adapter("bpl-trenette", retries=3).max_retries.total == 3
+    close_pooled_adapters()
+
+
+@httpretty.activate
+def test_pooled_session_retries_on_error():
+    close_pooled_adapters()
+    httpretty.register_uri(
+        method=httpretty.GET,
+        uri="https://httpbin.org/get",
+        responses=[httpretty.Response(body="", status=502)],
+    )
+    s = requests_retry_session(retries=2, backoff_factor=0, pool_key="httpbin")
+    with pytest.raises(RetryError):
+        s.get("https://httpbin.org/get")
+    assert len(httpretty.latest_requests()) == 3
+    close_pooled_adapters()
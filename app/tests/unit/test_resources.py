@@ -159,7 +159,8 @@ class TestResources(TestCase):
             self,
         )
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.journeys.view.balance_changes.mode", "off")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.publish.balance", autospec=True)
     @mock.patch("app.journeys.view.agent_login", autospec=True)
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
@@ -175,7 +176,7 @@ class TestResources(TestCase):
         mock_get_aes_key,
     ):
         mock_publish_balance.return_value = {"user_id": 2, "scheme_account_id": 4, "bink_user_id": 777}
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/balance?credentials={0}&user_set={1}&scheme_account_id={2}&bink_user_id={3}".format(
             credentials, 1, 2, 777
@@ -189,7 +190,61 @@ class TestResources(TestCase):
         self.assertEqual(response.json, {"user_id": 2, "scheme_account_id": 4, "bink_user_id": 777})
         self.assertFalse(mock_async_balance_and_publish.called)
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
+    @mock.patch("app.resources.get_balances_and_publish", autospec=True)
+    def test_bulk_balance(self, mock_get_balances_and_publish, mock_get_aes_key):
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
+        mock_get_balances_and_publish.return_value = [
+            {"scheme_account_id": 1, "balance": {"points": 1}, "status": 1, "error": None},
+            {"scheme_account_id": 3, "balance": None, "status": 403, "error": {"name": "Invalid credentials"}},
+        ]
+        accounts = [
+            {"scheme_account_id": 1, "user_set": "1", "credentials": encrypted_credentials(), "status": 1},
+            {"scheme_account_id": 2, "user_set": "2", "credentials": "not encrypted"},
+            {"scheme_account_id": 3, "user_id": 3, "credentials": encrypted_credentials(), "journey_type": 2},
+        ]
+
+        response = self.client.post("/bpl-trenette/balances", json={"accounts": accounts})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json["results"]
+        self.assertEqual([result["scheme_account_id"] for result in results], [1, 2, 3])
+        self.assertEqual(results[1]["error"]["name"], "Invalid account")
+        agent_class, scheme_slug, user_infos, _ = mock_get_balances_and_publish.call_args[0]
+        self.assertEqual(agent_class, Bpl)
+        self.assertEqual(scheme_slug, "bpl-trenette")
+        self.assertEqual(
+            user_infos,
+            [
+                {
+                    "credentials": {},
+                    "status": 1,
+                    "user_set": "1",
+                    "bink_user_id": None,
+                    "journey_type": None,
+                    "scheme_account_id": 1,
+                },
+                {
+                    "credentials": {},
+                    "status": None,
+                    "user_set": "3",
+                    "bink_user_id": None,
+                    "journey_type": 2,
+                    "scheme_account_id": 3,
+                },
+            ],
+        )
+
+    def test_bulk_balance_bad_request(self):
+        response = self.client.post("/bpl-trenette/balances", json={})
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch("settings.BULK_BALANCE_MAX_ACCOUNTS", 1):
+            response = self.client.post("/bpl-trenette/balances", json={"accounts": [{}, {}]})
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("app.journeys.view.balance_changes.mode", "off")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.publish.balance", autospec=True)
     @mock.patch("app.journeys.view.agent_login", autospec=True)
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
@@ -198,7 +253,7 @@ class TestResources(TestCase):
         self, mock_update_pending_join_account, mock_pool, mock_agent_login, mock_publish_balance, mock_get_aes_key
     ):
         mock_publish_balance.return_value = None
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/balance?credentials={0}&user_set={1}&scheme_account_id={2}".format(credentials, 1, 2)
         response = self.client.get(url)
@@ -209,7 +264,8 @@ class TestResources(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIsNone(response.json)
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.journeys.view.balance_changes.mode", "off")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.publish.balance", autospec=True)
     @mock.patch("app.journeys.view.agent_login", autospec=True)
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
@@ -218,7 +274,7 @@ class TestResources(TestCase):
         self, mock_update_pending_join_account, mock_pool, mock_agent_login, mock_publish_balance, mock_get_aes_key
     ):
         mock_publish_balance.side_effect = Exception("test error")
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/balance?credentials={0}&user_set={1}&scheme_account_id={2}".format(credentials, 1, 2)
         response = self.client.get(url)
@@ -231,13 +287,13 @@ class TestResources(TestCase):
         self.assertEqual("test error", response.json["message"])
         self.assertEqual(520, response.json["code"])
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.publish.transactions", autospec=True)
     @mock.patch("app.resources.agent_login", autospec=True)
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     def test_transactions(self, mock_pool, mock_agent_login, mock_publish_transactions, mock_get_aes_key):
         mock_publish_transactions.return_value = [{"points": Decimal("10.00")}]
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/transactions?credentials={0}&scheme_account_id={1}&user_id={2}".format(credentials, 3, 5)
         response = self.client.get(url)
@@ -252,7 +308,7 @@ class TestResources(TestCase):
             ],
         )
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.publish.transactions", autospec=True)
     @mock.patch("app.resources.agent_login", autospec=True)
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
@@ -260,7 +316,7 @@ class TestResources(TestCase):
         self, mock_pool, mock_agent_login, mock_publish_transactions, mock_get_aes_key
     ):
         mock_publish_transactions.return_value = None
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/transactions?credentials={0}&scheme_account_id={1}&user_id={2}".format(credentials, 3, 5)
         response = self.client.get(url)
@@ -270,13 +326,13 @@ class TestResources(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIsNone(response.json)
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     @mock.patch("app.publish.transactions", autospec=True)
     @mock.patch("app.resources.agent_login", autospec=True)
     def test_transactions_unknown_error(self, mock_agent_login, mock_publish_transactions, mock_pool, mock_get_aes_key):
         mock_publish_transactions.side_effect = Exception("test error")
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/transactions?credentials={0}&scheme_account_id={1}&user_id={2}".format(credentials, 3, 5)
         response = self.client.get(url)
@@ -288,13 +344,13 @@ class TestResources(TestCase):
         self.assertEqual("test error", response.json["message"])
         self.assertEqual(520, response.json["code"])
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     @mock.patch("app.publish.transactions", autospec=True)
     @mock.patch("app.resources.agent_login", autospec=True)
     def test_transactions_login_error(self, mock_agent_login, mock_publish_transactions, mock_pool, mock_get_aes_key):
         mock_publish_transactions.side_effect = StatusLoginFailedError()
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/transactions?credentials={0}&scheme_account_id={1}&user_id={2}".format(credentials, 3, 5)
         response = self.client.get(url)
@@ -320,10 +376,10 @@ class TestResources(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 404)
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     def test_bad_agent_updates_status(self, mock_submit, mock_get_aes_key):
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         test_creds = json.dumps({"username": "NZ57271", "password": "d4Hgvf47"})
         aes_cipher = AESCipher(local_aes_key.encode())
         credentials = aes_cipher.encrypt(test_creds).decode("utf-8")
@@ -346,10 +402,10 @@ class TestResources(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json, {"message": 'Please provide either "user_set" or "user_id" parameters'})
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.queue.enqueue_request", autospec=True)
     def test_register_view(self, mock_enqueue_request, mock_get_aes_key):
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/register"
         data = {
@@ -365,10 +421,10 @@ class TestResources(TestCase):
         self.assertTrue(mock_enqueue_request.called)
         self.assertEqual(response.json, {"message": "success"})
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.queue.enqueue_request", autospec=True)
     def test_join_view(self, mock_enqueue_request, mock_get_aes_key):
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = encrypted_credentials()
         url = "/bpl-trenette/join"
         data = {
@@ -584,7 +640,7 @@ class TestResources(TestCase):
             agent_login(Bpl, user_info, scheme_slug="bpl-trenette", from_join=True)
         self.assertTrue(mock_attempt_login.called)
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     @mock.patch("app.publish.balance", autospec=False)
     @mock.patch("app.journeys.view.agent_login", autospec=False)
@@ -596,7 +652,7 @@ class TestResources(TestCase):
         mock_agent = self.Agent(None)
         mock_agent.identifier = True
         mock_login.return_value = mock_agent
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = {
             "username": "la@loyaltyangels.com",
             "password": "YSHansbrics6",
@@ -614,7 +670,8 @@ class TestResources(TestCase):
         self.assertTrue(mock_pool.called)
         self.assertIsNone(mock_pool.call_args[1]["journey"])
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.journeys.view.balance_changes.mode", "off")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     @mock.patch("app.publish.balance", autospec=False)
     @mock.patch("app.journeys.view.agent_login", autospec=False)
@@ -625,7 +682,7 @@ class TestResources(TestCase):
         mock_publish_balance.return_value = {"points": 1}
         mock_login.return_value = mock.MagicMock()
         mock_login().identifier = None
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = {
             "username": "la@loyaltyangels.com",
             "password": "YSHansbrics6",
@@ -745,6 +802,7 @@ class TestResources(TestCase):
 
         self.assertTrue(mock_delete.called)
 
+    @mock.patch("app.journeys.view.balance_changes.mode", "off")
     @mock.patch("app.journeys.view.update_pending_join_account", autospec=True)
     @mock.patch("app.journeys.view.agent_login", autospec=True)
     @mock.patch("app.publish.status", autospec=True)
@@ -860,7 +918,7 @@ class TestResources(TestCase):
         self.assertFalse(mock_transactions.called)
         self.assertTrue(mock_update_pending_link_account.called)
 
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.resources.thread_pool_executor.submit", autospec=True)
     @mock.patch("app.publish.balance", autospec=False)
     @mock.patch("app.journeys.view.agent_login", autospec=False)
@@ -873,7 +931,7 @@ class TestResources(TestCase):
         mock_agent.identifier = True
         mock_agent.create_journey = "join"
         mock_login.return_value = mock_agent
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         credentials = {
             "username": "la@loyaltyangels.com",
             "password": "YSHansbrics6",
@@ -893,7 +951,7 @@ class TestResources(TestCase):
 
     @httpretty.activate
     @mock.patch("app.publish.status", autospec=True)
-    @mock.patch("app.resources.get_aes_key")
+    @mock.patch("app.encryption.get_aes_keys")
     @mock.patch("app.agents.base.Configuration")
     @mock.patch("app.journeys.common.redis_retry")
     def test_balance_response_format(self, mock_retry, mock_configuration, mock_get_aes_key, mock_publish_status):
@@ -901,7 +959,7 @@ class TestResources(TestCase):
 
         config = mock_configuration.return_value
         config.merchant_url = "http://testbink.com/"
-        mock_get_aes_key.return_value = local_aes_key.encode()
+        mock_get_aes_key.return_value = [local_aes_key.encode()]
         config.security_credentials = {
             "outbound": {
                 "credentials": [
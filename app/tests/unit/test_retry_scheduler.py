@@ -0,0 +1,170 @@
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+import sqlalchemy as s
+from sqlalchemy.orm import sessionmaker
+
+from app import db
+from app.models import RetryTask, RetryTaskStatuses
+from app.retry_scheduler import RetryScheduler
+from app.retry_util import enqueue_due_retry_task, enqueue_retry_task_delay
+
+
+@pytest.fixture
+def session_maker(tmp_path, monkeypatch):
+    engine = s.create_engine(f"sqlite:///{tmp_path / 'midas.db'}")
+    db.Base.metadata.create_all(bind=engine)
+    session_maker = sessionmaker(bind=engine)
+    monkeypatch.setattr(db, "SessionMaker", session_maker)
+    return session_maker
+
+
+def add_task(session_maker, scheme_account_id, next_attempt_time, status=RetryTaskStatuses.RETRYING):
+    with session_maker() as session:
+        session.add(
+            RetryTask(
+                request_data={"scheme_account_id": scheme_account_id},
+                journey_type="attempt-join",
+                message_uid=f"tid-{scheme_account_id}",
+                scheme_identifier="bpl-trenette",
+                scheme_account_id=scheme_account_id,
+                status=status,
+                next_attempt_time=next_attempt_time,
+            )
+        )
+        session.commit()
+
+
+def get_next_attempt_times(session_maker):
+    with session_maker() as session:
+        return dict(session.execute(s.select(RetryTask.scheme_account_id, RetryTask.next_attempt_time)).all())
+
+
+@mock.patch("app.retry_scheduler.enqueue_due_retry_task")
+def test_due_tasks_are_claimed_and_enqueued(mock_enqueue, session_maker):
+    past = datetime.utcnow() - timedelta(minutes=5)
+    future = datetime.utcnow() + timedelta(minutes=5)
+    add_task(session_maker, 1, past)
+    add_task(session_maker, 2, past, status=RetryTaskStatuses.PENDING)
+    add_task(session_maker, 3, future)
+    add_task(session_maker, 4, past, status=RetryTaskStatuses.FAILED)
+    add_task(session_maker, 5, None)
+    scheduler = RetryScheduler(connection=mock.sentinel.redis, batch_size=10)
+
+    assert scheduler.dispatch_due_tasks() == 2
+
+    enqueued = [call.kwargs["retry_task"].scheme_account_id for call in mock_enqueue.call_args_list]
+    assert sorted(enqueued) == [1, 2]
+    assert mock_enqueue.call_args.kwargs["connection"] is mock.sentinel.redis
+    next_attempt_times = get_next_attempt_times(session_maker)
+    assert next_attempt_times[1] is None and next_attempt_times[2] is None
+    assert next_attempt_times[3] == future
+    # claimed tasks are no longer due
+    assert scheduler.dispatch_due_tasks() == 0
+
+
+@mock.patch("app.retry_scheduler.enqueue_due_retry_task")
+def test_tasks_are_claimed_in_batches(mock_enqueue, session_maker):
+    past = datetime.utcnow() - timedelta(minutes=5)
+    for scheme_account_id in range(5):
+        add_task(session_maker, scheme_account_id, past - timedelta(seconds=scheme_account_id))
+    scheduler = RetryScheduler(connection=mock.sentinel.redis, batch_size=2)
+
+    assert scheduler.dispatch_due_tasks() == 2
+    # the longest overdue tasks go first
+    assert [call.kwargs["retry_task"].scheme_account_id for call in mock_enqueue.call_args_list] == [4, 3]
+
+
+@mock.patch("app.retry_scheduler.enqueue_due_retry_task", side_effect=ConnectionError)
+def test_task_that_cant_be_enqueued_is_unclaimed(mock_enqueue, session_maker):
+    past = datetime.utcnow() - timedelta(minutes=5)
+    add_task(session_maker, 1, past)
+    scheduler = RetryScheduler(connection=mock.sentinel.redis)
+
+    scheduler.dispatch_due_tasks()
+
+    assert get_next_attempt_times(session_maker)[1] == past
+
+
+@mock.patch("app.retry_util.rq.Queue")
+def test_enqueue_due_retry_task_runs_the_task_journey(mock_queue):
+    join_task = RetryTask(
+        journey_type="attempt-join",
+        request_data={"credentials": "x"},
+        message_uid="tid",
+        scheme_identifier="bpl-trenette",
+        scheme_account_id=1,
+    )
+    login_task = RetryTask(
+        journey_type="attempt-login", request_data={"credentials": "x"}, scheme_identifier="slim-chickens"
+    )
+
+    enqueue_due_retry_task(connection=mock.sentinel.redis, retry_task=join_task)
+    enqueue_due_retry_task(connection=mock.sentinel.redis, retry_task=login_task)
+
+    join_call, login_call = mock_queue.return_value.enqueue.call_args_list
+    assert join_call.args == ("app.journeys.join.attempt_join",)
+    assert join_call.kwargs["args"] == [1, "tid", "bpl-trenette", {"credentials": "x"}]
+    assert login_call.args == ("app.journeys.join.login_and_publish_status",)
+    assert login_call.kwargs["args"] == [{"credentials": "x"}, "slim-chickens", 5]
+
+
+@mock.patch("app.retry_util.rq.Queue")
+def test_delayed_retries_are_left_to_the_scheduler_when_enabled(mock_queue, monkeypatch):
+    monkeypatch.setattr("settings.RETRY_SCHEDULER_ENABLED", True)
+
+    next_attempt_time = enqueue_retry_task_delay(
+        connection=mock.sentinel.redis, args=[], delay_seconds=60, call_function="app.journeys.join.attempt_join"
+    )
+
+    assert next_attempt_time > datetime.now(next_attempt_time.tzinfo)
+    mock_queue.return_value.enqueue_at.assert_not_called()
+
+
+@mock.patch("app.retry_util.rq.Queue")
+def test_delayed_retries_are_scheduled_with_rq_by_default(mock_queue):
+    next_attempt_time = enqueue_retry_task_delay(
+        connection=mock.sentinel.redis, args=[1], delay_seconds=60, call_function="app.journeys.join.attempt_join"
+    )
+
+    mock_queue.return_value.enqueue_at.assert_called_once_with(
+        next_attempt_time, "app.journeys.join.attempt_join", args=[1], failure_ttl=mock.ANY, at_front=False
+    )
+
+
+def test_run_polls_until_stopped():
+    scheduler = RetryScheduler(connection=mock.sentinel.redis, interval=60)
+    polled = threading.Event()
+
+    def dispatch_due_tasks():
+        polled.set()
+        return 0
+
+    with (
+        mock.patch.object(scheduler, "cancel_rq_scheduled_jobs") as mock_cancel,
+        mock.patch.object(scheduler, "dispatch_due_tasks", side_effect=dispatch_due_tasks) as mock_dispatch,
+    ):
+        scheduler.start()
+        assert polled.wait(timeout=5)
+        scheduler.stop()
+
+    assert not scheduler._thread.is_alive()
+    # with no backlog the scheduler waits for the next poll
+    mock_dispatch.assert_called_once()
+    mock_cancel.assert_called_once()
+
+
+@mock.patch("app.retry_scheduler.ScheduledJobRegistry")
+def test_retries_scheduled_with_rq_are_cancelled(mock_registry):
+    mock_registry.return_value.get_job_ids.return_value = ["job-1", "job-2"]
+    scheduler = RetryScheduler(connection=mock.sentinel.redis)
+
+    assert scheduler.cancel_rq_scheduled_jobs() == 2
+
+    mock_registry.assert_called_once_with("midas-retry", connection=mock.sentinel.redis)
+    assert mock_registry.return_value.remove.call_args_list == [
+        mock.call("job-1", delete_job=True),
+        mock.call("job-2", delete_job=True),
+    ]
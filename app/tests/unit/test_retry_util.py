@@ -11,6 +11,7 @@ from app.retry_util import (
     create_task,
     delete_task,
     fail_callback_task,
+    get_task,
     reset_task_for_callback_attempt,
     update_callback_attempt,
     update_task_for_retry,
@@ -32,6 +33,27 @@ class TestRetryUtil(unittest.TestCase):
         self.db_session.close()
         drop_database(engine.url)
 
+    def test_get_task_by_journey_type(self):
+        with db.session_scope() as session:
+            join_task = create_task(
+                db_session=session,
+                user_info={},
+                journey_type="attempt-join",
+                message_uid="123",
+                scheme_identifier="scheme",
+                scheme_account_id="123",
+            )
+            login_task = create_task(
+                db_session=session,
+                user_info={},
+                journey_type="attempt-login",
+                message_uid="456",
+                scheme_identifier="scheme",
+                scheme_account_id="123",
+            )
+            self.assertEqual(get_task(session, "123"), join_task)
+            self.assertEqual(get_task(session, "123", journey_type="attempt-login"), login_task)
+
     def test_update_task_for_retry(self):
         with db.session_scope() as session:
             retry_task = create_task(
@@ -5,10 +5,14 @@ import unittest
 from unittest import mock
 
 import arrow
+from Crypto.PublicKey import RSA as CRYPTO_RSA
+from flask import Flask
 from soteria.configuration import Configuration
 
+from app.config_cache import config_cache
 from app.exceptions import ConfigurationError, UnknownError, ValidationError
 from app.security.base import BaseSecurity
+from app.security.key_cache import SecurityKeyCache, security_key_cache
 from app.security.open_auth import OpenAuth
 from app.security.rsa import RSA
 from app.security.utils import authorise, get_security_agent
@@ -83,6 +87,19 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(UnknownError):
             some_function()
 
+    @mock.patch("app.security.utils.config_cache")
+    def test_authorise_uses_cached_configuration(self, mock_config_cache):
+        config = mock_config_cache.get.return_value
+        config.security_credentials = {"inbound": {"service": Configuration.OPEN_AUTH_SECURITY, "credentials": []}}
+
+        @authorise(Configuration.JOIN_HANDLER)
+        def view(data, config, scheme_slug):
+            return data
+
+        with Flask(__name__).test_request_context(data='{"abc": "123"}'):
+            self.assertEqual(view(scheme_slug="iceland-bonus-card"), {"abc": "123"})
+        mock_config_cache.get.assert_called_once_with("iceland-bonus-card", Configuration.JOIN_HANDLER, mock.ANY)
+
 
 class TestOpenAuth(unittest.TestCase):
     def setUp(self) -> None:
@@ -140,6 +157,51 @@ class TestRSA(unittest.TestCase):
 
         self.assertEqual(decoded_json, json_data)
 
+    @mock.patch("app.security.key_cache.CRYPTO_RSA.importKey", wraps=CRYPTO_RSA.importKey)
+    def test_keys_are_parsed_once(self, mock_import_key):
+        self.rsa.scheme_slug, self.rsa.handler_type = "test-rsa-cache", Configuration.JOIN_HANDLER
+        json_data = json.dumps({"abc": "123"})
+
+        for _ in range(3):
+            self.rsa.decode(self.rsa.encode(json_data)["headers"], json_data)
+
+        self.assertEqual(mock_import_key.call_count, 2)
+        security_key_cache.invalidate("test-rsa-cache")
+
+
+class TestSecurityKeyCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache = SecurityKeyCache()
+
+    def test_get_rsa_key_is_cached_by_fingerprint(self):
+        key = self.cache.get_rsa_key("iceland-bonus-card", Configuration.JOIN_HANDLER, PUBLIC_KEY)
+
+        self.assertIs(self.cache.get_rsa_key("iceland-bonus-card", Configuration.JOIN_HANDLER, PUBLIC_KEY), key)
+        self.assertIsNot(self.cache.get_rsa_key("iceland-bonus-card", Configuration.JOIN_HANDLER, PRIVATE_KEY), key)
+        self.assertFalse(key.key.has_private())
+        self.assertEqual(len(self.cache._entries), 2)
+
+    def test_invalidate(self):
+        self.cache.get_rsa_key("iceland-bonus-card", Configuration.JOIN_HANDLER, PUBLIC_KEY)
+        self.cache.get_rsa_key("iceland-bonus-card", Configuration.VALIDATE_HANDLER, PUBLIC_KEY)
+        self.cache.get_rsa_key("bpl-trenette", Configuration.JOIN_HANDLER, PUBLIC_KEY)
+
+        self.cache.invalidate("iceland-bonus-card", Configuration.JOIN_HANDLER)
+        self.assertEqual(
+            {key[:2] for key in self.cache._entries},
+            {("iceland-bonus-card", Configuration.VALIDATE_HANDLER), ("bpl-trenette", Configuration.JOIN_HANDLER)},
+        )
+
+        self.cache.invalidate()
+        self.assertEqual(self.cache._entries, {})
+
+    def test_invalidated_with_configuration_cache(self):
+        security_key_cache.get_rsa_key("test-invalidate", Configuration.JOIN_HANDLER, PUBLIC_KEY)
+
+        config_cache.invalidate("test-invalidate")
+
+        self.assertNotIn("test-invalidate", {key[0] for key in security_key_cache._entries})
+
 
 class TestBaseSecurity(unittest.TestCase):
     def setUp(self) -> None:
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from unittest import mock
+
+import redis.exceptions as redis_exceptions
+
+from app.security.token_cache import CachedToken, RedisTokenBackend, SecurityTokenCache
+
+URL = "https://reflector.dev.gb.bink.com/mock/oauth2/token/"
+
+
+def test_tokens_are_cached_per_url_and_client():
+    cache = SecurityTokenCache(refresh_margin=60)
+    fetch = mock.MagicMock(side_effect=[{"access_token": "token-1", "expires_in": 3600}, {"access_token": "token-2"}])
+
+    assert cache.get(URL, "client-1", fetch) == "token-1"
+    assert cache.get(URL, "client-1", fetch) == "token-1"
+    assert cache.get(URL, "client-2", fetch) == "token-2"
+    assert fetch.call_count == 2
+
+
+def test_token_within_refresh_margin_is_fetched_again():
+    cache = SecurityTokenCache(refresh_margin=60)
+    cache._tokens[(URL, "client-1")] = CachedToken("old", expires_at=time.time() + 30)
+
+    assert cache.get(URL, "client-1", lambda: {"access_token": "new", "expires_in": 3600}) == "new"
+
+
+def test_concurrent_requests_fetch_the_token_once():
+    def slow_fetch():
+        time.sleep(0.1)
+        return {"access_token": "token-1", "expires_in": 3600}
+
+    cache = SecurityTokenCache()
+    fetch = mock.MagicMock(side_effect=slow_fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(URL, "client-1", fetch))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    fetch.assert_called_once()
+    assert results == ["token-1"] * 10
+
+
+@mock.patch("app.security.token_cache.get_redis")
+def test_redis_backend_shares_tokens(mock_get_redis):
+    mock_redis = mock_get_redis.return_value
+    mock_redis.get.return_value = None
+    cache = SecurityTokenCache(backend=RedisTokenBackend(lock_timeout=5))
+
+    assert cache.get(URL, "client-1", lambda: {"access_token": "token-1", "expires_in": 3600}) == "token-1"
+
+    redis_key = f"security-oauth-token:{URL}:client-1"
+    mock_redis.lock.assert_called_once_with(f"{redis_key}-lock", timeout=5, blocking_timeout=5)
+    mock_redis.lock.return_value.release.assert_called_once()
+    assert mock_redis.set.call_args.args[0] == redis_key
+    assert json.loads(mock_redis.set.call_args.args[1])["access_token"] == "token-1"
+    assert 3590 < mock_redis.set.call_args.kwargs["ex"] <= 3600
+
+
+@mock.patch("app.security.token_cache.get_redis")
+def test_redis_backend_uses_token_fetched_by_another_process(mock_get_redis):
+    shared = json.dumps({"access_token": "other-process", "expires_at": time.time() + 3600})
+    mock_get_redis.return_value.get.side_effect = [None, shared]
+    cache = SecurityTokenCache(backend=RedisTokenBackend())
+    fetch = mock.MagicMock()
+
+    assert cache.get(URL, "client-1", fetch) == "other-process"
+    fetch.assert_not_called()
+
+
+@mock.patch("app.security.token_cache.get_redis")
+def test_redis_backend_without_redis(mock_get_redis):
+    mock_redis = mock_get_redis.return_value
+    mock_redis.get.side_effect = mock_redis.set.side_effect = redis_exceptions.ConnectionError
+    mock_redis.lock.return_value.acquire.side_effect = redis_exceptions.ConnectionError
+    cache = SecurityTokenCache(backend=RedisTokenBackend())
+
+    assert cache.get(URL, "client-1", lambda: {"access_token": "token-1", "expires_in": 3600}) == "token-1"
+    mock_redis.lock.return_value.release.assert_not_called()
+
+
+def test_invalidate():
+    cache = SecurityTokenCache()
+    token = CachedToken("token", expires_at=time.time() + 3600)
+    cache._tokens = {(URL, "client-1"): token, ("https://other/token", "client-1"): token}
+
+    cache.invalidate(URL)
+    assert set(cache._tokens) == {("https://other/token", "client-1")}
+
+    cache.invalidate()
+    assert cache._tokens == {}
+
+
+def test_reject_drops_only_the_rejected_token():
+    cache = SecurityTokenCache()
+    cache._tokens = {(URL, "client-1"): CachedToken("token-1", expires_at=time.time() + 3600)}
+
+    cache.reject(URL, "client-1", "old-token")
+    assert cache.get(URL, "client-1", mock.MagicMock()) == "token-1"
+
+    cache.reject(URL, "client-1", "token-1")
+    assert cache.get(URL, "client-1", lambda: {"access_token": "token-2", "expires_in": 3600}) == "token-2"
+
+
+@mock.patch("app.security.token_cache.get_redis")
+def test_reject_deletes_the_shared_token(mock_get_redis):
+    mock_redis = mock_get_redis.return_value
+    mock_redis.get.return_value = json.dumps({"access_token": "token-1", "expires_at": time.time() + 3600})
+    cache = SecurityTokenCache(backend=RedisTokenBackend())
+
+    cache.reject(URL, "client-1", "another-token")
+    mock_redis.delete.assert_not_called()
+
+    cache.reject(URL, "client-1", "token-1")
+    mock_redis.delete.assert_called_once_with(f"security-oauth-token:{URL}:client-1")
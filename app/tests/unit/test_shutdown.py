@@ -0,0 +1,29 @@
+from unittest import mock
+
+from app.shutdown import shutdown_background_senders
+
+
+@mock.patch("app.shutdown.prometheus_pusher")
+@mock.patch("app.shutdown.audit_exporter")
+@mock.patch("app.shutdown.hermes_publisher")
+@mock.patch("app.shutdown.hades_publisher")
+@mock.patch("app.shutdown.hades_batcher")
+def test_metrics_are_pushed_after_everything_else_is_flushed(
+    mock_hades_batcher, mock_hades_publisher, mock_hermes_publisher, mock_audit_exporter, mock_prometheus_pusher
+):
+    manager = mock.Mock()
+    manager.attach_mock(mock_hades_batcher, "hades_batcher")
+    manager.attach_mock(mock_hades_publisher, "hades_publisher")
+    manager.attach_mock(mock_hermes_publisher, "hermes_publisher")
+    manager.attach_mock(mock_audit_exporter, "audit_exporter")
+    manager.attach_mock(mock_prometheus_pusher, "prometheus_pusher")
+
+    shutdown_background_senders()
+
+    assert manager.mock_calls == [
+        mock.call.hades_batcher.shutdown(),
+        mock.call.hades_publisher.shutdown(),
+        mock.call.hermes_publisher.shutdown(),
+        mock.call.audit_exporter.shutdown(),
+        mock.call.prometheus_pusher.shutdown(),
+    ]
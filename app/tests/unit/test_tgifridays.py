@@ -354,6 +354,7 @@ class TestTGIFridaysJoin(unittest.TestCase):
 
         mock_dashboard_url.assert_called_once()
 
+    @mock.patch("settings.AUDIT_EXPORT_ASYNC", False)
     @responses.activate
     def test_join_happy_path(
         self,
@@ -480,6 +481,7 @@ class TestTGIFridaysLogin(unittest.TestCase):
     def setUp(self):
         self.tgi_fridays = tgi_fridays(journey_type=JourneyTypes.LINK)
 
+    @mock.patch("settings.AUDIT_EXPORT_ASYNC", False)
     @responses.activate
     def test_login_success(
         self,
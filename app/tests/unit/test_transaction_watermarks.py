@@ -0,0 +1,135 @@
+from decimal import Decimal
+from unittest import mock
+
+import arrow
+import redis.exceptions as redis_exceptions
+
+from app.agents.schemas import Transaction
+from app.journeys.common import publish_transactions
+from app.transaction_watermarks import TransactionWatermarkStore, transaction_watermarks
+
+SCHEME_ACCOUNT_ID = 1
+DAY = 60 * 60 * 24
+
+
+def make_transaction(date, tx_hash):
+    return Transaction(date=arrow.get(date), description="Test", points=Decimal("10"), hash=tx_hash)
+
+
+def test_first_refresh_publishes_every_transaction():
+    store = TransactionWatermarkStore(ttl=60, lookback=DAY)
+    transactions = [make_transaction("2022-01-01", "a"), make_transaction("2022-01-02", "b")]
+
+    watermark = store.get(SCHEME_ACCOUNT_ID)
+    assert store.since(watermark) is None
+    assert store.filter_new(transactions, watermark) == transactions
+
+    store.advance(SCHEME_ACCOUNT_ID, transactions)
+    assert store.get(SCHEME_ACCOUNT_ID) == (
+        arrow.get("2022-01-02"),
+        {"a": "2022-01-01T00:00:00+00:00", "b": "2022-01-02T00:00:00+00:00"},
+    )
+
+
+def test_only_new_transactions_are_published():
+    store = TransactionWatermarkStore(ttl=60, lookback=DAY)
+    store.advance(SCHEME_ACCOUNT_ID, [make_transaction("2022-01-01", "a"), make_transaction("2022-01-02", "b")])
+    transactions = [
+        make_transaction("2022-01-01", "a"),
+        make_transaction("2022-01-02", "b"),
+        make_transaction("2022-01-02", "c"),
+        make_transaction("2022-01-03", "d"),
+    ]
+
+    watermark = store.get(SCHEME_ACCOUNT_ID)
+    assert store.since(watermark) == arrow.get("2022-01-01")
+    assert [tx.hash for tx in store.filter_new(transactions, watermark)] == ["c", "d"]
+
+
+def test_late_transactions_within_the_lookback_window_are_published():
+    store = TransactionWatermarkStore(ttl=60, lookback=2 * DAY)
+    store.advance(SCHEME_ACCOUNT_ID, [make_transaction("2022-01-05", "e")])
+    transactions = [
+        make_transaction("2022-01-02", "too-late"),
+        make_transaction("2022-01-03", "late"),
+        make_transaction("2022-01-05", "e"),
+    ]
+
+    watermark = store.get(SCHEME_ACCOUNT_ID)
+    assert [tx.hash for tx in store.filter_new(transactions, watermark)] == ["late"]
+
+
+def test_hashes_outside_the_lookback_window_are_dropped():
+    store = TransactionWatermarkStore(ttl=60, lookback=DAY)
+    store.advance(SCHEME_ACCOUNT_ID, [make_transaction("2022-01-01", "a"), make_transaction("2022-01-02", "b")])
+
+    store.advance(SCHEME_ACCOUNT_ID, [make_transaction("2022-01-03", "c")])
+
+    assert store.get(SCHEME_ACCOUNT_ID).hashes.keys() == {"b", "c"}
+
+
+def test_watermark_never_goes_back():
+    store = TransactionWatermarkStore(ttl=60, lookback=DAY)
+    store.advance(SCHEME_ACCOUNT_ID, [make_transaction("2022-01-02", "b")])
+
+    store.advance(SCHEME_ACCOUNT_ID, [make_transaction("2022-01-01", "a")])
+
+    assert store.get(SCHEME_ACCOUNT_ID) == (
+        arrow.get("2022-01-02"),
+        {"a": "2022-01-01T00:00:00+00:00", "b": "2022-01-02T00:00:00+00:00"},
+    )
+
+
+def test_watermark_without_hash_dates_is_read(in_memory_redis):
+    in_memory_redis.set(
+        TransactionWatermarkStore._key(SCHEME_ACCOUNT_ID), '{"date": "2022-01-02T00:00:00+00:00", "hashes": ["b"]}'
+    )
+
+    watermark = TransactionWatermarkStore(ttl=60, lookback=DAY).get(SCHEME_ACCOUNT_ID)
+
+    assert watermark == (arrow.get("2022-01-02"), {"b": "2022-01-02T00:00:00+00:00"})
+
+
+@mock.patch("app.transaction_watermarks.get_redis")
+def test_every_transaction_is_published_without_redis(mock_get_redis):
+    mock_get_redis.return_value.get.side_effect = redis_exceptions.ConnectionError
+    mock_get_redis.return_value.set.side_effect = redis_exceptions.ConnectionError
+    store = TransactionWatermarkStore(ttl=60)
+    transactions = [make_transaction("2022-01-01", "a")]
+
+    watermark = store.get(SCHEME_ACCOUNT_ID)
+    assert store.filter_new(transactions, watermark) == transactions
+    store.advance(SCHEME_ACCOUNT_ID, transactions)
+
+
+@mock.patch("app.journeys.common.publish.transactions")
+def test_publish_transactions_publishes_new_transactions_and_asks_for_deltas(mock_publish):
+    agent = mock.MagicMock()
+    agent.transactions.return_value = [make_transaction("2022-01-01", "a")]
+
+    publish_transactions(agent, SCHEME_ACCOUNT_ID, "1", "tid")
+    assert agent.transactions_since is None
+    assert [tx["hash"] for tx in mock_publish.call_args.args[0]] == ["a"]
+
+    # the watermark only moves once Hades has accepted the transactions
+    assert transaction_watermarks.get(SCHEME_ACCOUNT_ID) is None
+    mock_publish.call_args.kwargs["on_published"]()
+
+    agent.transactions.return_value = [make_transaction("2022-01-01", "a"), make_transaction("2022-01-02", "b")]
+    publish_transactions(agent, SCHEME_ACCOUNT_ID, "1", "tid")
+    assert agent.transactions_since == arrow.get("2022-01-01").shift(seconds=-transaction_watermarks.lookback)
+    assert [tx["hash"] for tx in mock_publish.call_args.args[0]] == ["b"]
+    mock_publish.call_args.kwargs["on_published"]()
+    assert transaction_watermarks.get(SCHEME_ACCOUNT_ID).date == arrow.get("2022-01-02")
+
+
+@mock.patch("app.publish.HADES_BATCH_PUBLISH", False)
+@mock.patch("app.publish.hades_publisher.request", return_value=None)
+def test_dropped_publish_is_published_on_the_next_refresh(mock_request):
+    agent = mock.MagicMock()
+    agent.transactions.return_value = [make_transaction("2022-01-01", "a")]
+
+    publish_transactions(agent, SCHEME_ACCOUNT_ID, "1", "tid")
+    publish_transactions(agent, SCHEME_ACCOUNT_ID, "1", "tid")
+
+    assert [[tx["hash"] for tx in call.args[2]] for call in mock_request.call_args_list] == [["a"], ["a"]]
@@ -1,10 +1,24 @@
+import asyncio
 import unittest
+from concurrent.futures import Future
+from decimal import Decimal
 from unittest import mock
 from unittest.mock import Mock
 
+import arrow
+
 import settings
-from app.agents.schemas import Balance
-from app.journeys.view import request_balance, set_iceland_user_info_status_and_journey_type
+from app.agents.schemas import Balance, Transaction
+from app.exceptions import StatusLoginFailedError, UnknownError
+from app.journeys.view import (
+    get_balance_and_publish,
+    get_balances_and_publish,
+    get_balances_and_publish_async,
+    request_balance_async,
+    request_balance,
+    set_iceland_user_info_status_and_journey_type,
+)
+from app.publish import HadesBatcher, thread_pool_executor
 from app.scheme_account import JourneyTypes, SchemeAccountStatus
 
 
@@ -42,7 +56,11 @@ class TestView(unittest.TestCase):
         )
 
         mock_publish_balance.assert_called_with(
-            {"points": 0, "value": 0, "value_label": "label", "reward_tier": 0}, "123", "123", "tid"
+            {"points": 0, "value": 0, "value_label": "label", "reward_tier": 0},
+            "123",
+            "123",
+            "tid",
+            on_published=mock.ANY,
         )
         mock_set_iceland_journey.assert_called_with({"status": 0, "user_set": "123"})
         mock_agent_login.assert_called_with(
@@ -63,3 +81,133 @@ class TestView(unittest.TestCase):
         user_info = set_iceland_user_info_status_and_journey_type(user_info)
 
         self.assertEqual(user_info["journey_type"], "not a link journey")
+
+    @mock.patch("app.journeys.view.get_balance_and_publish")
+    def test_get_balances_and_publish(self, mock_get_balance_and_publish):
+        def get_balance_and_publish(agent_class, scheme_slug, user_info, tid, executor):
+            if user_info["scheme_account_id"] == 2:
+                raise StatusLoginFailedError()
+            if user_info["scheme_account_id"] == 4:
+                # e.g. publishing the account's transactions failed
+                raise ValueError("publish failed")
+            return {"points": user_info["scheme_account_id"]}
+
+        mock_get_balance_and_publish.side_effect = get_balance_and_publish
+        user_infos = [{"scheme_account_id": scheme_account_id} for scheme_account_id in (1, 2, 3, 4)]
+
+        outcomes = get_balances_and_publish("agent_class", "bpl-trenette", user_infos, "tid", max_workers=2)
+
+        self.assertEqual(
+            outcomes,
+            [
+                {"scheme_account_id": 1, "balance": {"points": 1}, "status": SchemeAccountStatus.ACTIVE, "error": None},
+                {
+                    "scheme_account_id": 2,
+                    "balance": None,
+                    "status": StatusLoginFailedError.code,
+                    "error": {"name": StatusLoginFailedError.name, "message": StatusLoginFailedError.generic_message},
+                },
+                {"scheme_account_id": 3, "balance": {"points": 3}, "status": SchemeAccountStatus.ACTIVE, "error": None},
+                {
+                    "scheme_account_id": 4,
+                    "balance": None,
+                    "status": UnknownError.code,
+                    "error": {"name": UnknownError.name, "message": "publish failed"},
+                },
+            ],
+        )
+        # the first account is refreshed on its own before the rest are fanned out
+        self.assertEqual(mock_get_balance_and_publish.call_args_list[0][0][2], {"scheme_account_id": 1})
+        # with a publishing pool of its own
+        executors = {call.kwargs["executor"] for call in mock_get_balance_and_publish.call_args_list}
+        self.assertEqual(len(executors), 1)
+        self.assertIsNot(executors.pop(), thread_pool_executor)
+
+    def test_get_balances_and_publish_no_accounts(self):
+        self.assertEqual(get_balances_and_publish("agent_class", "bpl-trenette", [], "tid"), [])
+
+    @mock.patch("app.journeys.view.get_balance_and_publish_async")
+    def test_get_balances_and_publish_async(self, mock_get_balance_and_publish_async):
+        async def get_balance_and_publish_async(agent_class, scheme_slug, user_info, tid):
+            if user_info["scheme_account_id"] == 2:
+                raise StatusLoginFailedError()
+            return {"points": user_info["scheme_account_id"]}
+
+        mock_get_balance_and_publish_async.side_effect = get_balance_and_publish_async
+        user_infos = [{"scheme_account_id": scheme_account_id} for scheme_account_id in (1, 2, 3)]
+
+        outcomes = asyncio.run(get_balances_and_publish_async("agent_class", "bpl-trenette", user_infos, "tid"))
+
+        self.assertEqual([outcome["status"] for outcome in outcomes], [SchemeAccountStatus.ACTIVE, 403, 1])
+        self.assertEqual(outcomes[1]["error"]["name"], StatusLoginFailedError.name)
+
+    @mock.patch("app.journeys.view.get_balances_and_publish_async")
+    def test_get_balances_and_publish_uses_async_engine_when_enabled(self, mock_get_balances_and_publish_async):
+        async def get_balances_and_publish_async(*args):
+            return ["outcome"]
+
+        mock_get_balances_and_publish_async.side_effect = get_balances_and_publish_async
+        agent_class = Mock(supports_async=True)
+
+        with mock.patch("settings.ASYNC_AGENT_ENGINE", True):
+            outcomes = get_balances_and_publish(agent_class, "bpl-trenette", [{"scheme_account_id": 1}], "tid")
+
+        self.assertEqual(outcomes, ["outcome"])
+
+    @mock.patch("app.publish.transactions_async")
+    @mock.patch("app.publish.balance_async")
+    @mock.patch("app.journeys.view.agent_login_async")
+    def test_request_balance_async(self, mock_agent_login_async, mock_publish_balance, mock_publish_transactions):
+        agent_instance = mock.MagicMock(identifier=None, create_journey=None)
+        agent_instance.balance_async = mock.AsyncMock(return_value=Balance(points=1, value=1, value_label=""))
+        agent_instance.transactions_async = mock.AsyncMock(return_value=[])
+        mock_agent_login_async.return_value = agent_instance
+        mock_publish_balance.return_value = {"points": 1}
+        user_info = {"user_set": "1", "scheme_account_id": 1}
+
+        result = asyncio.run(request_balance_async("agent_class", user_info, 1, "bpl-trenette", "tid"))
+
+        self.assertEqual(result, ({"points": 1}, SchemeAccountStatus.ACTIVE, None))
+        mock_publish_balance.assert_awaited_once_with(
+            {"points": 1, "value": 1, "value_label": "", "reward_tier": 0}, 1, "1", "tid", on_published=mock.ANY
+        )
+        mock_publish_transactions.assert_awaited_once_with([], 1, "1", "tid", on_published=mock.ANY)
+
+
+@mock.patch("app.journeys.view.publish.status")
+@mock.patch("app.journeys.view.agent_login")
+def test_balance_refresh_with_default_settings(mock_agent_login, mock_publish_status):
+    """Batched Hades publishing, transaction watermarks and balance change detection are all on by default."""
+    published = Future()
+    published.set_result(Mock(ok=True))
+    hades = Mock()
+    hades.request.return_value = published
+    batcher = HadesBatcher(hades, max_latency=60, max_batch_size=500)
+    agent = mock_agent_login.return_value
+    agent.identifier = None
+    agent.create_journey = None
+    agent.balance.return_value = Balance(points=Decimal(1), value=Decimal(1), value_label="")
+    agent.transactions.return_value = [
+        Transaction(date=arrow.get("2022-01-01"), description="Test", points=Decimal(1), hash="a")
+    ]
+    user_info = {"scheme_account_id": 1, "user_set": "1", "status": SchemeAccountStatus.ACTIVE}
+
+    with mock.patch("app.publish.hades_batcher", batcher):
+        try:
+            get_balance_and_publish("agent_class", "bpl-trenette", dict(user_info), "tid")
+            # the balance and transactions are held until the batch is sent
+            hades.request.assert_not_called()
+            batcher.flush()
+            assert [call.args[1] for call in hades.request.call_args_list] == [
+                f"{settings.HADES_URL}/balance",
+                f"{settings.HADES_URL}/transactions",
+            ]
+
+            # once Hades has accepted them, a refresh that finds nothing new publishes nothing to Hades
+            get_balance_and_publish("agent_class", "bpl-trenette", dict(user_info), "tid")
+            batcher.flush()
+        finally:
+            batcher.shutdown()
+
+    assert hades.request.call_count == 2
+    assert mock_publish_status.call_count == 2
@@ -0,0 +1,102 @@
+"""
+Per scheme account high-water marks of the transactions published to Hades
+"""
+import json
+import typing as t
+
+import arrow
+import redis.exceptions as redis_exceptions
+
+import settings
+from app.agents.schemas import Transaction
+from app.redis_pool import get_redis
+from app.reporting import get_logger
+
+log = get_logger("transaction-watermarks")
+
+
+class Watermark(t.NamedTuple):
+    date: arrow.Arrow  # the date of the newest transaction published
+    hashes: dict[str, str]  # the hash and ISO date of each transaction published within the lookback window
+
+
+class TransactionWatermarkStore:
+    """
+    Records the transactions published for each scheme account, so a balance refresh only publishes the
+    transactions a merchant has added since the last one rather than every transaction the merchant returns.
+
+    A transaction is new if its hash wasn't published, unless it is dated more than `lookback` seconds before the
+    newest transaction published, which is as late as a merchant is expected to post a transaction. Watermarks are
+    only advanced once Hades has accepted the transactions, and are kept in Redis for `ttl` seconds after an
+    account's last refresh. If Redis can't be reached every transaction is published, as Hades ignores transactions
+    it already has.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.TRANSACTION_WATERMARK_TTL,
+        lookback: int = settings.TRANSACTION_WATERMARK_LOOKBACK,
+    ) -> None:
+        self.ttl = ttl
+        self.lookback = lookback
+
+    def get(self, scheme_account_id: int) -> t.Optional[Watermark]:
+        try:
+            value = get_redis().get(self._key(scheme_account_id))
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to get the transaction watermark for scheme account {scheme_account_id}: {repr(e)}")
+            return None
+        if not value:
+            return None
+        data = json.loads(value)
+        hashes = data["hashes"]
+        if isinstance(hashes, list):
+            # watermarks written before the lookback window only kept the hashes on the watermark's date
+            hashes = {tx_hash: data["date"] for tx_hash in hashes}
+        return Watermark(date=arrow.get(data["date"]), hashes=hashes)
+
+    def since(self, watermark: t.Optional[Watermark]) -> t.Optional[arrow.Arrow]:
+        """The date transactions are needed from, the start of the lookback window."""
+        return watermark.date.shift(seconds=-self.lookback) if watermark else None
+
+    def filter_new(self, transactions: list[Transaction], watermark: t.Optional[Watermark]) -> list[Transaction]:
+        if watermark is None:
+            return transactions
+        since = t.cast(arrow.Arrow, self.since(watermark))
+        return [
+            tx
+            for tx in transactions
+            if (tx.hash is None or tx.hash not in watermark.hashes) and arrow.get(tx.date) >= since
+        ]
+
+    def advance(self, scheme_account_id: int, transactions: list[Transaction]) -> None:
+        """
+        Adds `transactions` to the account's watermark once Hades has accepted them, dropping the hashes of
+        transactions that have fallen out of the lookback window.
+        """
+        if not transactions:
+            return
+        watermark = self.get(scheme_account_id)
+        hashes = dict(watermark.hashes) if watermark else {}
+        for tx in transactions:
+            if tx.hash:
+                hashes[tx.hash] = arrow.get(tx.date).isoformat()
+
+        newest = max(arrow.get(tx.date) for tx in transactions)
+        if watermark is not None and watermark.date > newest:
+            newest = watermark.date
+        since = newest.shift(seconds=-self.lookback)
+        hashes = {tx_hash: date for tx_hash, date in hashes.items() if arrow.get(date) >= since}
+
+        value = json.dumps({"date": newest.isoformat(), "hashes": hashes}, sort_keys=True)
+        try:
+            get_redis().set(self._key(scheme_account_id), value, ex=self.ttl)
+        except redis_exceptions.RedisError as e:
+            log.warning(f"Failed to set the transaction watermark for scheme account {scheme_account_id}: {repr(e)}")
+
+    @staticmethod
+    def _key(scheme_account_id: int) -> str:
+        return f"transaction-watermark-{scheme_account_id}"
+
+
+transaction_watermarks = TransactionWatermarkStore()
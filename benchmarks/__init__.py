@@ -0,0 +1,3 @@
+"""
+End-to-end benchmarks of the performance-mock journeys, see benchmarks.run
+"""
@@ -0,0 +1,60 @@
+"""
+gunicorn configuration for benchmark runs, see benchmarks.run
+
+Each worker replaces Vault and Redis with in-process stand-ins once the app is loaded, times the stages of the
+benchmarked journeys and dumps the timings to BENCHMARK_STATS_DIR when it exits.
+"""
+import os
+import typing as t
+from pathlib import Path
+
+from benchmarks.stages import StageTimer
+from app.tests.unit.fixtures.in_memory_redis import InMemoryRedis
+from benchmarks.standins import BENCHMARK_AES_KEY
+
+bind = os.environ.get("BENCHMARK_BIND", "127.0.0.1:9000")
+workers = int(os.environ.get("BENCHMARK_WORKERS", "2"))
+threads = int(os.environ.get("BENCHMARK_THREADS", "2"))
+graceful_timeout = 10
+loglevel = "warning"
+
+stage_timer = StageTimer()
+
+
+def post_worker_init(worker: t.Any) -> None:
+    from blinker import signal
+
+    from app import encryption, publish, redis_retry, resources
+    from app.agents.performance_mock import MockPerformance, MockPerformanceVoucher
+    from app.journeys import common, view
+    from app.messaging import queue
+
+    def get_aes_keys(secret_name: str) -> list[bytes]:
+        return [BENCHMARK_AES_KEY]
+
+    encryption.get_aes_keys = get_aes_keys
+    redis_retry.redis = InMemoryRedis()
+
+    stage_timer.wrap("decrypt_credentials", [resources], "decrypt_credentials")
+    stage_timer.wrap("agent_login", [common, resources, view], "agent_login")
+    stage_timer.wrap("agent.balance", [MockPerformance, MockPerformanceVoucher], "balance")
+    stage_timer.wrap("agent.transactions", [MockPerformance, MockPerformanceVoucher], "transactions")
+    for name in ("balance", "transactions", "status"):
+        stage_timer.wrap(f"publish.{name}", [publish], name)
+    stage_timer.wrap("enqueue_request", [queue], "enqueue_request")
+
+    def record_publish_request(sender: t.Any, destination: str, latency: float, response_code: int) -> None:
+        stage_timer.record(f"{destination}.http", latency)
+
+    # blinker holds weak references by default, the hook has to outlive this function
+    signal("record-publish-request").connect(record_publish_request, weak=False)
+
+
+def worker_exit(server: t.Any, worker: t.Any) -> None:
+    from app.shutdown import shutdown_background_senders
+
+    # publishes still held by the batchers count towards the stage timings
+    shutdown_background_senders()
+    stats_dir = os.environ.get("BENCHMARK_STATS_DIR")
+    if stats_dir:
+        stage_timer.dump(Path(stats_dir) / f"{worker.pid}.json")
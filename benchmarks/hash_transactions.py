@@ -0,0 +1,121 @@
+"""
+Micro-benchmarks BaseAgent.hash_transactions against the implementation it replaced.
+
+Both are run over the same generated transactions, which include duplicates and transactions with and without a
+location, and the benchmark fails if they don't produce the same hashes, as Hades deduplicates transactions by them.
+
+    python -m benchmarks.hash_transactions --transactions 100 --repeat 200
+"""
+import argparse
+import hashlib
+import time
+import typing as t
+from collections import defaultdict
+from decimal import Decimal
+from unittest import mock
+
+import arrow
+
+from app.agents.base import BaseAgent
+from app.agents.schemas import Transaction
+from benchmarks.stages import summarise
+
+SCHEME_ID = 194
+
+
+def make_transactions(count: int) -> list[Transaction]:
+    start = arrow.get("2022-01-01T09:00:00+00:00")
+    transactions = []
+    for i in range(count):
+        if i % 10 == 9:
+            # the same purchase twice, which hash_transactions indexes to keep the hashes unique
+            transactions.append(transactions[-1])
+            continue
+        transactions.append(
+            Transaction(
+                date=start.shift(hours=i),
+                description=f"Store {i % 7} £{i % 50}.00",
+                points=Decimal(i % 50),
+                location=f"Store {i % 7}" if i % 3 else None,
+                value=Decimal(i % 50) if i % 2 else None,
+            )
+        )
+    return transactions
+
+
+def legacy_hash_transactions(scheme_id: int, transactions: list[Transaction]) -> list[Transaction]:
+    """BaseAgent.hash_transactions as it was before it stopped building a dict per transaction."""
+    count: defaultdict[str, int] = defaultdict(int)
+
+    hashed_transactions: list[Transaction] = []
+
+    for transaction in transactions:
+        s = "{0}{1}{2}{3}{4}".format(
+            transaction.date,
+            transaction.description,
+            transaction.points,
+            scheme_id,
+            transaction.location if transaction.location is not None else "",
+        )
+
+        index = count[s]
+        count[s] += 1
+        s = "{0}{1}".format(s, index)
+
+        data = transaction._asdict()
+        data["hash"] = hashlib.md5(s.encode("utf-8")).hexdigest()
+        hashed_transactions.append(Transaction(**data))
+
+    return hashed_transactions
+
+
+def make_agent() -> BaseAgent:
+    # hash_transactions only needs the scheme account id, so skip loading a configuration
+    agent = mock.MagicMock(spec=BaseAgent)
+    agent.scheme_id = SCHEME_ID
+    return agent
+
+
+def time_calls(fn: t.Callable[[], t.Any], repeat: int) -> list[float]:
+    durations = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started_at)
+    return durations
+
+
+def run_benchmark(transaction_count: int, repeat: int) -> dict:
+    transactions = make_transactions(transaction_count)
+    agent = make_agent()
+
+    current = BaseAgent.hash_transactions(agent, transactions)
+    legacy = legacy_hash_transactions(SCHEME_ID, transactions)
+    if current != legacy:
+        raise AssertionError("hash_transactions produced different hashes to the legacy implementation")
+
+    return {
+        "current": summarise(time_calls(lambda: BaseAgent.hash_transactions(agent, transactions), repeat)),
+        "legacy": summarise(time_calls(lambda: legacy_hash_transactions(SCHEME_ID, transactions), repeat)),
+    }
+
+
+def parse_args(argv: t.Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=100, help="transactions hashed per call")
+    parser.add_argument("--repeat", type=int, default=200, help="calls timed for each implementation")
+    return parser.parse_args(argv)
+
+
+def main(argv: t.Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    result = run_benchmark(args.transactions, args.repeat)
+    for name, summary in result.items():
+        print(f"{name:8} " + " ".join(f"{key}={value}" for key, value in summary.items()))
+    speedup = result["legacy"]["p50"] / result["current"]["p50"] if result["current"]["p50"] else 0.0
+    print(f"p50 speedup: {speedup:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
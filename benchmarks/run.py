@@ -0,0 +1,234 @@
+"""
+Benchmarks the performance-mock balance, transactions and join journeys end to end.
+
+Midas runs under gunicorn (see benchmarks.gunicorn_conf) against local stand-ins for Hermes, Hades, Atlas, Vault
+and Redis (see benchmarks.standins), and is driven at a fixed concurrency. Throughput, p50/p95/p99 latency and
+per-stage timings are reported for each journey. Results can be saved as a baseline and later runs compared
+against it, exiting with 1 if throughput drops or p95/p99 latency rises by more than --max-regression.
+Baselines depend on the machine they were measured on, so compare against one saved on the same machine.
+
+    python -m benchmarks.run --journey balance --concurrency 20 --requests 2000 --save-baseline
+    python -m benchmarks.run --journey balance --concurrency 20 --requests 2000 --compare
+"""
+import argparse
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from benchmarks.stages import load_stage_durations, summarise
+from benchmarks.standins import LoopbackService, encrypt_credentials
+
+BENCHMARKS_DIR = Path(__file__).parent
+JOURNEYS = ("balance", "transactions", "join")
+
+
+def make_request_factory(journey: str, scheme_slug: str, base_url: str) -> t.Callable[[requests.Session, int], int]:
+    """Returns a function sending the journey's request for a scheme account id and returning the status code."""
+    credentials = encrypt_credentials({"card_number": "1234567890", "password": "benchmark"})
+
+    if journey == "join":
+
+        def join(session: requests.Session, scheme_account_id: int) -> int:
+            payload = {
+                "scheme_account_id": scheme_account_id,
+                "user_id": 1,
+                "channel": "com.bink.wallet",
+                "credentials": credentials,
+            }
+            return session.post(f"{base_url}/{scheme_slug}/join", json=payload, timeout=30).status_code
+
+        return join
+
+    def get(session: requests.Session, scheme_account_id: int) -> int:
+        params = {
+            "credentials": credentials,
+            "scheme_account_id": scheme_account_id,
+            "user_set": "1",
+            "status": 1,
+            "bink_user_id": 1,
+            "journey_type": 3,  # JourneyTypes.UPDATE, a balance refresh
+        }
+        return session.get(f"{base_url}/{scheme_slug}/{journey}", params=params, timeout=30).status_code
+
+    return get
+
+
+def drive(
+    send: t.Callable[[requests.Session, int], int], total: int, concurrency: int
+) -> tuple[list[float], int, float]:
+    """Sends `total` requests from `concurrency` threads, returning the latencies, error count and wall time."""
+    local = threading.local()
+    scheme_account_ids = itertools.count(1)
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send_one(_: int) -> None:
+        nonlocal errors
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started_at = time.perf_counter()
+        try:
+            ok = send(local.session, next(scheme_account_ids)) == 200
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - started_at
+        with lock:
+            latencies.append(latency)
+            errors += not ok
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send_one, range(total)))
+    return latencies, errors, time.perf_counter() - started_at
+
+
+def wait_until_healthy(base_url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Midas did not become healthy within {timeout} seconds")
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    services = {
+        name: LoopbackService(name, latency=args.standin_latency / 1000) for name in ("hermes", "hades", "atlas")
+    }
+    for service in services.values():
+        service.start()
+
+    with tempfile.TemporaryDirectory(prefix="midas-benchmark-") as stats_dir:
+        env = {
+            **os.environ,
+            "HERMES_URL": services["hermes"].url,
+            "HADES_URL": services["hades"].url,
+            "ATLAS_URL": services["atlas"].url,
+            # nothing on the benchmarked journeys should reach Postgres or Redis, so any that does fails loudly
+            "POSTGRES_DSN": "postgresql+psycopg2://benchmark@127.0.0.1:1/{}",
+            "REDIS_URL": "redis://127.0.0.1:1/0",
+            "AMQP_DSN": "memory://",
+            "PUSH_PROMETHEUS_METRICS": "false",
+            "SENTRY_DSN": "",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "error"),
+            "BENCHMARK_BIND": args.bind,
+            "BENCHMARK_WORKERS": str(args.workers),
+            "BENCHMARK_THREADS": str(args.threads),
+            "BENCHMARK_STATS_DIR": stats_dir,
+        }
+        # the runner loads settings too, to encrypt credentials
+        os.environ.update(env)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", str(BENCHMARKS_DIR / "gunicorn_conf.py"), "wsgi:app"],
+            cwd=BENCHMARKS_DIR.parent,
+        )
+        base_url = f"http://{args.bind}"
+        try:
+            wait_until_healthy(base_url, process)
+            send = make_request_factory(args.journey, args.scheme_slug, base_url)
+            drive(send, args.warmup, args.concurrency)
+            latencies, errors, duration = drive(send, args.requests, args.concurrency)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+            for service in services.values():
+                service.stop()
+
+        durations = load_stage_durations(Path(stats_dir))
+
+    return {
+        "journey": args.journey,
+        "scheme_slug": args.scheme_slug,
+        "workers": args.workers,
+        "threads": args.threads,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "throughput": round(len(latencies) / duration, 2),
+        "latency": summarise(latencies),
+        "stages": {stage: summarise(values) for stage, values in sorted(durations.items())},
+        "standin_requests": {name: service.request_count for name, service in services.items()},
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Returns a description of each way the result is worse than the baseline by more than `max_regression`."""
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1 - max_regression):
+        regressions.append(f"throughput {result['throughput']}/s, baseline {baseline['throughput']}/s")
+    for pct in ("p95", "p99"):
+        if result["latency"][pct] > baseline["latency"][pct] * (1 + max_regression):
+            regressions.append(f"{pct} latency {result['latency'][pct]}ms, baseline {baseline['latency'][pct]}ms")
+    if result["errors"] > baseline["errors"]:
+        regressions.append(f"{result['errors']} errors, baseline {baseline['errors']}")
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    latency = result["latency"]
+    print(
+        f"{result['journey']}: {result['requests']} requests at concurrency {result['concurrency']}, "
+        f"{result['errors']} errors, {result['throughput']} requests/s"
+    )
+    print(f"  latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    for stage, summary in result["stages"].items():
+        print(f"  {stage:<24} x{summary['count']:<6} p50 {summary['p50']}ms  p95 {summary['p95']}ms")
+    print(f"  stand-in requests: {result['standin_requests']}")
+
+
+def parse_args(argv: t.Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--journey", choices=JOURNEYS, default="balance")
+    parser.add_argument("--scheme-slug", default="performance-mock")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent before measuring")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=2, help="gunicorn threads per worker")
+    parser.add_argument("--bind", default="127.0.0.1:9000")
+    parser.add_argument("--standin-latency", type=float, default=0, help="milliseconds stand-ins take to respond")
+    parser.add_argument("--baseline-dir", type=Path, default=BENCHMARKS_DIR / "baselines")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="compare against the saved baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="e.g. 0.2 allows 20%% worse than baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv: t.Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    result = run_benchmark(args)
+    print_report(result)
+
+    baseline_path = args.baseline_dir / f"{args.scheme_slug}-{args.journey}-c{args.concurrency}.json"
+    if args.compare:
+        regressions = compare(result, json.loads(baseline_path.read_text()), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    if args.save_baseline:
+        args.baseline_dir.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Saved baseline to {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Per-stage timings recorded inside the gunicorn workers under benchmark
+"""
+import json
+import math
+import threading
+import time
+import typing as t
+from functools import wraps
+from pathlib import Path
+
+
+def percentile(values: t.Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of the given values, 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarise(values: t.Sequence[float]) -> dict:
+    """Count, mean and p50/p95/p99/max of durations in seconds, reported in milliseconds."""
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50": round(percentile(values, 50) * 1000, 3),
+        "p95": round(percentile(values, 95) * 1000, 3),
+        "p99": round(percentile(values, 99) * 1000, 3),
+        "max": round(max(values, default=0.0) * 1000, 3),
+    }
+
+
+class StageTimer:
+    """
+    Collects durations per named stage from any thread. Functions are timed by replacing them on the objects that
+    reference them, see `wrap`, and other timings (e.g. from blinker signals) can be added with `record`.
+    """
+
+    def __init__(self) -> None:
+        self.durations: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration: float) -> None:
+        with self._lock:
+            self.durations.setdefault(stage, []).append(duration)
+
+    def wrap(self, stage: str, owners: t.Sequence[object], name: str) -> None:
+        """Times every call of the attribute `name` of each of `owners` (modules or classes), replacing it."""
+        for owner in owners:
+            setattr(owner, name, self._timed(stage, getattr(owner, name)))
+
+    def _timed(self, stage: str, func: t.Callable) -> t.Callable:
+        @wraps(func)
+        def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started_at)
+
+        return timed
+
+    def dump(self, path: Path) -> None:
+        with self._lock:
+            path.write_text(json.dumps(self.durations))
+
+
+def load_stage_durations(stats_dir: Path) -> dict[str, list[float]]:
+    """Merges the durations dumped by every worker into `stats_dir`."""
+    durations: dict[str, list[float]] = {}
+    for path in sorted(stats_dir.glob("*.json")):
+        for stage, values in json.loads(path.read_text()).items():
+            durations.setdefault(stage, []).extend(values)
+    return durations
@@ -0,0 +1,82 @@
+"""
+Local stand-ins for the services Midas depends on, so benchmarks measure Midas rather than the network.
+
+Hermes, Hades and Atlas are loopback HTTP servers started by the benchmark runner. Vault and Redis are replaced
+inside each gunicorn worker, see benchmarks.gunicorn_conf. Europa isn't needed as the performance-mock agents never
+load a configuration, and nothing on the benchmarked journeys queries Postgres.
+"""
+import json
+import threading
+import time
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_AES_KEY = b"midas-benchmark-aes-key"
+
+
+def encrypt_credentials(credentials: dict) -> str:
+    # imported here as settings can only be loaded once the stand-in environment is set, see benchmarks.run
+    from app.encryption import AESCipher
+
+    return AESCipher(BENCHMARK_AES_KEY).encrypt(json.dumps(credentials)).decode()
+
+
+class LoopbackService:
+    """
+    Answers every request with a 200 and a JSON body after `latency` seconds, counting the requests it receives.
+    Hades' previous balance lookup gets a balance so async balance journeys can be benchmarked too.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0) -> None:
+        self.name = name
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: t.Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"standin-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self.request_count += 1
+
+    def _make_handler(self) -> t.Type[BaseHTTPRequestHandler]:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self) -> None:
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                service._count_request()
+                if service.latency:
+                    time.sleep(service.latency)
+
+                body = b"{}"
+                if self.path.startswith("/balances/scheme_account/"):
+                    body = json.dumps({"points": 1, "value": 1, "value_label": "", "balance": 1}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+            def log_message(self, format: str, *args: t.Any) -> None:
+                pass
+
+        return Handler
@@ -2,6 +2,7 @@ import kombu
 
 import settings
 from app.messaging.consumer import TaskConsumer
+from app.shutdown import shutdown_background_senders  # noqa: F401 registers the atexit shutdown
 
 
 def main():
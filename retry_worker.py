@@ -3,23 +3,47 @@ import logging
 import typer
 from rq import Worker
 
+import settings
+from app.concurrent_worker import ConcurrentWorker
 from app.db import redis_raw
 from app.error_handler import handle_retry_task_request_error
+from app.retry_scheduler import RetryScheduler
+from app.shutdown import shutdown_background_senders
 
 cli = typer.Typer()
 logger = logging.getLogger(__name__)
 
 
+class TaskWorker(Worker):
+    def perform_job(self, job, queue) -> bool:  # pragma: no cover
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            # the work horse exits without running atexit handlers, so finish publishing and send its audit logs
+            # and metrics before it does
+            shutdown_background_senders()
+
+
 @cli.command()
 def task_worker(burst: bool = False) -> None:  # pragma: no cover
-    worker = Worker(
+    worker_class = ConcurrentWorker if settings.RETRY_WORKER_CONCURRENCY > 1 else TaskWorker
+    worker = worker_class(
         queues=["midas-retry"],
         connection=redis_raw,
         log_job_description=True,
         exception_handlers=[handle_retry_task_request_error],
     )
+    scheduler = RetryScheduler(connection=redis_raw) if settings.RETRY_SCHEDULER_ENABLED else None
+    if scheduler:
+        scheduler.start()
     logger.info("Starting task worker...")
-    worker.work(burst=burst, with_scheduler=True)
+    try:
+        # the retry scheduler takes over jobs scheduled with enqueue_at before it was enabled, so rq's scheduler
+        # would only run them a second time
+        worker.work(burst=burst, with_scheduler=scheduler is None)
+    finally:
+        if scheduler:
+            scheduler.stop()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 import typing as t
@@ -71,10 +72,21 @@ REDIS_HOST = getenv("REDIS_HOST", default="localhost")
 REDIS_PORT = getenv("REDIS_PORT", default="6379")
 REDIS_DB = getenv("REDIS_DB", default="0")
 REDIS_URL = getenv("REDIS_URL", default=f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
+# Every Redis client in a process shares a pool of up to REDIS_MAX_CONNECTIONS connections. Connections that have
+# been idle for REDIS_HEALTH_CHECK_INTERVAL seconds are checked with a PING before they are reused.
+REDIS_MAX_CONNECTIONS = getenv("REDIS_MAX_CONNECTIONS", default="50", conv=int)
+REDIS_HEALTH_CHECK_INTERVAL = getenv("REDIS_HEALTH_CHECK_INTERVAL", default="30", conv=int)
+# Seconds a login retry count is kept for after the first failed login, see app.redis_retry.inc_count
+RETRY_COUNT_TTL = getenv("RETRY_COUNT_TTL", default="86400", conv=int)
 
 task_default_queue = "midas_consents"
 
 AMQP_DSN = getenv("AMQP_DSN", "amqp://localhost:5672")
+# Loyalty requests are published over a connection kept open by each process, and wait up to AMQP_PUBLISH_TIMEOUT
+# seconds for the broker to confirm them. Requests made at the same time are published together, up to
+# AMQP_PUBLISH_MAX_BATCH_SIZE at once.
+AMQP_PUBLISH_TIMEOUT = getenv("AMQP_PUBLISH_TIMEOUT", default="3", conv=float)
+AMQP_PUBLISH_MAX_BATCH_SIZE = getenv("AMQP_PUBLISH_MAX_BATCH_SIZE", default="50", conv=int)
 
 RETRY_PERIOD = getenv("RETRY_PERIOD", default="1800", conv=int)
 broker_url = AMQP_DSN
@@ -84,6 +96,28 @@ beat_schedule = {"retry_tasks": {"task": "app.tasks.resend.retry_tasks", "schedu
 imports = ["app.tasks.resend"]
 HADES_URL = getenv("HADES_URL", default="http://local.hades.chingrewards.com:8000")
 HERMES_URL = getenv("HERMES_URL", default="http://local.hermes.chingrewards.com:8000")
+# Balances, transactions and statuses are published to Hades and Hermes from separate thread pools.
+# Each destination has at most PUBLISH_MAX_IN_FLIGHT queued or running requests. When that is reached callers wait
+# up to PUBLISH_ENQUEUE_TIMEOUT seconds before the publish is dropped. Requests time out after PUBLISH_TIMEOUT seconds.
+HADES_PUBLISH_MAX_WORKERS = getenv("HADES_PUBLISH_MAX_WORKERS", default="3", conv=int)
+HERMES_PUBLISH_MAX_WORKERS = getenv("HERMES_PUBLISH_MAX_WORKERS", default="3", conv=int)
+PUBLISH_MAX_IN_FLIGHT = getenv("PUBLISH_MAX_IN_FLIGHT", default="100", conv=int)
+PUBLISH_ENQUEUE_TIMEOUT = getenv("PUBLISH_ENQUEUE_TIMEOUT", default="5", conv=float)
+PUBLISH_TIMEOUT = getenv("PUBLISH_TIMEOUT", default="10", conv=float)
+# Balances and transactions are held for up to HADES_BATCH_MAX_LATENCY seconds and sent to Hades together,
+# or sooner once HADES_BATCH_MAX_SIZE items are waiting.
+HADES_BATCH_PUBLISH = getenv("HADES_BATCH_PUBLISH", default="true", conv=boolconv)
+HADES_BATCH_MAX_LATENCY = getenv("HADES_BATCH_MAX_LATENCY", default="1", conv=float)
+HADES_BATCH_MAX_SIZE = getenv("HADES_BATCH_MAX_SIZE", default="500", conv=int)
+# Bulk balance refreshes run at most BULK_BALANCE_MAX_WORKERS accounts at once, for up to BULK_BALANCE_MAX_ACCOUNTS
+# accounts per request.
+BULK_BALANCE_MAX_WORKERS = getenv("BULK_BALANCE_MAX_WORKERS", default="10", conv=int)
+BULK_BALANCE_MAX_ACCOUNTS = getenv("BULK_BALANCE_MAX_ACCOUNTS", default="500", conv=int)
+# Run bulk balance refreshes for agents that support it on the asyncio engine, with at most
+# ASYNC_BULK_BALANCE_MAX_CONCURRENCY accounts and ASYNC_HTTP_MAX_CONNECTIONS connections per merchant in flight.
+ASYNC_AGENT_ENGINE = getenv("ASYNC_AGENT_ENGINE", default="false", conv=boolconv)
+ASYNC_BULK_BALANCE_MAX_CONCURRENCY = getenv("ASYNC_BULK_BALANCE_MAX_CONCURRENCY", default="100", conv=int)
+ASYNC_HTTP_MAX_CONNECTIONS = getenv("ASYNC_HTTP_MAX_CONNECTIONS", default="100", conv=int)
 CONFIG_SERVICE_URL = getenv("CONFIG_SERVICE_URL", default="")
 ATLAS_URL = getenv("ATLAS_URL", default="http://localhost:8100")
 
@@ -135,6 +169,15 @@ else:
     )
 
 POSTGRES_CONNECT_ARGS = {"application_name": "midas"}
+# Each process keeps a pool of up to POSTGRES_POOL_SIZE connections, opening up to POSTGRES_MAX_OVERFLOW more under
+# load, and a session waits up to POSTGRES_POOL_TIMEOUT seconds for one. Size these per process type, e.g. a web worker
+# needs at most one connection per gunicorn thread. Set POSTGRES_POOL to "null" to open a connection for every session
+# instead, for running behind an external pooler such as PgBouncer.
+POSTGRES_POOL = getenv("POSTGRES_POOL", default="queue")
+POSTGRES_POOL_SIZE = getenv("POSTGRES_POOL_SIZE", default="5", conv=int)
+POSTGRES_MAX_OVERFLOW = getenv("POSTGRES_MAX_OVERFLOW", default="5", conv=int)
+POSTGRES_POOL_TIMEOUT = getenv("POSTGRES_POOL_TIMEOUT", default="10", conv=int)
+POSTGRES_POOL_RECYCLE = getenv("POSTGRES_POOL_RECYCLE", default="1800", conv=int)
 
 QUERY_TRACE_LEVEL = getenv("QUERY_TRACE_LEVEL", default="0", conv=int)
 
@@ -150,6 +193,64 @@ VAULT_URL = getenv("VAULT_URL", default="http://localhost:8200")
 # Vault settings for merchant api security credential storage
 VAULT_TOKEN = getenv("VAULT_TOKEN", default="myroot")
 
+# Credential decryption keys are reloaded from Key Vault every AES_KEY_TTL seconds, in the background once they are
+# within AES_KEY_REFRESH_AHEAD seconds of expiry, so a rotated key is picked up without restarting.
+AES_KEY_TTL = getenv("AES_KEY_TTL", default="3600", conv=int)
+AES_KEY_REFRESH_AHEAD = getenv("AES_KEY_REFRESH_AHEAD", default="300", conv=int)
+
+# Europa/Vault configurations are cached per process for CONFIG_CACHE_TTL seconds (0 disables the cache) and
+# refreshed in the background once they are within CONFIG_CACHE_REFRESH_AHEAD seconds of expiry.
+CONFIG_CACHE_TTL = getenv("CONFIG_CACHE_TTL", default="600", conv=int)
+CONFIG_CACHE_REFRESH_AHEAD = getenv("CONFIG_CACHE_REFRESH_AHEAD", default="60", conv=int)
+
+# Outbound HTTP connection pooling. Agents share one pool manager per scheme slug, holding up to
+# HTTP_POOL_CONNECTIONS host pools of HTTP_POOL_MAXSIZE connections each.
+HTTP_POOL_CONNECTIONS = getenv("HTTP_POOL_CONNECTIONS", default="10", conv=int)
+HTTP_POOL_MAXSIZE = getenv("HTTP_POOL_MAXSIZE", default="10", conv=int)
+# Seconds a pooled connection is idle before TCP keep-alive probes are sent.
+HTTP_KEEP_ALIVE_IDLE = getenv("HTTP_KEEP_ALIVE_IDLE", default="60", conv=int)
+# Per scheme slug overrides of the retry policy, as JSON
+# e.g. {"the-works": {"retries": 1, "backoff_factor": 0.5, "status_forcelist": [502, 504]}}
+HTTP_RETRY_POLICIES = getenv("HTTP_RETRY_POLICIES", default="{}", conv=json.loads)
+# Agent requests to a merchant fail fast with NotSentError once CIRCUIT_BREAKER_FAILURE_THRESHOLD requests in a row
+# have failed or taken longer than CIRCUIT_BREAKER_SLOW_CALL_SECONDS. After CIRCUIT_BREAKER_RESET_TIMEOUT seconds a
+# single probe request decides whether the circuit closes again. Requests in flight per merchant are limited to between
+# CIRCUIT_BREAKER_MIN_CONCURRENCY and CIRCUIT_BREAKER_MAX_CONCURRENCY, lowered on failures and raised on successes.
+# With CIRCUIT_BREAKER_SHARED an open circuit is shared with other processes through Redis.
+CIRCUIT_BREAKER_ENABLED = getenv("CIRCUIT_BREAKER_ENABLED", default="true", conv=boolconv)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", default="5", conv=int)
+CIRCUIT_BREAKER_RESET_TIMEOUT = getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", default="30", conv=float)
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = getenv("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", default="10", conv=float)
+CIRCUIT_BREAKER_MIN_CONCURRENCY = getenv("CIRCUIT_BREAKER_MIN_CONCURRENCY", default="2", conv=int)
+CIRCUIT_BREAKER_MAX_CONCURRENCY = getenv("CIRCUIT_BREAKER_MAX_CONCURRENCY", default="50", conv=int)
+CIRCUIT_BREAKER_SHARED = getenv("CIRCUIT_BREAKER_SHARED", default="false", conv=boolconv)
+# Merchant OAuth tokens are shared by every process through Redis and cached in each process. They are refreshed in
+# the background once they are within OAUTH_TOKEN_REFRESH_AHEAD seconds of the agent's oauth_token_timeout. Only one
+# process fetches a merchant's token at a time, holding a Redis lock for at most OAUTH_TOKEN_LOCK_TIMEOUT seconds.
+OAUTH_TOKEN_REFRESH_AHEAD = getenv("OAUTH_TOKEN_REFRESH_AHEAD", default="300", conv=int)
+OAUTH_TOKEN_LOCK_TIMEOUT = getenv("OAUTH_TOKEN_LOCK_TIMEOUT", default="10", conv=float)
+# Balance refreshes only publish transactions that haven't been published for the scheme account, recorded in Redis
+# for TRANSACTION_WATERMARK_TTL seconds after the account's last refresh. Transactions dated more than
+# TRANSACTION_WATERMARK_LOOKBACK seconds before the newest one published are taken to have been published already.
+TRANSACTION_WATERMARKS_ENABLED = getenv("TRANSACTION_WATERMARKS_ENABLED", default="true", conv=boolconv)
+TRANSACTION_WATERMARK_TTL = getenv("TRANSACTION_WATERMARK_TTL", default=str(60 * 60 * 24 * 30), conv=int)
+TRANSACTION_WATERMARK_LOOKBACK = getenv("TRANSACTION_WATERMARK_LOOKBACK", default=str(60 * 60 * 24 * 14), conv=int)
+
+# With a BALANCE_CHANGE_DETECTION of "heartbeat" a refresh that finds the same balance as the last one published for
+# the scheme account doesn't publish it to Hades, but still publishes the account's status to Hermes. With "skip"
+# neither is published, and with "off" every balance is published. An unchanged balance is published again once
+# every BALANCE_REPUBLISH_INTERVAL seconds.
+BALANCE_CHANGE_DETECTION = getenv("BALANCE_CHANGE_DETECTION", default="heartbeat")
+BALANCE_REPUBLISH_INTERVAL = getenv("BALANCE_REPUBLISH_INTERVAL", default=str(60 * 60 * 24 * 7), conv=int)
+
+# Tokens for the OAuth security agent are cached per token url and client until SECURITY_TOKEN_REFRESH_MARGIN seconds
+# before they expire. With a SECURITY_TOKEN_BACKEND of "redis" rather than "memory" they are shared with other
+# processes, and only one process fetches a token at a time, holding a Redis lock for at most
+# SECURITY_TOKEN_LOCK_TIMEOUT seconds. Shared tokens are stored in Redis unencrypted.
+SECURITY_TOKEN_BACKEND = getenv("SECURITY_TOKEN_BACKEND", default="memory")
+SECURITY_TOKEN_REFRESH_MARGIN = getenv("SECURITY_TOKEN_REFRESH_MARGIN", default="60", conv=int)
+SECURITY_TOKEN_LOCK_TIMEOUT = getenv("SECURITY_TOKEN_LOCK_TIMEOUT", default="10", conv=float)
+
 
 BACK_OFF_COOLDOWN = 120
 
@@ -162,14 +263,32 @@ ENABLE_ICELAND_VALIDATE = getenv("ENABLE_ICELAND_VALIDATE", default="false", con
 PUSH_PROMETHEUS_METRICS = getenv("PUSH_PROMETHEUS_METRICS", default="true", conv=boolconv)
 PROMETHEUS_PUSH_GATEWAY = "http://localhost:9100"
 PROMETHEUS_JOB = "midas"
+# Seconds between pushes of the metrics registry to the push gateway.
+PROMETHEUS_PUSH_INTERVAL = getenv("PROMETHEUS_PUSH_INTERVAL", default="15", conv=float)
 
 # olympus-messaging interface
 LOYALTY_REQUEST_QUEUE = getenv("LOYALTY_REQUEST_QUEUE", default="loyalty-request")
 LOYALTY_RESPONSE_QUEUE = getenv("LOYALTY_RESPONSE_QUEUE", default="loyalty-response")
+# The consumer takes up to CONSUMER_PREFETCH_COUNT unacknowledged messages at a time, and runs their handlers on
+# CONSUMER_MAX_WORKERS threads, with loyalty card removals on a separate pool of CONSUMER_REMOVAL_MAX_WORKERS threads.
+# Finished messages are acked within CONSUMER_DRAIN_TIMEOUT seconds.
+CONSUMER_PREFETCH_COUNT = getenv("CONSUMER_PREFETCH_COUNT", default="20", conv=int)
+CONSUMER_MAX_WORKERS = getenv("CONSUMER_MAX_WORKERS", default="10", conv=int)
+CONSUMER_REMOVAL_MAX_WORKERS = getenv("CONSUMER_REMOVAL_MAX_WORKERS", default="5", conv=int)
+CONSUMER_DRAIN_TIMEOUT = getenv("CONSUMER_DRAIN_TIMEOUT", default="0.05", conv=float)
 
 # Enable/disable all exports to Atlas
 AUDIT_EXPORTS = getenv("AUDIT_EXPORTS", default="true", conv=boolconv)
 
+# Send audit logs to Atlas in batches from a background thread rather than one request per log.
+AUDIT_EXPORT_ASYNC = getenv("AUDIT_EXPORT_ASYNC", default="true", conv=boolconv)
+# Maximum number of audit logs buffered for export; when full, logs are dropped after AUDIT_EXPORT_ENQUEUE_TIMEOUT.
+AUDIT_EXPORT_QUEUE_SIZE = getenv("AUDIT_EXPORT_QUEUE_SIZE", default="10000", conv=int)
+AUDIT_EXPORT_ENQUEUE_TIMEOUT = getenv("AUDIT_EXPORT_ENQUEUE_TIMEOUT", default="0.05", conv=float)
+# A batch is sent once it holds AUDIT_EXPORT_BATCH_SIZE logs or AUDIT_EXPORT_FLUSH_INTERVAL seconds have passed.
+AUDIT_EXPORT_BATCH_SIZE = getenv("AUDIT_EXPORT_BATCH_SIZE", default="100", conv=int)
+AUDIT_EXPORT_FLUSH_INTERVAL = getenv("AUDIT_EXPORT_FLUSH_INTERVAL", default="1", conv=float)
+
 # Whether to include Midas' default sensitive keys in the audit sanitisation process.
 AUDIT_USE_DEFAULT_SENSITIVE_KEYS = getenv("AUDIT_USE_DEFAULT_SENSITIVE_KEYS", default="true", conv=boolconv)
 
@@ -192,6 +311,17 @@ if AUDIT_ADDITIONAL_SENSITIVE_KEYS:
 MAX_RETRY_COUNT = getenv("MAX_RETRY_COUNT", default="3", conv=int)
 MAX_CALLBACK_RETRY_COUNT = getenv("MAX_CALLBACK_RETRY_COUNT", default="3", conv=int)
 RETRY_BACKOFF_BASE = getenv("RETRY_BACKOFF_BASE", default="3", conv=int)
+# With RETRY_SCHEDULER_ENABLED, retries are scheduled by their retry task's next_attempt_time rather than with rq.
+# Every retry worker polls for due tasks every RETRY_SCHEDULER_INTERVAL seconds and claims up to
+# RETRY_SCHEDULER_BATCH_SIZE of them at a time, see app.retry_scheduler. Retries already scheduled with rq are
+# cancelled in rq and run from their task instead, and the workers stop running rq's scheduler.
+RETRY_SCHEDULER_ENABLED = getenv("RETRY_SCHEDULER_ENABLED", default="false", conv=boolconv)
+RETRY_SCHEDULER_INTERVAL = getenv("RETRY_SCHEDULER_INTERVAL", default="5", conv=float)
+RETRY_SCHEDULER_BATCH_SIZE = getenv("RETRY_SCHEDULER_BATCH_SIZE", default="100", conv=int)
+# With RETRY_WORKER_CONCURRENCY above 1, a retry worker runs that many jobs at once on threads instead of forking a
+# process per job, and at most RETRY_WORKER_SLUG_CONCURRENCY of them for one merchant (0 for no limit).
+RETRY_WORKER_CONCURRENCY = getenv("RETRY_WORKER_CONCURRENCY", default="1", conv=int)
+RETRY_WORKER_SLUG_CONCURRENCY = getenv("RETRY_WORKER_SLUG_CONCURRENCY", default="5", conv=int)
 DEFAULT_FAILURE_TTL = getenv("DEFAULT_FAILURE_TTL", default=str((60 * 60 * 24 * 7)), conv=int)
 AZURE_AAD_TENANT_ID = getenv("AZURE_AAD_TENANT_ID")
 